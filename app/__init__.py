@@ -1,5 +1,9 @@
 import os
-from flask import Flask
+import time
+from datetime import datetime
+
+import click
+from flask import Flask, g, request
 
 
 def create_app():
@@ -10,15 +14,64 @@ def create_app():
     from app.routes.batch import bp as batch_bp
     from app.routes.adhoc import bp as adhoc_bp
     from app.routes.admin import bp as admin_bp
+    from app.routes.jobs import bp as jobs_bp
 
     app.register_blueprint(main_bp)
     app.register_blueprint(batch_bp, url_prefix="/batch")
     app.register_blueprint(adhoc_bp, url_prefix="/adhoc")
     app.register_blueprint(admin_bp, url_prefix="/admin")
+    app.register_blueprint(jobs_bp, url_prefix="/jobs")
 
     @app.context_processor
     def inject_printers():
+        from app.services import health
         from app.services.printer import get_printers
-        return dict(printers=get_printers())
+        return dict(printers=get_printers(), printer_status=health.all_statuses())
+
+    @app.before_request
+    def start_timer():
+        g.request_started = time.perf_counter()
+
+    @app.after_request
+    def record_request(response):
+        from app.services import metrics
+        endpoint = request.endpoint or "unknown"
+        if "request_started" in g:
+            metrics.observe(
+                "labelprinter_http_request_seconds",
+                time.perf_counter() - g.request_started,
+                endpoint=endpoint,
+            )
+        if response.status_code >= 500:
+            metrics.inc("labelprinter_http_errors_total", endpoint=endpoint)
+        return response
+
+    from app.services import assets, compression, profiler
+    profiler.init_app(app)
+    assets.init_app(app)
+    compression.init_app(app)
+
+    @app.template_filter("timestamp")
+    def format_timestamp(value):
+        if not value:
+            return ""
+        return datetime.fromtimestamp(value).strftime("%m/%d %H:%M:%S")
+
+    @app.cli.command("warm-cache")
+    @click.option("--ttl", type=int, default=None, help="Seconds to keep the results.")
+    def warm_cache(ttl):
+        """Prefetch tomorrow's routes into the query cache."""
+        from app.services import warmup
+        report = warmup.warm(**({"ttl": ttl} if ttl else {}))
+        for key, value in report.items():
+            click.echo(f"{key}: {value}")
+
+    # Background threads belong to the web server, not to other flask commands
+    ctx = click.get_current_context(silent=True)
+    if os.environ.get("FLASK_RUN_FROM_CLI") != "true" or (ctx and ctx.info_name == "run"):
+        from app.services import replica, search_index, spooler
+        spooler.start()
+        search_index.start()
+        replica.start()
 
     return app
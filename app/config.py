@@ -4,7 +4,7 @@ from dotenv import load_dotenv
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 load_dotenv(os.path.join(BASE_DIR, ".env"))
 
-PRINTERS_FILE = os.path.join(BASE_DIR, "printers.json")
+PRINTERS_FILE = os.environ.get("PRINTERS_FILE", os.path.join(BASE_DIR, "printers.json"))
 
 # DB2 for iSeries connection via individual .env variables
 DB2_CONNECTION_STRING = (
@@ -15,5 +15,87 @@ DB2_CONNECTION_STRING = (
 )
 
 # Zebra printer TCP port
-PRINTER_PORT = 9100
+PRINTER_PORT = int(os.environ.get("PRINTER_PORT", "9100"))
 PRINTER_TIMEOUT = 5  # seconds
+PRINTER_IDLE_TIMEOUT = float(os.environ.get("PRINTER_IDLE_TIMEOUT", "15"))  # seconds before an idle socket is closed
+PRINTER_SEND_BUFFER = int(os.environ.get("PRINTER_SEND_BUFFER", "16384"))  # bytes per streamed write
+
+# Printer status monitor (~HS). The default interval is longer than
+# PRINTER_IDLE_TIMEOUT so polling does not hold printer sockets open.
+PRINTER_STATUS_FILE = os.environ.get("PRINTER_STATUS_FILE", os.path.join(BASE_DIR, "printer_status.db"))
+PRINTER_STATUS_INTERVAL = float(os.environ.get("PRINTER_STATUS_INTERVAL", "20"))  # seconds
+PRINTER_STATUS_MAX_AGE = float(os.environ.get("PRINTER_STATUS_MAX_AGE", "90"))  # seconds before a status is ignored
+
+# DB2 connection pool (one pool per gunicorn worker)
+DB2_POOL_MIN = int(os.environ.get("DB2_POOL_MIN", "1"))
+DB2_POOL_MAX = int(os.environ.get("DB2_POOL_MAX", "4"))
+DB2_POOL_IDLE_TIMEOUT = int(os.environ.get("DB2_POOL_IDLE_TIMEOUT", "300"))  # seconds
+DB2_POOL_WAIT_TIMEOUT = float(os.environ.get("DB2_POOL_WAIT_TIMEOUT", "2"))  # seconds
+DB2_THREADS = int(os.environ.get("DB2_THREADS", str(DB2_POOL_MAX)))  # concurrent DB2 calls per worker
+DB2_FETCH_SIZE = int(os.environ.get("DB2_FETCH_SIZE", "500"))  # rows per fetchmany() batch
+
+# Shared query cache (SQLite file shared by all gunicorn workers)
+CACHE_FILE = os.environ.get("CACHE_FILE", os.path.join(BASE_DIR, "cache.db"))
+CACHE_MAX_BYTES = int(os.environ.get("CACHE_MAX_BYTES", str(32 * 1024 * 1024)))
+CACHE_ROUTES_TTL = int(os.environ.get("CACHE_ROUTES_TTL", "120"))  # seconds
+CACHE_CUSTOMERS_TTL = int(os.environ.get("CACHE_CUSTOMERS_TTL", "60"))  # seconds
+CACHE_SUGGEST_TTL = int(os.environ.get("CACHE_SUGGEST_TTL", "60"))  # seconds typeahead results are kept per prefix
+# Seconds pre-warmed results are kept. Only safe while the replica syncs:
+# with REPLICA_SYNC_INTERVAL=0 warm-up caps it at the TTLs above.
+CACHE_WARM_TTL = int(os.environ.get("CACHE_WARM_TTL", str(4 * 3600)))
+
+# Prometheus metrics store shared by the gunicorn workers
+METRICS_FILE = os.environ.get("METRICS_FILE", os.path.join(BASE_DIR, "metrics.db"))
+METRICS_FLUSH_INTERVAL = float(os.environ.get("METRICS_FLUSH_INTERVAL", "5"))  # seconds
+
+# Opt-in request profiling (also switchable from the admin Profiles page)
+PROFILE_FILE = os.environ.get("PROFILE_FILE", os.path.join(BASE_DIR, "profiles.db"))
+PROFILE_REQUESTS = os.environ.get("PROFILE_REQUESTS", "0") == "1"
+PROFILE_SAMPLE = float(os.environ.get("PROFILE_SAMPLE", "1"))  # fraction of requests profiled
+PROFILE_THRESHOLD = float(os.environ.get("PROFILE_THRESHOLD", "1"))  # seconds before a request is saved
+PROFILE_KEEP = int(os.environ.get("PROFILE_KEEP", "50"))  # slowest profiles kept
+
+# HTTP caching and compression
+STATIC_MAX_AGE = int(os.environ.get("STATIC_MAX_AGE", str(365 * 24 * 3600)))  # seconds for fingerprinted static files
+COMPRESS_MIN_BYTES = int(os.environ.get("COMPRESS_MIN_BYTES", "500"))  # smaller responses are sent as is
+COMPRESS_LEVEL = int(os.environ.get("COMPRESS_LEVEL", "6"))  # gzip level (brotli quality 5) for pages and JSON
+
+# Stored label formats (^DF) kept on each printer and recalled with ^XF.
+# R: is printer RAM (lost on reboot), E: is flash.
+LABEL_FORMAT_STORE = os.environ.get("LABEL_FORMAT_STORE", "1") == "1"
+LABEL_FORMAT_DEVICE = os.environ.get("LABEL_FORMAT_DEVICE", "R")
+LABEL_FORMAT_CHECK_INTERVAL = int(os.environ.get("LABEL_FORMAT_CHECK_INTERVAL", "300"))  # seconds between ^HW checks on one connection
+
+# Print spooler (durable job queue; one gunicorn worker dispatches)
+SPOOL_FILE = os.environ.get("SPOOL_FILE", os.path.join(BASE_DIR, "spool.db"))
+SPOOL_POLL_INTERVAL = float(os.environ.get("SPOOL_POLL_INTERVAL", "1"))  # seconds
+SPOOL_MAX_ATTEMPTS = int(os.environ.get("SPOOL_MAX_ATTEMPTS", "5"))
+SPOOL_RETRY_BASE = float(os.environ.get("SPOOL_RETRY_BASE", "2"))  # seconds, doubled per attempt
+SPOOL_RETRY_MAX = float(os.environ.get("SPOOL_RETRY_MAX", "60"))  # seconds
+SPOOL_RETENTION = int(os.environ.get("SPOOL_RETENTION", str(7 * 24 * 3600)))  # seconds
+
+# Local customer search index for the ad hoc screen (refreshed from DB2)
+SEARCH_INDEX_FILE = os.environ.get("SEARCH_INDEX_FILE", os.path.join(BASE_DIR, "search.db"))
+SEARCH_INDEX_REFRESH = int(os.environ.get("SEARCH_INDEX_REFRESH", "600"))  # seconds between refreshes, 0 = on demand only
+SEARCH_INDEX_MAX_AGE = int(os.environ.get("SEARCH_INDEX_MAX_AGE", "1800"))  # seconds before searches fall back to DB2
+
+# Ad hoc typeahead (/adhoc/api/suggest)
+# Shorter terms are not looked up; the search index's trigram tokenizer
+# cannot serve terms under 3 characters and would scan every name instead
+SUGGEST_MIN_CHARS = int(os.environ.get("SUGGEST_MIN_CHARS", "3"))
+SUGGEST_LIMIT = int(os.environ.get("SUGGEST_LIMIT", "8"))  # customers per response
+
+# Local replica of vbatch_labels (and picks for REPLICA_PICK_CUSTOMERS), kept
+# in sync by diffing; the batch screens read it instead of DB2 while fresh
+REPLICA_FILE = os.environ.get("REPLICA_FILE", os.path.join(BASE_DIR, "replica.db"))
+REPLICA_SYNC_INTERVAL = int(os.environ.get("REPLICA_SYNC_INTERVAL", "60"))  # seconds between syncs, 0 = off
+REPLICA_MAX_AGE = int(os.environ.get("REPLICA_MAX_AGE", "300"))  # seconds before reads fall back to DB2
+# Customer numbers are ints, as the routes pass them to db2.get_picks()
+REPLICA_PICK_CUSTOMERS = [
+    int(c) for c in os.environ.get("REPLICA_PICK_CUSTOMERS", "20815").split(",") if c.strip()
+]
+
+# Snapshots of the rows shown on review/search pages, printed from on submit
+SELECTION_FILE = os.environ.get("SELECTION_FILE", os.path.join(BASE_DIR, "selections.db"))
+SELECTION_TTL = int(os.environ.get("SELECTION_TTL", "1800"))  # seconds before a page must be reloaded to print
+REVIEW_PAGE_SIZE = int(os.environ.get("REVIEW_PAGE_SIZE", "100"))  # rows per route review API page
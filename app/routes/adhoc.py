@@ -1,9 +1,31 @@
-from flask import Blueprint, render_template, request, session, redirect, url_for, flash
-from app.services.printer import get_printer, send_zpl
-from app.services.zpl import generate_labels
+import logging
+
+from flask import Blueprint, render_template, request, session, redirect, url_for, flash, jsonify
+from app.config import CACHE_SUGGEST_TTL, SUGGEST_LIMIT, SUGGEST_MIN_CHARS
+from app.services import health, search_index, selections, spooler
+from app.services.cache import cached
+from app.services.printer import get_printer
 
 bp = Blueprint("adhoc", __name__)
 
+log = logging.getLogger(__name__)
+
+
+def _search(term, source):
+    """Search the local index, falling back to DB2 when it is stale."""
+    try:
+        results = search_index.search(term, source)
+    except Exception:
+        log.exception("search index lookup failed")
+        results = None
+    if results is not None:
+        return results
+
+    from app.services import db2
+    if source == "vbatch_labels":
+        return db2.search_customers(term)
+    return db2.search_oneoff_customers(term)
+
 
 @bp.route("/")
 def search():
@@ -12,13 +34,12 @@ def search():
     source = None
 
     if term:
-        from app.services import db2
         try:
-            results = db2.search_customers(term)
+            results = _search(term, "vbatch_labels")
             if results:
                 source = "vbatch_labels"
             else:
-                results = db2.search_oneoff_customers(term)
+                results = _search(term, "oneoff")
                 if results:
                     source = "oneoff"
         except Exception as e:
@@ -27,11 +48,73 @@ def search():
         if not results:
             flash("No customers found.", "warning")
 
+    selection, keys = None, []
+    if results:
+        fields = ("INVOICE_NO",) if source == "vbatch_labels" else ("CUSTOMER_NO",)
+        selection, keys = selections.save(results, fields, source=source, term=term)
+
     return render_template(
-        "adhoc/search.html", results=results, source=source, term=term
+        "adhoc/search.html",
+        results=results,
+        keys=keys,
+        selection=selection,
+        source=source,
+        term=term,
+        suggest_min_chars=SUGGEST_MIN_CHARS,
     )
 
 
+@bp.route("/api/suggest")
+def suggest():
+    """Customers matching ``q``, for the search box as the operator types.
+
+    Terms shorter than SUGGEST_MIN_CHARS return no results without a
+    lookup. Results are cached per term (case-insensitive, as the search
+    is), so everyone typing the same prefix shares one lookup.
+    """
+    term = request.args.get("q", "").strip()
+    if len(term) < SUGGEST_MIN_CHARS:
+        return jsonify(q=term, results=[])
+    try:
+        results = _suggestions(term.upper())
+    except Exception as e:
+        return jsonify(q=term, results=[], error=f"Database error: {e}"), 502
+    return jsonify(q=term, results=results)
+
+
+@cached("suggest", ttl=CACHE_SUGGEST_TTL)
+def _suggestions(term):
+    """The first SUGGEST_LIMIT customers search() would show for ``term``.
+
+    Returns:
+        List of small dicts, one per customer number, with the number of
+        result rows (invoices/departments) for that customer.
+    """
+    source = "vbatch_labels"
+    rows = _search(term, source)
+    if not rows:
+        source = "oneoff"
+        rows = _search(term, source)
+
+    customers = {}
+    for row in rows:
+        customer_no = str(row.get("CUSTOMER_NO", "")).strip()
+        if customer_no in customers:
+            customers[customer_no]["rows"] += 1
+        elif len(customers) < SUGGEST_LIMIT:
+            customers[customer_no] = {
+                "customer_no": customer_no,
+                "customer": str(row.get("CUSTOMER", "")).strip(),
+                "city": str(row.get("CITY", "")).strip(),
+                "state": str(row.get("STATE") or row.get("STATE_CD") or "").strip(),
+                "route": str(row.get("ROUTE", "")).strip(),
+                "stop": str(row.get("STOP", "")).strip(),
+                "source": source,
+                "rows": 1,
+            }
+    return list(customers.values())
+
+
 @bp.route("/print", methods=["POST"])
 def print_labels():
     printer_name = session.get("printer")
@@ -44,7 +127,6 @@ def print_labels():
         flash("Selected printer not found.", "danger")
         return redirect(url_for("adhoc.search"))
 
-    source = request.form.get("source", "")
     selected = request.form.getlist("selected")
     term = request.form.get("term", "")
 
@@ -52,47 +134,43 @@ def print_labels():
         flash("No labels selected.", "warning")
         return redirect(url_for("adhoc.search", q=term))
 
-    from app.services import db2
-    try:
-        if source == "vbatch_labels":
-            all_results = db2.search_customers(term)
-        else:
-            all_results = db2.search_oneoff_customers(term)
-    except Exception as e:
-        flash(f"Database error: {e}", "danger")
+    # Print exactly the rows the search page showed
+    snapshot = selections.load(request.form.get("selection"))
+    if snapshot is None:
+        flash("These results are out of date. Check them and print again.", "warning")
         return redirect(url_for("adhoc.search", q=term))
+    source = snapshot["source"]
 
-    # Build lookup by unique key
-    zpl_all = ""
+    to_print = []  # (row, label count)
     label_count = 0
 
-    for result in all_results:
-        if source == "vbatch_labels":
-            key = str(result.get("INVOICE_NO", ""))
+    for key, result in selections.selected_rows(snapshot, selected):
+        # Check for quantity override
+        qty = request.form.get(f"qty_{key}")
+        if qty and qty.isdigit() and int(qty) > 0:
+            total = int(qty)
+        elif source == "vbatch_labels":
+            total = int(result.get("LABELS", 1) or 1)
         else:
-            key = str(result.get("CUSTOMER_NO", ""))
-
-        if key in selected:
-            # Check for quantity override
-            qty_key = f"qty_{key}"
-            qty = request.form.get(qty_key)
-            if qty and qty.isdigit() and int(qty) > 0:
-                total = int(qty)
-            elif source == "vbatch_labels":
-                total = int(result.get("LABELS", 1) or 1)
-            else:
-                total = 1
+            total = 1
 
-            zpl_all += generate_labels(result, total_labels=total)
-            label_count += total
+        to_print.append((result, total))
+        label_count += total
 
-    if not zpl_all:
+    if not to_print:
         flash("No matching labels to print.", "warning")
         return redirect(url_for("adhoc.search", q=term))
 
+    printer, message = health.choose(printer)
+    if printer is None:
+        flash(message, "danger")
+        return redirect(url_for("adhoc.search", q=term))
+    if message:
+        flash(message, "warning")
+
     try:
-        send_zpl(printer["ip"], zpl_all)
-        flash(f"Sent {label_count} label(s) to {printer_name}.", "success")
+        job_id = spooler.enqueue_labels(printer, to_print, label_count, f"Ad hoc: {term}")
+        flash(f"Queued {label_count} label(s) for {printer['name']} (job #{job_id}).", "success")
     except Exception as e:
         flash(f"Print error: {e}", "danger")
 
@@ -1,8 +1,10 @@
 import functools
 import os
 
-from flask import Blueprint, render_template, request, redirect, url_for, flash, session
+from flask import Blueprint, render_template, request, redirect, url_for, flash, session, jsonify, abort
 
+from app.config import PROFILE_REQUESTS, PROFILE_THRESHOLD
+from app.services import cache, health, profiler, replica, search_index
 from app.services.printer import get_printers, add_printer, update_printer, delete_printer
 
 bp = Blueprint("admin", __name__)
@@ -39,7 +41,15 @@ def logout():
 @bp.route("/printers")
 @admin_required
 def printers():
-    return render_template("admin/printers.html", printers=get_printers())
+    return render_template(
+        "admin/printers.html",
+        printers=get_printers(),
+        statuses=health.all_statuses(),
+        cache_stats=cache.stats(),
+        search_stats=search_index.stats(),
+        replica_stats=replica.stats(),
+        sync_log=replica.sync_log(5),
+    )
 
 
 @bp.route("/printers/add", methods=["POST"])
@@ -63,11 +73,14 @@ def printers_edit():
     old_name = request.form.get("old_name", "").strip()
     name = request.form.get("name", "").strip()
     ip = request.form.get("ip", "").strip()
+    backup = request.form.get("backup", "").strip()
 
     if not name or not ip:
         flash("Name and IP are required.", "danger")
+    elif backup in (old_name, name):
+        flash("A printer cannot be its own backup.", "danger")
     else:
-        update_printer(old_name, name, ip)
+        update_printer(old_name, name, ip, backup or None)
         flash(f"Printer '{name}' updated.", "success")
 
     return redirect(url_for("admin.printers"))
@@ -82,3 +95,86 @@ def printers_delete():
         flash(f"Printer '{name}' deleted.", "success")
 
     return redirect(url_for("admin.printers"))
+
+
+@bp.route("/db-pool")
+@admin_required
+def db_pool():
+    """Connection pool counters for the worker that served this request."""
+    from app.services import db2
+    return jsonify(db2.pool_stats())
+
+
+@bp.route("/cache/flush", methods=["POST"])
+@admin_required
+def cache_flush():
+    """Drop cached route/customer query results, e.g. after picking is re-released."""
+    removed = cache.flush(request.form.get("name") or None)
+    flash(f"Cleared {removed} cached result(s).", "success")
+    return redirect(url_for("admin.printers"))
+
+
+@bp.route("/search-index/refresh", methods=["POST"])
+@admin_required
+def search_index_refresh():
+    """Rebuild the ad hoc search index from DB2 now."""
+    try:
+        count = search_index.refresh()
+        flash(f"Search index rebuilt with {count} customer row(s).", "success")
+    except Exception as e:
+        flash(f"Search index refresh failed: {e}", "danger")
+    return redirect(url_for("admin.printers"))
+
+
+@bp.route("/replica/sync", methods=["POST"])
+@admin_required
+def replica_sync():
+    """Sync the local vbatch_labels/picks replica with DB2 now."""
+    try:
+        result = replica.sync()
+        flash(
+            f"Replica synced: {result['inserted']} added, {result['updated']} changed, "
+            f"{result['deleted']} removed ({result['duration']}s).",
+            "success",
+        )
+    except Exception as e:
+        flash(f"Replica sync failed: {e}", "danger")
+    return redirect(url_for("admin.printers"))
+
+
+@bp.route("/profiles")
+@admin_required
+def profiles():
+    return render_template(
+        "admin/profiles.html",
+        profiles=profiler.list_profiles(),
+        enabled=profiler.is_enabled(),
+        forced=PROFILE_REQUESTS,
+        threshold=PROFILE_THRESHOLD,
+    )
+
+
+@bp.route("/profiles/<int:profile_id>")
+@admin_required
+def profile_detail(profile_id):
+    profile = profiler.get_profile(profile_id)
+    if profile is None:
+        abort(404)
+    return render_template("admin/profile_detail.html", profile=profile)
+
+
+@bp.route("/profiles/toggle", methods=["POST"])
+@admin_required
+def profiles_toggle():
+    enabled = request.form.get("enabled") == "1"
+    profiler.set_enabled(enabled)
+    flash(f"Request profiling {'enabled' if enabled else 'disabled'}.", "success")
+    return redirect(url_for("admin.profiles"))
+
+
+@bp.route("/profiles/clear", methods=["POST"])
+@admin_required
+def profiles_clear():
+    removed = profiler.clear()
+    flash(f"Removed {removed} profile(s).", "success")
+    return redirect(url_for("admin.profiles"))
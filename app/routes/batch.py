@@ -1,55 +1,231 @@
-from flask import Blueprint, render_template, request, session, redirect, url_for, flash
-from app.services.printer import get_printer, send_zpl
-from app.services.zpl import generate_labels, generate_pick_list_labels
+import hashlib
+import math
+import time
+
+from flask import Blueprint, render_template, request, session, redirect, url_for, flash, jsonify, make_response
+from app.config import REVIEW_PAGE_SIZE, REPLICA_PICK_CUSTOMERS, SELECTION_TTL
+from app.services import assets, health, metrics, replica, selections, spooler
+from app.services.printer import get_printer, get_printers
 
 bp = Blueprint("batch", __name__)
 
+# The same invoice can appear under several departments
+REVIEW_KEY_FIELDS = ("INVOICE_NO", "PICK_AREA")
+
+
+def _page_version(*key):
+    """Validator for a batch page built from the local replica.
+
+    Combines the replica's last change with everything else the page
+    shows (the session's printer, the printer list and statuses in the
+    navbar, the deployed templates). Returns (digest, changed time), or
+    None when the page comes from DB2 or has flash messages to show, in
+    which case it is always rendered.
+    """
+    changed = replica.changed_at()
+    if changed is None or session.get("_flashes"):
+        return None
+    statuses = sorted(
+        (name, status["ok"], status["state"]) for name, status in health.all_statuses().items()
+    )
+    parts = (assets.build_id(), changed, key, session.get("printer"), get_printers(), statuses)
+    return hashlib.sha1(repr(parts).encode()).hexdigest()[:20], changed
+
+
+def _print_error(route, reason):
+    """Count a print request that failed before its job was queued.
+
+    reason is "printer" (not found or none ready), "database" or "enqueue";
+    failures after queueing are counted by the spooler.
+    """
+    metrics.inc("labelprinter_print_errors_total", route=route, reason=reason)
+
+
+def _not_modified(etag, changed):
+    response = make_response("", 304)
+    return _with_validators(response, etag, changed)
+
+
+def _with_validators(response, etag, changed):
+    response.set_etag(etag, weak=True)
+    response.last_modified = changed
+    # Always revalidate; an unchanged page costs a 304 and no DB2 query
+    response.cache_control.private = True
+    response.cache_control.no_cache = True
+    return response
+
 
 @bp.route("/")
 def select_route():
+    version = _page_version("routes")
+    if version and request.if_none_match.contains_weak(version[0]):
+        return _not_modified(*version)
+
     from app.services import db2
     try:
         combos = db2.get_route_departments()
     except Exception as e:
         flash(f"Database error: {e}", "danger")
-        combos = []
+        combos, version = [], None
 
     # Group by route for display
     routes = {}
     for c in combos:
         routes.setdefault(c["ROUTE"], []).append(c["PICK_AREA"])
 
-    return render_template("batch/select_route.html", routes=routes)
+    response = make_response(render_template("batch/select_route.html", routes=routes))
+    return _with_validators(response, *version) if version else response
 
 
 @bp.route("/<route>")
 def review_labels(route):
     dept = request.args.get("dept", "")
-    from app.services import db2
+    # 20815's label counts come from its picks, which must be replicated too
+    version = _page_version("review", route, dept) if 20815 in REPLICA_PICK_CUSTOMERS else None
+    if version:
+        etag = _reusable_review_etag(version[0])
+        if etag:
+            return _not_modified(etag, version[1])
+
     try:
-        customers = db2.get_customers_by_route_dept(route, dept or None)
+        customers, selection, keys = _review_snapshot(route, dept)
     except Exception as e:
         flash(f"Database error: {e}", "danger")
-        customers = []
+        customers, selection, keys = [], None, []
 
     if not customers:
         flash(f"No orders found for route {route}.", "warning")
 
+    # The table loads further rows from review_rows() as it is scrolled
+    response = make_response(render_template(
+        "batch/review_labels.html",
+        first_page=_review_page(selection, customers, keys, 0, REVIEW_PAGE_SIZE),
+        has_20815=any(str(c.get("CUSTOMER_NO", "")).strip() == "20815" for c in customers),
+        selection=selection,
+        route=route,
+        dept=dept,
+    ))
+    if version and selection and customers:
+        # The page prints from its snapshot, so the ETag names it
+        return _with_validators(response, f"{version[0]}.{selection}", version[1])
+    return response
+
+
+def _reusable_review_etag(digest):
+    """The client's cached review page ETag if it is still good, else None.
+
+    It is good when the data and page are unchanged and its selection
+    snapshot has at least half of SELECTION_TTL left to print from.
+    """
+    for etag in request.if_none_match.as_set(include_weak=True):
+        page_digest, _, token = etag.partition(".")
+        if page_digest != digest or not token:
+            continue
+        expires = selections.expires_at(token)
+        if expires and expires - time.time() >= SELECTION_TTL / 2:
+            return etag
+    return None
+
+
+@bp.route("/api/<route>/rows")
+def review_rows(route):
+    """Review rows for a route, a page at a time.
+
+    Query args: ``dept``, ``selection`` (the page's snapshot token; a new
+    snapshot is taken when it is left out), ``cursor`` (``next_cursor``
+    of the previous page) and ``limit``. Rows come in the snapshot's
+    order, PICK_AREA then STOP as DB2 returned them, so pages never
+    shift while the operator scrolls. Each row's ``key`` is its value
+    for the print form.
+    """
+    dept = request.args.get("dept", "")
+    limit = min(max(request.args.get("limit", REVIEW_PAGE_SIZE, type=int), 1), 500)
+    selection = request.args.get("selection")
+    if selection:
+        snapshot = selections.load(selection)
+        if snapshot is None:
+            return jsonify(error="This list is out of date. Reload the page."), 410
+        keys = snapshot["keys"]
+        rows = [snapshot["rows"][key] for key in keys]
+    else:
+        try:
+            rows, selection, keys = _review_snapshot(route, dept)
+        except Exception as e:
+            return jsonify(error=f"Database error: {e}"), 502
+
+    start = 0
+    cursor = request.args.get("cursor")
+    if cursor:
+        try:
+            start = keys.index(cursor) + 1
+        except ValueError:
+            return jsonify(error="Unknown cursor."), 400
+    return jsonify(_review_page(selection, rows, keys, start, limit))
+
+
+def _review_snapshot(route, dept):
+    """Fetch a route's rows with their label counts and snapshot them.
+
+    Returns:
+        (rows, selection token, row keys)
+    """
+    from app.services import db2
+    customers = db2.get_customers_by_route_dept(route, dept or None)
+
     # Calculate labels for customer 20815 from picks table (per invoice)
+    for cust, labels in _with_label_counts(customers):
+        cust["LABELS"] = labels
+
+    selection, keys = selections.save(customers, REVIEW_KEY_FIELDS, route=route, dept=dept)
+    return customers, selection, keys
+
+
+def _review_page(selection, rows, keys, start, limit):
+    """JSON-ready page of ``limit`` review rows from index ``start``."""
+    end = min(start + limit, len(rows))
+    page = []
+    for key, c in zip(keys[start:end], rows[start:end]):
+        stop = c.get("STOP")
+        page.append({
+            "key": key,
+            "PICK_AREA": c.get("PICK_AREA") or "",
+            "STOP": "" if stop is None else str(stop),
+            "CUSTOMER": c.get("CUSTOMER") or "",
+            "INVOICE_NO": str(c.get("INVOICE_NO", "")),
+            "PO_NUM": c.get("PO_NUM") or "",
+            "LABELS": c.get("LABELS") or 1,
+        })
+    return {
+        "selection": selection,
+        "total": len(rows),
+        "rows": page,
+        "next_cursor": keys[end - 1] if end < len(rows) else None,
+    }
+
+
+def _with_label_counts(rows):
+    """Pair each row with the number of labels to print for it.
+
+    Customer 20815's counts come from its picks (M-Z = 1 per unit, others
+    = 1 per 6 units) instead of vbatch_labels.LABELS.
+    """
+    from app.services import db2
+
     labels_20815_by_invoice = None
-    for cust in customers:
+    result = []
+    for cust in rows:
         if str(cust.get("CUSTOMER_NO", "")).strip() == "20815":
             if labels_20815_by_invoice is None:
                 try:
-                    labels_20815_by_invoice = db2.get_label_counts_for_20815_by_invoice(20815)
+                    labels_20815_by_invoice = db2.label_counts_by_invoice(db2.get_picks(20815))
                 except Exception:
                     labels_20815_by_invoice = {}
             invoice_no = str(cust.get("INVOICE_NO", "")).strip()
-            cust["LABELS"] = labels_20815_by_invoice.get(invoice_no, 1)
-
-    return render_template(
-        "batch/review_labels.html", customers=customers, route=route, dept=dept
-    )
+            labels = labels_20815_by_invoice.get(invoice_no, 1)
+        else:
+            labels = int(cust.get("LABELS", 1) or 1)
+        result.append((cust, labels))
+    return result
 
 
 @bp.route("/print", methods=["POST"])
@@ -61,58 +237,54 @@ def print_labels():
 
     printer = get_printer(printer_name)
     if not printer:
+        _print_error(request.form.get("route", ""), "printer")
         flash("Selected printer not found.", "danger")
         return redirect(url_for("batch.select_route"))
 
+    # The review table only has the rows it has scrolled to, so it sends
+    # select_all with the keys unticked instead of every ticked key
+    select_all = bool(request.form.get("select_all"))
     selected = request.form.getlist("selected")
-    if not selected:
+    if not selected and not select_all:
         flash("No labels selected.", "warning")
         return redirect(request.referrer or url_for("batch.select_route"))
 
     route = request.form.get("route", "")
     dept = request.form.get("dept", "")
 
-    from app.services import db2
-    try:
-        customers = db2.get_customers_by_route_dept(route, dept or None)
-    except Exception as e:
-        flash(f"Database error: {e}", "danger")
-        return redirect(url_for("batch.select_route"))
-
-    # Filter to selected rows and build ZPL
-    # Use index-based keys since same INVOICE_NO can appear for multiple departments
-    selected_set = set(selected)
-    zpl_all = ""
-    label_count = 0
+    # Print exactly the rows the review page showed, with their label counts
+    snapshot = selections.load(request.form.get("selection"))
+    if snapshot is None:
+        flash("This list is out of date. Check the labels and print again.", "warning")
+        return redirect(url_for("batch.review_labels", route=route, dept=dept))
+    if select_all:
+        deselected = set(request.form.getlist("deselected"))
+        selected = [key for key in snapshot["keys"] if key not in deselected]
 
-    # For customer 20815, calculate labels from picks table (per invoice)
-    labels_20815_by_invoice = None
+    to_print = [
+        (cust, int(cust.get("LABELS", 1) or 1))
+        for _, cust in selections.selected_rows(snapshot, selected)
+    ]
+    label_count = sum(labels for _, labels in to_print)
 
-    for idx, cust in enumerate(customers):
-        if str(idx) in selected_set:
-            cust_no = str(cust.get("CUSTOMER_NO", "")).strip()
-            if cust_no == "20815":
-                # Calculate labels from picks: M-Z=1 per unit, others=1 per 6 units
-                if labels_20815_by_invoice is None:
-                    try:
-                        labels_20815_by_invoice = db2.get_label_counts_for_20815_by_invoice(20815)
-                    except Exception:
-                        labels_20815_by_invoice = {}
-                invoice_no = str(cust.get("INVOICE_NO", "")).strip()
-                labels = labels_20815_by_invoice.get(invoice_no, 1)
-            else:
-                labels = int(cust.get("LABELS", 1) or 1)
-            zpl_all += generate_labels(cust, total_labels=labels)
-            label_count += labels
-
-    if not zpl_all:
+    if not to_print:
         flash("No matching labels to print.", "warning")
         return redirect(url_for("batch.review_labels", route=route, dept=dept))
 
+    description = f"Route {route}" + (f" / Dept {dept}" if dept else "")
+    printer, message = health.choose(printer)
+    if printer is None:
+        _print_error(route, "printer")
+        flash(message, "danger")
+        return redirect(url_for("batch.review_labels", route=route, dept=dept))
+    if message:
+        flash(message, "warning")
+
     try:
-        send_zpl(printer["ip"], zpl_all)
-        flash(f"Sent {label_count} label(s) to {printer_name}.", "success")
+        job_id = spooler.enqueue_labels(printer, to_print, label_count, description, route)
+        flash(f"Queued {label_count} label(s) for {printer['name']} (job #{job_id}).", "success")
     except Exception as e:
+        _print_error(route, "enqueue")
         flash(f"Print error: {e}", "danger")
 
     return redirect(url_for("batch.review_labels", route=route, dept=dept))
@@ -128,6 +300,7 @@ def print_pick_list():
 
     printer = get_printer(printer_name)
     if not printer:
+        _print_error(request.form.get("route", ""), "printer")
         flash("Selected printer not found.", "danger")
         return redirect(url_for("batch.select_route"))
 
@@ -136,10 +309,11 @@ def print_pick_list():
 
     from app.services import db2
 
-    # Get all regions for customer 20815 and print pick lists
+    # One picks fetch for customer 20815, split into a pick list per region
     try:
-        regions = db2.get_pick_list_regions(20815)
+        regions = db2.partition_picks(db2.get_picks(20815))
     except Exception as e:
+        _print_error(route, "database")
         flash(f"Database error: {e}", "danger")
         return redirect(url_for("batch.review_labels", route=route, dept=dept))
 
@@ -147,27 +321,151 @@ def print_pick_list():
         flash("No pick list items found for customer 20815.", "warning")
         return redirect(url_for("batch.review_labels", route=route, dept=dept))
 
-    zpl_all = ""
-    label_count = 0
-
-    for region in regions:
-        try:
-            items = db2.get_pick_list(20815, region)
-            if items:
-                zpl_all += generate_pick_list_labels(items, region)
-                # Count labels (12 items per label)
-                label_count += (len(items) + 11) // 12
-        except Exception as e:
-            flash(f"Error getting pick list for region {region}: {e}", "danger")
+    to_print = list(regions.items())  # (region, items)
+    # Count labels (12 items per label)
+    label_count = sum((len(items) + 11) // 12 for items in regions.values())
 
-    if not zpl_all:
-        flash("No pick list labels to print.", "warning")
+    printer, message = health.choose(printer)
+    if printer is None:
+        _print_error(route, "printer")
+        flash(message, "danger")
         return redirect(url_for("batch.review_labels", route=route, dept=dept))
+    if message:
+        flash(message, "warning")
 
     try:
-        send_zpl(printer["ip"], zpl_all)
-        flash(f"Sent {label_count} pick list label(s) to {printer_name}.", "success")
+        job_id = spooler.enqueue_pick_lists(
+            printer, to_print, label_count, "Pick lists 20815", route
+        )
+        flash(
+            f"Queued {label_count} pick list label(s) for {printer['name']} (job #{job_id}).",
+            "success",
+        )
     except Exception as e:
+        _print_error(route, "enqueue")
         flash(f"Print error: {e}", "danger")
 
     return redirect(url_for("batch.review_labels", route=route, dept=dept))
+
+
+@bp.route("/bulk-print", methods=["POST"])
+def bulk_print():
+    """Print several routes/departments at once, split across printers.
+
+    Expects JSON like::
+
+        {"routes": [{"route": "12", "dept": "D"}, {"route": "14"}],
+         "printers": {"D": "Dock 1", "F": "Dock 2"},
+         "default_printer": "Dock 3",
+         "wait": 30}
+
+    ``dept`` may be left out to print every department of a route. Rows are
+    sent to the printer assigned to their pick area, else to
+    ``default_printer`` (or the session printer), or to that printer's
+    backup if the status monitor reports it is not ready. All routes are
+    fetched in one query and each printer gets one job; the spooler sends
+    to all the printers concurrently. With ``wait`` the response waits up
+    to that many seconds (at most 120) for the jobs and reports how long
+    each printer took. A malformed body gets a 400 with an ``error``.
+
+    Requested route/dept pairs that matched no rows are listed in
+    ``unmatched``; if none matched the response is a 404. Rows that could
+    not be sent are counted in ``unassigned``, one entry per route,
+    department and printer.
+    """
+    body = request.get_json(silent=True) or {}
+    if not isinstance(body, dict):
+        return jsonify(error="Request body must be a JSON object."), 400
+    routes = body.get("routes") or []
+    if not isinstance(routes, list) or not all(isinstance(p, dict) for p in routes):
+        return jsonify(error='routes must be a list of {"route": ..., "dept": ...} objects.'), 400
+    wanted = {
+        (str(p.get("route", "")).strip(), str(p.get("dept") or "").strip())
+        for p in routes
+        if str(p.get("route", "")).strip()
+    }
+    if not wanted:
+        return jsonify(error="No routes given."), 400
+    assignments = body.get("printers") or {}
+    if not isinstance(assignments, dict) or not all(isinstance(v, str) for v in assignments.values()):
+        return jsonify(error="printers must map pick areas to printer names."), 400
+    default_name = body.get("default_printer") or session.get("printer")
+    if default_name is not None and not isinstance(default_name, str):
+        return jsonify(error="default_printer must be a printer name."), 400
+    try:
+        wait = float(body.get("wait") or 0)
+    except (TypeError, ValueError):
+        wait = None
+    if wait is None or not math.isfinite(wait):
+        return jsonify(error="wait must be a number of seconds."), 400
+    wait = min(max(wait, 0), 120)
+
+    from app.services import db2
+    route_list = sorted({route for route, _ in wanted})
+    started = time.monotonic()
+    try:
+        rows = db2.get_customers_by_routes(route_list)
+    except Exception as e:
+        _print_error(",".join(route_list), "database")
+        return jsonify(error=f"Database error: {e}"), 502
+    query_seconds = time.monotonic() - started
+
+    by_printer = {}
+    unassigned = {}  # (route, dept, printer name) -> entry with a row count
+    matched = set()
+    chosen = {}  # requested printer name -> (printer to use or None, message)
+    for row in rows:
+        route = str(row.get("ROUTE", "")).strip()
+        dept = str(row.get("PICK_AREA", "")).strip()
+        hits = wanted & {(route, ""), (route, dept)}
+        if not hits:
+            continue
+        matched |= hits
+        name = assignments.get(dept) or default_name
+        if name not in chosen:
+            printer = get_printer(name) if name else None
+            chosen[name] = health.choose(printer) if printer else (None, "Printer not found.")
+        printer, message = chosen[name]
+        if printer:
+            by_printer.setdefault(printer["name"], []).append(row)
+        else:
+            entry = unassigned.setdefault(
+                (route, dept, name),
+                {"route": route, "dept": dept, "printer": name, "reason": message, "rows": 0},
+            )
+            entry["rows"] += 1
+
+    unmatched = [{"route": route, "dept": dept} for route, dept in sorted(wanted - matched)]
+    if not matched:
+        return jsonify(error="No rows found for the requested routes.", unmatched=unmatched), 404
+
+    for route in sorted({route for route, _, _ in unassigned}):
+        _print_error(route, "printer")
+
+    description = f"Bulk: routes {', '.join(route_list)}"
+    results = []
+    for name, printer_rows in by_printer.items():
+        to_print = _with_label_counts(printer_rows)
+        labels = sum(count for _, count in to_print)
+        printer_routes = sorted({str(row.get("ROUTE", "")).strip() for row in printer_rows})
+        job_id = spooler.enqueue_labels(
+            get_printer(name), to_print, labels, description, ",".join(printer_routes)
+        )
+        results.append({"printer": name, "job": job_id, "rows": len(to_print), "labels": labels})
+
+    if wait and results:
+        jobs = spooler.wait_for([r["job"] for r in results], wait)
+        for result in results:
+            job = jobs.get(result["job"]) or {}
+            result["status"] = job.get("status")
+            if job.get("started") and job.get("finished"):
+                result["seconds"] = round(job["finished"] - job["started"], 3)
+
+    return jsonify(
+        printers=results,
+        unassigned=list(unassigned.values()),
+        unmatched=unmatched,
+        rerouted=[message for printer, message in chosen.values() if printer and message],
+        labels=sum(r["labels"] for r in results),
+        query_seconds=round(query_seconds, 3),
+    )
@@ -0,0 +1,18 @@
+from flask import Blueprint, render_template, jsonify, abort
+
+from app.services import spooler
+
+bp = Blueprint("jobs", __name__)
+
+
+@bp.route("/")
+def index():
+    return render_template("jobs/index.html", jobs=spooler.recent_jobs())
+
+
+@bp.route("/api/<int:job_id>")
+def job_status(job_id):
+    job = spooler.get_job(job_id)
+    if job is None:
+        abort(404)
+    return jsonify(job)
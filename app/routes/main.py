@@ -1,4 +1,4 @@
-from flask import Blueprint, render_template, request, session, redirect, url_for, flash
+from flask import Blueprint, Response, render_template, request, session, redirect, url_for, flash
 from app.services.printer import get_printers
 
 bp = Blueprint("main", __name__)
@@ -21,7 +21,8 @@ def set_printer():
 
 @bp.route("/test-print", methods=["POST"])
 def test_print():
-    from app.services.printer import get_printer, send_zpl
+    from app.services import health, spooler
+    from app.services.printer import get_printer
     from app.services.zpl import generate_label
 
     printer_name = session.get("printer")
@@ -45,11 +46,24 @@ def test_print():
         "PICK_AREA": "DRY",
     }
 
+    # A test label goes to the chosen printer only, never to its backup
+    status = health.get_status(printer["name"])
+    if status and not status["ok"]:
+        flash(f"{printer['name']} is {status['state']}.", "danger")
+        return redirect(url_for("main.index"))
+
     zpl = generate_label(test_data)
     try:
-        send_zpl(printer["ip"], zpl)
-        flash("Test label sent.", "success")
+        job_id = spooler.enqueue_zpl(printer, zpl, 1, "Test label")
+        flash(f"Test label queued (job #{job_id}).", "success")
     except Exception as e:
         flash(f"Print error: {e}", "danger")
 
     return redirect(url_for("main.index"))
+
+
+@bp.route("/metrics")
+def metrics():
+    """Prometheus scrape endpoint (totals across all workers)."""
+    from app.services import metrics as app_metrics
+    return Response(app_metrics.render(), mimetype="text/plain; version=0.0.4")
@@ -0,0 +1,89 @@
+"""Content-hashed static URLs and a build id for page validators.
+
+url_for("static", filename=...) gets ``?v=<hash of the file>``, so the
+URL changes whenever the file does. A static request whose ``v`` matches
+the current file is served with a long-lived immutable Cache-Control;
+the browser then never asks for it again. Requests without ``v`` or with
+a stale one keep Flask's defaults (revalidate with the ETag).
+"""
+import hashlib
+import os
+import threading
+
+from flask import request
+
+from app.config import STATIC_MAX_AGE
+
+_APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+_fingerprints = {}  # path -> (mtime_ns, size, digest)
+_lock = threading.Lock()
+_build_id = None
+
+
+def _hash_file(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(65536), b""):
+            digest.update(chunk)
+    return digest.hexdigest()[:12]
+
+
+def fingerprint(filename, static_folder=None):
+    """Short content hash of a static file, or None if it does not exist."""
+    path = os.path.join(static_folder or os.path.join(_APP_DIR, "static"), filename)
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    cached = _fingerprints.get(path)
+    if cached and cached[:2] == (st.st_mtime_ns, st.st_size):
+        return cached[2]
+    digest = _hash_file(path)
+    with _lock:
+        _fingerprints[path] = (st.st_mtime_ns, st.st_size, digest)
+    return digest
+
+
+def build_id():
+    """Hash of the templates and static files this process started with.
+
+    Part of every page validator, so a deploy that changes how a page
+    looks never gets a 304 for the old page.
+    """
+    global _build_id
+    if _build_id is None:
+        digest = hashlib.sha1()
+        for folder in ("templates", "static"):
+            for root, dirs, files in os.walk(os.path.join(_APP_DIR, folder)):
+                dirs.sort()
+                for name in sorted(files):
+                    path = os.path.join(root, name)
+                    st = os.stat(path)
+                    digest.update(f"{path}:{st.st_mtime_ns}:{st.st_size}\n".encode())
+        _build_id = digest.hexdigest()[:12]
+    return _build_id
+
+
+def init_app(app):
+    """Fingerprint static URLs and mark fingerprinted responses immutable."""
+
+    @app.url_defaults
+    def _add_fingerprint(endpoint, values):
+        if endpoint == "static" and "filename" in values and "v" not in values:
+            version = fingerprint(values["filename"], app.static_folder)
+            if version:
+                values["v"] = version
+
+    @app.after_request
+    def _immutable(response):
+        if (
+            request.endpoint == "static"
+            and response.status_code == 200
+            and request.args.get("v")
+            and request.args.get("v") == fingerprint(request.view_args["filename"], app.static_folder)
+        ):
+            response.cache_control.public = True
+            response.cache_control.max_age = STATIC_MAX_AGE
+            response.cache_control.immutable = True
+            response.cache_control.no_cache = None
+        return response
@@ -0,0 +1,136 @@
+import functools
+import json
+import logging
+import pickle
+import time
+
+from app.config import CACHE_FILE, CACHE_MAX_BYTES
+from app.services import localdb
+
+log = logging.getLogger(__name__)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS cache (
+    key      TEXT PRIMARY KEY,
+    name     TEXT NOT NULL,
+    value    BLOB NOT NULL,
+    size     INTEGER NOT NULL,
+    expires  REAL NOT NULL,
+    accessed REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS cache_accessed ON cache (accessed);
+CREATE INDEX IF NOT EXISTS cache_name ON cache (name);
+"""
+
+_MISSING = object()
+
+
+def _db():
+    return localdb.connect(CACHE_FILE, _SCHEMA)
+
+
+def make_key(name, args=(), kwargs=None):
+    """Build a cache key from a query name and its parameters."""
+    params = json.dumps([list(args), kwargs or {}], sort_keys=True, default=str)
+    return f"{name}:{params}"
+
+
+def get(key, default=None):
+    """Return the cached value for ``key``, or ``default`` if absent/expired."""
+    now = time.time()
+    db = _db()
+    row = db.execute("SELECT value, expires FROM cache WHERE key = ?", (key,)).fetchone()
+    if row is None:
+        return default
+    if row[1] <= now:
+        db.execute("DELETE FROM cache WHERE key = ?", (key,))
+        return default
+    db.execute("UPDATE cache SET accessed = ? WHERE key = ?", (now, key))
+    return pickle.loads(row[0])
+
+
+def put(name, key, value, ttl):
+    """Store ``value`` under ``key`` for ``ttl`` seconds, evicting LRU entries over the cap."""
+    blob = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+    if len(blob) > CACHE_MAX_BYTES:
+        return
+    now = time.time()
+    db = _db()
+    db.execute(
+        "INSERT OR REPLACE INTO cache (key, name, value, size, expires, accessed) "
+        "VALUES (?, ?, ?, ?, ?, ?)",
+        (key, name, blob, len(blob), now + ttl, now),
+    )
+    _evict(db, now)
+
+
+def _evict(db, now):
+    db.execute("DELETE FROM cache WHERE expires <= ?", (now,))
+    total = db.execute("SELECT COALESCE(SUM(size), 0) FROM cache").fetchone()[0]
+    if total <= CACHE_MAX_BYTES:
+        return
+    overflow = total - CACHE_MAX_BYTES
+    for key, size in db.execute("SELECT key, size FROM cache ORDER BY accessed").fetchall():
+        db.execute("DELETE FROM cache WHERE key = ?", (key,))
+        overflow -= size
+        if overflow <= 0:
+            break
+
+
+def flush(name=None):
+    """Drop all cached entries (or only those for query ``name``).
+
+    Returns the number of entries removed.
+    """
+    db = _db()
+    if name:
+        cur = db.execute("DELETE FROM cache WHERE name = ?", (name,))
+    else:
+        cur = db.execute("DELETE FROM cache")
+    return cur.rowcount
+
+
+def stats():
+    """Return entry count and bytes per query name."""
+    rows = _db().execute(
+        "SELECT name, COUNT(*), COALESCE(SUM(size), 0) FROM cache "
+        "WHERE expires > ? GROUP BY name ORDER BY name",
+        (time.time(),),
+    ).fetchall()
+    return [{"name": name, "entries": count, "bytes": size} for name, count, size in rows]
+
+
+def cached(name, ttl):
+    """Cache a function's return value by its arguments for ``ttl`` seconds.
+
+    The cache is best effort: if the SQLite store is unavailable the
+    wrapped function is called directly. The undecorated function is
+    available as ``fn.__wrapped__``, and ``fn.refresh(*args, ttl=...)``
+    runs it now and stores the result (used to pre-warm the cache).
+    """
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapped(*args, **kwargs):
+            key = make_key(name, args, kwargs)
+            try:
+                value = get(key, _MISSING)
+            except Exception:
+                log.exception("cache read failed for %s", name)
+                return fn(*args, **kwargs)
+            if value is not _MISSING:
+                return value
+            value = fn(*args, **kwargs)
+            try:
+                put(name, key, value, ttl)
+            except Exception:
+                log.exception("cache write failed for %s", name)
+            return value
+
+        def refresh(*args, ttl=ttl, **kwargs):
+            value = fn(*args, **kwargs)
+            put(name, make_key(name, args, kwargs), value, ttl)
+            return value
+
+        wrapped.refresh = refresh
+        return wrapped
+    return decorator
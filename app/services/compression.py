@@ -0,0 +1,101 @@
+"""gzip (or brotli, when the brotli package is installed) for responses.
+
+Pages, JSON, the metrics text and fingerprinted CSS/JS are compressed
+when the browser accepts it and the body is at least COMPRESS_MIN_BYTES.
+Fingerprinted static files never change under the same URL, so they are
+compressed once at the highest level and kept in memory; everything else
+is compressed per response at COMPRESS_LEVEL. Compressed responses carry
+``Vary: Accept-Encoding`` and a weak ETag, which still validates against
+the uncompressed one.
+"""
+import gzip
+
+from flask import request
+
+from app.config import COMPRESS_LEVEL, COMPRESS_MIN_BYTES
+from app.services import assets
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+COMPRESSIBLE = {
+    "text/html",
+    "text/plain",
+    "text/css",
+    "text/javascript",
+    "application/javascript",
+    "application/json",
+    "image/svg+xml",
+}
+
+_static = {}  # (filename, version, encoding) -> compressed bytes
+
+
+def choose_encoding(accept_encodings):
+    """Best encoding the client accepts: "br", "gzip" or None."""
+    if brotli is not None and accept_encodings["br"]:
+        return "br"
+    if accept_encodings["gzip"]:
+        return "gzip"
+    return None
+
+
+def compress(data, encoding, best=False):
+    if encoding == "br":
+        return brotli.compress(data, quality=11 if best else 5)
+    return gzip.compress(data, compresslevel=9 if best else COMPRESS_LEVEL, mtime=0)
+
+
+def init_app(app):
+    """Compress eligible responses of ``app``."""
+
+    @app.after_request
+    def _compress(response):
+        if (
+            response.status_code != 200
+            or response.mimetype not in COMPRESSIBLE
+            or "Content-Encoding" in response.headers
+            or (response.is_streamed and not response.direct_passthrough)
+            or request.method == "HEAD"
+        ):
+            return response
+        encoding = choose_encoding(request.accept_encodings)
+        response.vary.add("Accept-Encoding")
+        if encoding is None:
+            return response
+
+        if response.direct_passthrough:
+            # Files from send_file(): only current fingerprinted static ones, cached
+            version = request.args.get("v")
+            if (
+                request.endpoint != "static"
+                or not version
+                or version != assets.fingerprint(request.view_args["filename"], app.static_folder)
+            ):
+                return response
+            key = (request.view_args["filename"], version, encoding)
+            body = _static.get(key)
+            if body is None:
+                response.direct_passthrough = False
+                data = response.get_data()
+                if len(data) < COMPRESS_MIN_BYTES:
+                    return response
+                body = _static[key] = compress(data, encoding, best=True)
+            else:
+                response.response.close()
+                response.direct_passthrough = False
+        else:
+            data = response.get_data()
+            if len(data) < COMPRESS_MIN_BYTES:
+                return response
+            body = compress(data, encoding)
+
+        response.set_data(body)
+        response.headers["Content-Encoding"] = encoding
+        response.accept_ranges = None
+        etag, weak = response.get_etag()
+        if etag and not weak:
+            response.set_etag(etag, weak=True)
+        return response
@@ -0,0 +1,237 @@
+"""Persistent TCP connections to Zebra printers.
+
+One socket per printer is kept open between jobs so consecutive prints
+skip the connect round trip and TIME_WAIT churn. Writes to a printer are
+serialized by a per-printer lock; a connection the printer has closed or
+reset is detected before use and re-established once. Sockets idle for
+PRINTER_IDLE_TIMEOUT are closed by a reaper thread, since most Zebras only
+serve one client connection at a time.
+
+Sockets are non-blocking once connected: writes and reads wait in
+select() (cooperative under gevent workers), and PRINTER_TIMEOUT limits
+how long the printer may go without accepting or sending anything, not
+the length of a whole write, so a printer draining a big job slowly is
+not mistaken for a dead one.
+"""
+import os
+import select
+import socket
+import threading
+import time
+
+from app.config import PRINTER_PORT, PRINTER_TIMEOUT, PRINTER_IDLE_TIMEOUT
+
+_connections = {}
+_connections_lock = threading.Lock()
+_connections_pid = None
+
+
+class PrinterConnection:
+    """A reusable socket to one printer. Use ``with conn.lock:`` around calls."""
+
+    def __init__(self, ip, port=PRINTER_PORT):
+        self.ip = ip
+        self.port = port
+        self.lock = threading.RLock()
+        self.sock = None
+        self.last_used = 0.0
+        self.connects = 0
+
+    def _connect(self):
+        sock = socket.create_connection((self.ip, self.port), timeout=PRINTER_TIMEOUT)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
+        if hasattr(socket, "TCP_KEEPIDLE"):
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_KEEPIDLE, 30)
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_KEEPINTVL, 10)
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_KEEPCNT, 3)
+        sock.setblocking(False)
+        self.sock = sock
+        self.connects += 1
+
+    def close(self):
+        if self.sock is not None:
+            try:
+                self.sock.close()
+            except OSError:
+                pass
+            self.sock = None
+
+    def _sendall(self, data):
+        """Write all of ``data`` as the printer accepts it.
+
+        Raises:
+            socket.timeout if the printer accepts nothing for PRINTER_TIMEOUT.
+        """
+        view = memoryview(data)
+        while view:
+            try:
+                sent = self.sock.send(view)
+            except BlockingIOError:
+                sent = 0
+            if sent:
+                view = view[sent:]
+                continue
+            _, writable, _ = select.select([], [self.sock], [], PRINTER_TIMEOUT)
+            if not writable:
+                raise socket.timeout(f"printer {self.ip} accepted no data for {PRINTER_TIMEOUT}s")
+
+    def _usable(self):
+        """Check an open socket for a peer close/reset and drain stray replies."""
+        if self.sock is None:
+            return False
+        try:
+            while True:
+                readable, _, _ = select.select([self.sock], [], [], 0)
+                if not readable:
+                    return True
+                if not self.sock.recv(4096):
+                    return False  # printer closed its end
+        except OSError:
+            return False
+
+    def _open(self):
+        """Make sure a live socket is open. Returns True if it was reused."""
+        if self._usable():
+            return True
+        self.close()
+        self._connect()
+        return False
+
+    def session(self):
+        """Open the socket if needed and return its connect count.
+
+        The count changes whenever the printer has to be reconnected, so
+        callers can tell whether state they set up on the printer earlier
+        (stored formats) may have been lost with a reboot.
+        """
+        self._open()
+        return self.connects
+
+    def send(self, data):
+        """Send bytes, reconnecting once if a reused socket turns out dead."""
+        reused = self._open()
+        try:
+            self._sendall(data)
+        except OSError:
+            self.close()
+            if not reused:
+                raise
+            self._connect()
+            self._sendall(data)
+        self.last_used = time.monotonic()
+
+    def send_stream(self, chunks, buffer_size, on_write=None):
+        """Send an iterable of byte chunks as they are produced.
+
+        The first chunk goes out immediately so the printer can start on
+        it; after that chunks are coalesced into writes of about
+        ``buffer_size`` bytes, so at most one buffer is held in memory and
+        a slow printer throttles rendering through the writes. Only the
+        first write may reconnect, since nothing has been sent yet.
+        ``on_write``, if given, is called with the running byte total after
+        each write, so a caller can tell how much went out before an error.
+
+        Returns:
+            Number of bytes sent.
+        """
+        sent = 0
+        pending = bytearray()
+        first = True
+        try:
+            for chunk in chunks:
+                pending += chunk
+                if first or len(pending) >= buffer_size:
+                    self._write(pending, first)
+                    sent += len(pending)
+                    pending.clear()
+                    first = False
+                    if on_write:
+                        on_write(sent)
+            if pending:
+                self._write(pending, first)
+                sent += len(pending)
+                if on_write:
+                    on_write(sent)
+        except OSError:
+            if not first:
+                self.close()  # a partial job leaves the socket in an unknown state
+            raise
+        return sent
+
+    def _write(self, data, first):
+        if first:
+            self.send(bytes(data))
+        else:
+            self._sendall(data)
+            self.last_used = time.monotonic()
+
+    def query(self, data, terminator=b"\x03", count=1):
+        """Send a host query and return the raw reply.
+
+        Reads until ``count`` terminators have arrived or the printer goes
+        quiet for PRINTER_TIMEOUT.
+        """
+        self.send(data)
+        chunks = []
+        seen = 0
+        while True:
+            readable, _, _ = select.select([self.sock], [], [], PRINTER_TIMEOUT)
+            if not readable:
+                break
+            try:
+                chunk = self.sock.recv(4096)
+            except BlockingIOError:
+                continue
+            except OSError:
+                self.close()
+                break
+            if not chunk:
+                self.close()
+                break
+            chunks.append(chunk)
+            seen += chunk.count(terminator)
+            if seen >= count:
+                break
+        self.last_used = time.monotonic()
+        return b"".join(chunks)
+
+
+def get_connection(ip):
+    """Return the shared connection object for a printer IP."""
+    global _connections_pid
+    with _connections_lock:
+        if _connections_pid != os.getpid():
+            # Sockets inherited across a fork belong to the parent
+            _connections.clear()
+            _connections_pid = os.getpid()
+            threading.Thread(target=_reap_idle, name="printer-reaper", daemon=True).start()
+        conn = _connections.get(ip)
+        if conn is None:
+            conn = _connections[ip] = PrinterConnection(ip)
+        return conn
+
+
+def close_all():
+    """Close every open printer socket in this process."""
+    with _connections_lock:
+        conns = list(_connections.values())
+    for conn in conns:
+        with conn.lock:
+            conn.close()
+
+
+def _reap_idle():
+    while True:
+        time.sleep(max(1.0, PRINTER_IDLE_TIMEOUT / 2))
+        cutoff = time.monotonic() - PRINTER_IDLE_TIMEOUT
+        with _connections_lock:
+            conns = list(_connections.values())
+        for conn in conns:
+            if conn.sock is not None and conn.last_used < cutoff:
+                # Skip printers busy with a job; they are checked again next pass
+                if conn.lock.acquire(blocking=False):
+                    try:
+                        if conn.last_used < cutoff:
+                            conn.close()
+                    finally:
+                        conn.lock.release()
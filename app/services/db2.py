@@ -1,21 +1,85 @@
+import logging
+import math
+import os
+import threading
+from decimal import Decimal
+
 import pyodbc  # requires ibm-iaccess ODBC driver on the system
-from app.config import DB2_CONNECTION_STRING
+from app.config import (
+    DB2_CONNECTION_STRING,
+    DB2_POOL_MIN,
+    DB2_POOL_MAX,
+    DB2_POOL_IDLE_TIMEOUT,
+    DB2_POOL_WAIT_TIMEOUT,
+    CACHE_ROUTES_TTL,
+    CACHE_CUSTOMERS_TTL,
+)
+from app.services import metrics, replica, rows
+from app.services.cache import cached
+from app.services.offload import offloaded
+from app.services.pool import ConnectionPool
 
+log = logging.getLogger(__name__)
 
-def get_connection():
+_pool = None
+_pool_pid = None
+_pool_lock = threading.Lock()
+
+
+def _connect():
     return pyodbc.connect(DB2_CONNECTION_STRING)
 
 
-def _strip_row(columns, row):
-    """Strip trailing whitespace from string values in a row."""
-    return {
-        col: val.strip() if isinstance(val, str) else val
-        for col, val in zip(columns, row)
-    }
+def _get_pool():
+    """Return this process's pool, creating it after a fork."""
+    global _pool, _pool_pid
+    pid = os.getpid()
+    if _pool is None or _pool_pid != pid:
+        with _pool_lock:
+            if _pool is None or _pool_pid != pid:
+                _pool = ConnectionPool(
+                    _connect,
+                    min_size=DB2_POOL_MIN,
+                    max_size=DB2_POOL_MAX,
+                    idle_timeout=DB2_POOL_IDLE_TIMEOUT,
+                    wait_timeout=DB2_POOL_WAIT_TIMEOUT,
+                    ping_sql="SELECT 1 FROM SYSIBM.SYSDUMMY1",
+                )
+                _pool_pid = pid
+    return _pool
+
+
+def get_connection():
+    """Check out a pooled connection; close() returns it to the pool."""
+    return _get_pool().acquire()
+
+
+def pool_stats():
+    """Hit/miss/wait counters for this worker's connection pool."""
+    stats = _get_pool().stats()
+    stats["pid"] = os.getpid()
+    return stats
+
+
+def _from_replica(read, *args):
+    """Read through the local replica; None if it is stale or fails."""
+    try:
+        return read(*args)
+    except Exception:
+        log.exception("replica read failed")
+        return None
 
 
+@cached("route_departments", ttl=CACHE_ROUTES_TTL)
 def get_route_departments():
     """Get distinct route/department combos from picked orders."""
+    combos = _from_replica(replica.route_departments)
+    return combos if combos is not None else _query_route_departments()
+
+
+@metrics.db_query("route_departments")
+@offloaded
+def _query_route_departments():
     conn = get_connection()
     try:
         cursor = conn.cursor()
@@ -24,20 +88,25 @@ def get_route_departments():
             "FROM longmod.vbatch_labels "
             "ORDER BY ROUTE, PICK_AREA"
         )
-        return [
-            {"ROUTE": row.ROUTE, "PICK_AREA": row.PICK_AREA}
-            for row in cursor.fetchall()
-        ]
+        return rows.fetch(cursor)
     finally:
         conn.close()
 
 
+@cached("customers_by_route_dept", ttl=CACHE_CUSTOMERS_TTL)
 def get_customers_by_route_dept(route, dept=None):
     """Get customers for a route (optionally filtered by department).
 
     Results are ordered by PICK_AREA then STOP so each department
     prints in stop-ascending order before the next department starts.
     """
+    customers = _from_replica(replica.customers_by_route_dept, route, dept)
+    return customers if customers is not None else _query_customers_by_route_dept(route, dept)
+
+
+@metrics.db_query("customers_by_route_dept")
+@offloaded
+def _query_customers_by_route_dept(route, dept=None):
     conn = get_connection()
     try:
         cursor = conn.cursor()
@@ -59,12 +128,44 @@ def get_customers_by_route_dept(route, dept=None):
                 "ORDER BY PICK_AREA, STOP",
                 (route,),
             )
-        columns = [desc[0] for desc in cursor.description]
-        return [_strip_row(columns, row) for row in cursor.fetchall()]
+        return rows.fetch(cursor)
+    finally:
+        conn.close()
+
+
+@cached("customers_by_routes", ttl=CACHE_CUSTOMERS_TTL)
+@metrics.db_query("customers_by_routes")
+@offloaded
+def get_customers_by_routes(routes):
+    """Get customers for several routes in one query.
+
+    Args:
+        routes: list of route numbers.
+
+    Results are ordered by ROUTE, PICK_AREA, then STOP.
+    """
+    routes = sorted(set(routes))
+    if not routes:
+        return []
+    conn = get_connection()
+    try:
+        cursor = conn.cursor()
+        placeholders = ", ".join("?" for _ in routes)
+        cursor.execute(
+            "SELECT INVOICE_NO, CUSTOMER_NO, CUSTOMER, ADDRESS, CITY, STATE, "
+            "ZIP, PO_NUM, ROUTE, STOP, PICK_AREA, LABELS "
+            "FROM longmod.vbatch_labels "
+            f"WHERE TRIM(ROUTE) IN ({placeholders}) "
+            "ORDER BY ROUTE, PICK_AREA, STOP",
+            tuple(routes),
+        )
+        return rows.fetch(cursor)
     finally:
         conn.close()
 
 
+@metrics.db_query("search_customers")
+@offloaded
 def search_customers(term):
     """Search vbatch_labels by customer name or number."""
     conn = get_connection()
@@ -89,12 +190,13 @@ def search_customers(term):
                 "ORDER BY ROUTE, STOP",
                 (like_term,),
             )
-        columns = [desc[0] for desc in cursor.description]
-        return [_strip_row(columns, row) for row in cursor.fetchall()]
+        return rows.fetch(cursor)
     finally:
         conn.close()
 
 
+@metrics.db_query("search_oneoff_customers")
+@offloaded
 def search_oneoff_customers(term):
     """Fallback search in VONEOFF_LASTSTOP for ad hoc labels."""
     conn = get_connection()
@@ -119,97 +221,174 @@ def search_oneoff_customers(term):
                 "ORDER BY CUSTOMER",
                 (like_term,),
             )
-        columns = [desc[0] for desc in cursor.description]
-        return [_strip_row(columns, row) for row in cursor.fetchall()]
+        return rows.fetch(cursor)
     finally:
         conn.close()
 
 
-def get_pick_list(customer_no, region=None):
-    """Get pick list items from longmod.picks for a customer.
+@metrics.db_query("all_batch_labels")
+@offloaded
+def get_all_batch_labels():
+    """All vbatch_labels rows with the search_customers() columns (for the search index)."""
+    conn = get_connection()
+    try:
+        cursor = conn.cursor()
+        cursor.execute(
+            "SELECT INVOICE_NO, CUSTOMER_NO, CUSTOMER, ADDRESS, CITY, STATE, "
+            "ZIP, PO_NUM, ROUTE, STOP, PICK_AREA, LABELS "
+            "FROM longmod.vbatch_labels "
+            "ORDER BY ROUTE, STOP"
+        )
+        return rows.fetch(cursor)
+    finally:
+        conn.close()
 
-    Args:
-        customer_no: Customer number (e.g., 20815)
-        region: Optional region/department filter (e.g., 'MW' for Main Warehouse M-Z)
 
-    Returns:
-        List of dicts with pick list data, ordered by derived region, LOCATION.
-        Region is derived from first letter of LOCATION (slot) since Route 10
-        defaults REGION to 'CC' instead of the actual pick area.
-        Locations starting with M-Z are grouped as 'MW' (Main Warehouse).
-    """
+@metrics.db_query("all_oneoff_customers")
+@offloaded
+def get_all_oneoff_customers():
+    """All VONEOFF_LASTSTOP rows with the search_oneoff_customers() columns."""
     conn = get_connection()
     try:
         cursor = conn.cursor()
-        # Derive region from first letter of LOCATION
-        # M-Z locations grouped as 'MW' (Main Warehouse)
-        region_expr = (
-            "CASE WHEN SUBSTR(LOCATION, 1, 1) >= 'M' "
-            "THEN 'MW' ELSE SUBSTR(LOCATION, 1, 1) END"
+        cursor.execute(
+            "SELECT CUSTOMER_NO, CUSTOMER, ADDRESS, CITY, STATE_CD, ZIP, "
+            "ROUTE, STOP "
+            "FROM longmod.VONEOFF_LASTSTOP "
+            "ORDER BY CUSTOMER"
         )
-        if region:
-            if region == "MW":
-                cursor.execute(
-                    f"SELECT CUSTNO, INVOICE, LINENO, CUSTPO, SKU, QTY2, SIZE, "
-                    f"DESCRIPTION, {region_expr} AS REGION, LOCATION, ORDERED, SHIPPED "
-                    f"FROM longmod.picks "
-                    f"WHERE CUSTNO = ? AND SUBSTR(LOCATION, 1, 1) >= 'M' "
-                    f"ORDER BY LOCATION",
-                    (customer_no,),
-                )
-            else:
-                cursor.execute(
-                    f"SELECT CUSTNO, INVOICE, LINENO, CUSTPO, SKU, QTY2, SIZE, "
-                    f"DESCRIPTION, {region_expr} AS REGION, LOCATION, ORDERED, SHIPPED "
-                    f"FROM longmod.picks "
-                    f"WHERE CUSTNO = ? AND SUBSTR(LOCATION, 1, 1) = ? "
-                    f"ORDER BY LOCATION",
-                    (customer_no, region),
-                )
-        else:
-            cursor.execute(
-                f"SELECT CUSTNO, INVOICE, LINENO, CUSTPO, SKU, QTY2, SIZE, "
-                f"DESCRIPTION, {region_expr} AS REGION, LOCATION, ORDERED, SHIPPED "
-                f"FROM longmod.picks "
-                f"WHERE CUSTNO = ? "
-                f"ORDER BY {region_expr}, LOCATION",
-                (customer_no,),
-            )
-        columns = [desc[0] for desc in cursor.description]
-        return [_strip_row(columns, row) for row in cursor.fetchall()]
+        return rows.fetch(cursor)
     finally:
         conn.close()
 
 
-def get_label_counts_for_20815_by_invoice(customer_no):
-    """Calculate label counts for customer 20815 by invoice based on picks.
+_EBCDIC_M = "M".encode("cp037")
 
-    Rules:
-    - M-Z locations (Main Warehouse): 1 label per unit shipped
-    - All other locations: 1 label per 6 units shipped (rounded up)
 
-    Returns:
-        Dict mapping invoice number to label count.
+def ebcdic_key(text):
+    """Sort key that orders text the way DB2 on the iSeries does (EBCDIC)."""
+    return text.encode("cp037", "replace")
+
+
+def pick_region(location):
+    """Derive the pick region from a slot LOCATION.
+
+    Region is the first letter of LOCATION, except that locations from 'M'
+    up are grouped as 'MW' (Main Warehouse). This mirrors the DB2
+    expression ``SUBSTR(LOCATION, 1, 1) >= 'M'``, which the iSeries
+    evaluates in EBCDIC, where digits sort after letters, so numeric slots
+    are Main Warehouse too.
+    """
+    first = location[:1] if location else " "
+    if first.encode("cp037", "replace") >= _EBCDIC_M:
+        return "MW"
+    return first
+
+
+@cached("picks", ttl=CACHE_CUSTOMERS_TTL)
+def get_picks(customer_no):
+    """Get every longmod.picks row for a customer in one query.
+
+    Each row gets a derived REGION (see pick_region()). Rows are ordered
+    by LOCATION; partition_picks() groups them by region for printing and
+    label_counts_by_invoice() aggregates them for label counts, so a 20815
+    workflow needs a single DB round trip (none when the customer is in
+    the local replica). ``customer_no`` is an int on every path, so one
+    cache entry serves the routes, the warm-up and the replica.
     """
+    picks = _from_replica(replica.picks, customer_no)
+    return picks if picks is not None else fetch_picks(customer_no)
+
+
+@metrics.db_query("picks")
+@offloaded
+def fetch_picks(customer_no):
+    """get_picks() straight from DB2, bypassing the cache and replica."""
     conn = get_connection()
     try:
         cursor = conn.cursor()
-        # Calculate labels per invoice: M-Z = 1 per unit, others = ceil(shipped/6)
         cursor.execute(
-            "SELECT INVOICE, "
-            "SUM(CASE WHEN SUBSTR(LOCATION, 1, 1) >= 'M' THEN SHIPPED "
-            "ELSE CEILING(CAST(SHIPPED AS DECIMAL(10,2)) / 6) END) AS LABEL_COUNT "
+            "SELECT CUSTNO, INVOICE, LINENO, CUSTPO, SKU, QTY2, SIZE, "
+            "DESCRIPTION, LOCATION, ORDERED, SHIPPED "
             "FROM longmod.picks "
             "WHERE CUSTNO = ? "
-            "GROUP BY INVOICE",
+            "ORDER BY LOCATION",
             (customer_no,),
         )
-        return {
-            str(row.INVOICE).strip(): int(row.LABEL_COUNT or 1)
-            for row in cursor.fetchall()
-        }
+        picks = rows.fetch(cursor)
     finally:
         conn.close()
+    for row in picks:
+        row["REGION"] = pick_region(row.get("LOCATION"))
+    return picks
+
+
+def partition_picks(picks):
+    """Group pick rows by REGION.
+
+    Returns:
+        Dict of region -> items, with regions in DB2 (EBCDIC) order and
+        items in LOCATION order.
+    """
+    regions = {}
+    for row in picks:
+        regions.setdefault(row["REGION"], []).append(row)
+    return {region: regions[region] for region in sorted(regions, key=ebcdic_key)}
+
+
+def label_counts_by_invoice(picks):
+    """Calculate label counts per invoice from pick rows.
+
+    Rules:
+    - M-Z locations (Main Warehouse): 1 label per unit shipped
+    - All other locations: 1 label per 6 units shipped (rounded up)
+
+    Returns:
+        Dict mapping invoice number to label count.
+    """
+    totals = {}
+    for row in picks:
+        invoice = str(row.get("INVOICE")).strip()
+        shipped = row.get("SHIPPED")
+        if shipped is None:
+            totals.setdefault(invoice, None)
+            continue
+        if row["REGION"] == "MW":
+            labels = shipped
+        else:
+            labels = math.ceil(Decimal(shipped) / 6)
+        totals[invoice] = (totals.get(invoice) or 0) + labels
+    return {invoice: int(total or 1) for invoice, total in totals.items()}
+
+
+def get_pick_list(customer_no, region=None):
+    """Get pick list items from longmod.picks for a customer.
+
+    Args:
+        customer_no: Customer number (e.g., 20815)
+        region: Optional region/department filter (e.g., 'MW' for Main Warehouse M-Z)
+
+    Returns:
+        List of dicts with pick list data, ordered by derived region, LOCATION.
+        Region is derived from first letter of LOCATION (slot) since Route 10
+        defaults REGION to 'CC' instead of the actual pick area.
+        Locations starting with M-Z are grouped as 'MW' (Main Warehouse).
+    """
+    regions = partition_picks(get_picks(customer_no))
+    if region:
+        return regions.get(region, [])
+    return [row for items in regions.values() for row in items]
+
+
+def get_label_counts_for_20815_by_invoice(customer_no):
+    """Calculate label counts for customer 20815 by invoice based on picks.
+
+    See label_counts_by_invoice() for the rules.
+
+    Returns:
+        Dict mapping invoice number to label count.
+    """
+    return label_counts_by_invoice(get_picks(customer_no))
 
 
 def get_pick_list_regions(customer_no):
@@ -218,18 +397,4 @@ def get_pick_list_regions(customer_no):
     Region is derived from first letter of LOCATION (slot).
     Locations starting with M-Z are grouped as 'MW' (Main Warehouse).
     """
-    conn = get_connection()
-    try:
-        cursor = conn.cursor()
-        cursor.execute(
-            "SELECT DISTINCT "
-            "CASE WHEN SUBSTR(LOCATION, 1, 1) >= 'M' "
-            "THEN 'MW' ELSE SUBSTR(LOCATION, 1, 1) END AS REGION "
-            "FROM longmod.picks "
-            "WHERE CUSTNO = ? "
-            "ORDER BY REGION",
-            (customer_no,),
-        )
-        return [row.REGION for row in cursor.fetchall()]
-    finally:
-        conn.close()
+    return list(partition_picks(get_picks(customer_no)))
@@ -0,0 +1,55 @@
+import time
+
+from app.config import LABEL_FORMAT_STORE, LABEL_FORMAT_DEVICE, LABEL_FORMAT_CHECK_INTERVAL
+from app.services.connections import get_connection
+from app.services.printer import query_printer, send_zpl, set_printer_formats
+from app.services.zpl import stored_format_downloads
+
+# printer ip -> (connection, connect count, format paths, checked at) of the last check
+_checked = {}
+
+
+def ensure_formats(printer):
+    """Make sure ``printer`` holds the current stored label formats.
+
+    The printer's directory is listed (^HW) and any missing or outdated
+    format is downloaded. A listing is trusted for as long as the same
+    socket stays open, up to LABEL_FORMAT_CHECK_INTERVAL: a reboot that
+    wiped R: drops the connection, so the next job after a reconnect lists
+    the directory again instead of every job paying for the round trip.
+    The versions present are recorded on the printer's entry in
+    printers.json.
+
+    Returns:
+        True if print jobs can recall the stored formats (^XF), False if
+        stored formats are disabled and full formats should be sent.
+
+    Raises:
+        OSError if the printer cannot be reached.
+    """
+    if not LABEL_FORMAT_STORE:
+        return False
+
+    downloads = stored_format_downloads()
+    versions = {layout: path for layout, (path, _) in downloads.items()}
+    conn = get_connection(printer["ip"])
+    with conn.lock:
+        checked = _checked.get(printer["ip"])
+        if (
+            checked is not None
+            and checked[:3] == (conn, conn.session(), versions)
+            and time.monotonic() - checked[3] < LABEL_FORMAT_CHECK_INTERVAL
+        ):
+            return True
+
+        listing = query_printer(
+            printer["ip"], f"^XA^HW{LABEL_FORMAT_DEVICE}:*.ZPL^FS^XZ\n"
+        ).upper()
+        missing = [zpl for path, zpl in downloads.values() if path not in listing]
+        if missing:
+            send_zpl(printer["ip"], "".join(missing))
+        _checked[printer["ip"]] = (conn, conn.connects, versions, time.monotonic())
+
+    if printer.get("formats") != versions:
+        set_printer_formats(printer["name"], versions)
+    return True
@@ -0,0 +1,195 @@
+"""Printer status monitor.
+
+The process that dispatches print jobs (see spooler.py) polls every
+printer's host status (~HS) every PRINTER_STATUS_INTERVAL seconds and
+records the result in PRINTER_STATUS_FILE, shared by all workers. Print
+routes check it with choose() before queueing, so a job for a paused,
+out-of-media or unreachable printer is refused at once or sent to the
+printer's backup, instead of sitting in the spooler's retries.
+"""
+import logging
+import os
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from app.config import (
+    PRINTER_STATUS_FILE,
+    PRINTER_STATUS_INTERVAL,
+    PRINTER_STATUS_MAX_AGE,
+)
+from app.services import localdb
+from app.services.connections import get_connection
+from app.services.printer import get_printer, get_printers
+
+log = logging.getLogger(__name__)
+
+READY = "ready"
+OFFLINE = "offline"
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS printer_status (
+    name     TEXT PRIMARY KEY,
+    ip       TEXT NOT NULL,
+    state    TEXT NOT NULL,
+    problems TEXT NOT NULL DEFAULT '',
+    latency  REAL,
+    checked  REAL NOT NULL,
+    error    TEXT
+);
+"""
+
+_started_pid = None
+
+
+def _db():
+    return localdb.connect(PRINTER_STATUS_FILE, _SCHEMA)
+
+
+def parse_host_status(reply):
+    """Parse a ~HS reply into a list of problems (empty when ready).
+
+    The reply is three STX...ETX framed strings; the flags used are paper
+    out, pause and buffer full from the first and head open and ribbon
+    out from the second.
+
+    Raises:
+        ValueError if the reply is incomplete.
+    """
+    strings = re.findall(r"\x02([^\x03]*)\x03", reply)
+    if len(strings) < 2:
+        raise ValueError(f"incomplete host status reply {reply!r}")
+    first = strings[0].split(",")
+    second = strings[1].split(",")
+    if len(first) < 6 or len(second) < 4:
+        raise ValueError(f"unexpected host status reply {reply!r}")
+    flags = [
+        ("paper out", first[1]),
+        ("paused", first[2]),
+        ("buffer full", first[5]),
+        ("head open", second[2]),
+        ("ribbon out", second[3]),
+    ]
+    return [name for name, value in flags if value.strip() == "1"]
+
+
+def check(printer):
+    """Query one printer's host status now and record it.
+
+    Returns the status dict (see get_status()).
+    """
+    conn = get_connection(printer["ip"])
+    # A printer busy with a job answers when it is done; keep the last status
+    if not conn.lock.acquire(blocking=False):
+        return get_status(printer["name"])
+    started = time.monotonic()
+    try:
+        reply = conn.query(b"~HS", count=3).decode("ascii", "replace")
+        problems = parse_host_status(reply)
+    except (OSError, ValueError) as e:
+        conn.close()
+        state, problems, latency, error = OFFLINE, [], None, str(e)
+    else:
+        state = problems[0] if problems else READY
+        latency, error = time.monotonic() - started, None
+    finally:
+        conn.lock.release()
+
+    _db().execute(
+        "INSERT OR REPLACE INTO printer_status "
+        "(name, ip, state, problems, latency, checked, error) VALUES (?, ?, ?, ?, ?, ?, ?)",
+        (printer["name"], printer["ip"], state, ",".join(problems), latency, time.time(), error),
+    )
+    return get_status(printer["name"])
+
+
+def _status_dict(row):
+    name, ip, state, problems, latency, checked, error = row
+    return {
+        "name": name,
+        "ip": ip,
+        "state": state,
+        "problems": problems.split(",") if problems else [],
+        "latency": latency,
+        "checked": checked,
+        "error": error,
+        "ok": state == READY,
+    }
+
+
+def get_status(name):
+    """Return a printer's last status, or None if unknown or too old.
+
+    Keys: name, ip, state ("ready", "offline" or the first problem),
+    problems, latency (seconds, None if unreachable), checked, error, ok.
+    """
+    row = _db().execute(
+        "SELECT name, ip, state, problems, latency, checked, error "
+        "FROM printer_status WHERE name = ? AND checked > ?",
+        (name, time.time() - PRINTER_STATUS_MAX_AGE),
+    ).fetchone()
+    return _status_dict(row) if row else None
+
+
+def all_statuses():
+    """Return {printer name: status} for printers with a recent status."""
+    rows = _db().execute(
+        "SELECT name, ip, state, problems, latency, checked, error "
+        "FROM printer_status WHERE checked > ?",
+        (time.time() - PRINTER_STATUS_MAX_AGE,),
+    ).fetchall()
+    return {row[0]: _status_dict(row) for row in rows}
+
+
+def choose(printer):
+    """Pick the printer a job should go to.
+
+    A printer that is ready, or whose status is unknown, is used as is.
+    Otherwise the job goes to the printer's ``backup`` (from printers.json)
+    if that one is ready.
+
+    Returns:
+        (printer, message): printer is None when nothing can print the job;
+        message says why, or that the job was rerouted.
+    """
+    status = get_status(printer["name"])
+    if status is None or status["ok"]:
+        return printer, None
+    reason = f"{printer['name']} is {status['state']}"
+    backup = get_printer(printer.get("backup") or "")
+    if backup:
+        backup_status = get_status(backup["name"])
+        if backup_status is None or backup_status["ok"]:
+            return backup, f"{reason}; sent to backup printer {backup['name']}."
+    return None, f"{reason}. Fix the printer or choose another one."
+
+
+def start():
+    """Start polling printers from this process (idempotent).
+
+    Called by the spooler once it holds the dispatch lock, so only the
+    process that talks to printers polls them.
+    """
+    global _started_pid
+    if _started_pid == os.getpid():
+        return
+    _started_pid = os.getpid()
+    threading.Thread(target=_monitor, name="printer-status", daemon=True).start()
+
+
+def _monitor():
+    with ThreadPoolExecutor(max_workers=8, thread_name_prefix="printer-status") as pool:
+        while True:
+            try:
+                printers = get_printers()
+                # Unreachable printers wait out their connect timeout in parallel
+                list(pool.map(check, printers))
+                names = [p["name"] for p in printers]
+                _db().execute(
+                    "DELETE FROM printer_status WHERE name NOT IN (%s)" % ",".join("?" * len(names)),
+                    names,
+                )
+            except Exception:
+                log.exception("printer status poll failed")
+            time.sleep(PRINTER_STATUS_INTERVAL)
@@ -0,0 +1,56 @@
+import os
+import sqlite3
+import threading
+import time
+
+_local = threading.local()
+
+
+def connect(path, schema=None, columns=()):
+    """Return this thread's SQLite connection to ``path``.
+
+    Connections are per thread and per process (re-opened after a fork),
+    in autocommit mode with WAL so gunicorn workers can share the file.
+    ``schema`` is run once when the connection is first opened, then
+    ``columns`` — (table, column, declaration) tuples added to the schema
+    later — are added to tables created before them.
+    """
+    conns = getattr(_local, "conns", None)
+    if conns is None or getattr(_local, "pid", None) != os.getpid():
+        conns = _local.conns = {}
+        _local.pid = os.getpid()
+    conn = conns.get(path)
+    if conn is None:
+        conn = sqlite3.connect(path, timeout=10, isolation_level=None)
+        _enable_wal(conn)
+        conn.execute("PRAGMA synchronous=NORMAL")
+        if schema:
+            conn.executescript(schema)
+        for table, column, declaration in columns:
+            _add_column(conn, table, column, declaration)
+        conns[path] = conn
+    return conn
+
+
+def _add_column(conn, table, column, declaration):
+    if any(row[1] == column for row in conn.execute(f"PRAGMA table_info({table})")):
+        return
+    try:
+        conn.execute(f"ALTER TABLE {table} ADD COLUMN {column} {declaration}")
+    except sqlite3.OperationalError as e:
+        # Another process added it first
+        if "duplicate column" not in str(e):
+            raise
+
+
+def _enable_wal(conn, attempts=50):
+    # Switching a new file to WAL fails at once, without waiting on the
+    # busy timeout, while another process is doing the same
+    for attempt in range(attempts):
+        try:
+            conn.execute("PRAGMA journal_mode=WAL")
+            return
+        except sqlite3.OperationalError:
+            if attempt == attempts - 1:
+                raise
+            time.sleep(0.1)
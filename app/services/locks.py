@@ -0,0 +1,31 @@
+import contextlib
+import fcntl
+import os
+
+
+def try_acquire(path):
+    """Take an exclusive lock on ``path`` without blocking.
+
+    Returns the open file descriptor (keep it to hold the lock), or None
+    if another process holds it. The lock is released when the process
+    exits.
+    """
+    fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+    try:
+        fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError:
+        os.close(fd)
+        return None
+    return fd
+
+
+@contextlib.contextmanager
+def file_lock(path):
+    """Hold an exclusive lock on ``path`` for the duration of the block."""
+    fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+    try:
+        fcntl.flock(fd, fcntl.LOCK_EX)
+        yield
+    finally:
+        fcntl.flock(fd, fcntl.LOCK_UN)
+        os.close(fd)
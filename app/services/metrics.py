@@ -0,0 +1,332 @@
+"""Prometheus metrics shared by all gunicorn workers.
+
+Counters and histograms are accumulated in memory per process and added
+into METRICS_FILE (SQLite) every METRICS_FLUSH_INTERVAL seconds, so the
+stored values are totals over every worker. /metrics flushes the serving
+worker first and renders the totals in the Prometheus text format; the
+other workers' last few seconds show up on the next scrape.
+"""
+import atexit
+import bisect
+import functools
+import inspect
+import logging
+import os
+import threading
+import time
+
+from app.config import METRICS_FILE, METRICS_FLUSH_INTERVAL
+from app.services import localdb
+
+log = logging.getLogger(__name__)
+
+# Latency buckets in seconds, from a cached render to a slow DB2 scan
+BUCKETS = (0.0005, 0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+# name -> (type, help)
+METRICS = {
+    "labelprinter_db_query_seconds": ("histogram", "DB2 query latency by query."),
+    "labelprinter_db_rows_total": ("counter", "Rows returned by DB2 queries."),
+    "labelprinter_db_errors_total": ("counter", "DB2 queries that raised."),
+    "labelprinter_render_seconds": ("histogram", "ZPL render latency by function."),
+    "labelprinter_send_seconds": ("histogram", "Time to send ZPL to a printer."),
+    "labelprinter_sent_bytes_total": ("counter", "Bytes of ZPL sent by printer."),
+    "labelprinter_send_errors_total": ("counter", "Failed sends by printer."),
+    "labelprinter_job_labels": ("histogram", "Labels per completed print job."),
+    "labelprinter_jobs_total": ("counter", "Print jobs finished by printer, route and status."),
+    "labelprinter_print_errors_total": ("counter", "Batch print requests that failed, by route and reason."),
+    "labelprinter_http_request_seconds": ("histogram", "Request latency by endpoint."),
+    "labelprinter_http_errors_total": ("counter", "5xx responses by endpoint."),
+}
+
+# Histograms that are not latencies
+HISTOGRAM_BUCKETS = {
+    "labelprinter_job_labels": (1, 5, 10, 25, 50, 100, 250, 500, 1000),
+}
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS samples (
+    name   TEXT NOT NULL,
+    labels TEXT NOT NULL,
+    le     TEXT NOT NULL DEFAULT '',
+    value  REAL NOT NULL,
+    PRIMARY KEY (name, labels, le)
+);
+"""
+
+_pending = {}  # (sample name, label text, bucket bound) -> delta
+_histograms = []  # every thread's _Histogram, read by flush()
+_pending_lock = threading.Lock()
+_flusher_pid = None
+_pid = os.getpid()
+
+
+class _Histogram:
+    """One thread's running totals for one histogram series.
+
+    Only the owning thread updates it, so observing takes no lock: the
+    render path times every label and cannot afford one (or formatting
+    the sample keys) per call. flush() adds what changed since the last
+    flush; a total read mid-update is caught up by the next one.
+    """
+
+    __slots__ = ("bounds", "keys", "sum", "count", "buckets", "flushed")
+
+    def __init__(self, name, text):
+        self.bounds = HISTOGRAM_BUCKETS.get(name, BUCKETS)
+        les = [f"{bound:g}" for bound in self.bounds] + ["+Inf"]
+        self.keys = [(f"{name}_sum", text, ""), (f"{name}_count", text, "")] + [
+            (f"{name}_bucket", text, le) for le in les
+        ]
+        self.sum = 0.0
+        self.count = 0
+        self.buckets = [0] * len(les)
+        self.flushed = [0] * len(self.keys)
+
+    def take(self):
+        """Return the samples added since the last call as (key, delta)."""
+        totals = [self.sum, self.count] + self.buckets
+        deltas = [(key, total - last) for key, total, last in zip(self.keys, totals, self.flushed)]
+        self.flushed = totals
+        return [(key, delta) for key, delta in deltas if delta]
+
+
+class _Thread(threading.local):
+    spans = None  # list that also receives observations (see profiler.py)
+
+    def __init__(self):
+        self.histograms = {}  # (name, label text) -> _Histogram
+
+
+_thread = _Thread()
+
+
+def _forked():
+    global _pid, _pending_lock
+    _pid = os.getpid()
+    _pending_lock = threading.Lock()
+    # The forking thread's totals were the parent's to flush
+    _thread.histograms = {}
+
+
+os.register_at_fork(after_in_child=_forked)
+
+
+def _db():
+    return localdb.connect(METRICS_FILE, _SCHEMA)
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _label_text(labels):
+    """Render labels as 'a="1",b="2"' (without braces)."""
+    return ",".join(f'{k}="{_escape(v)}"' for k, v in sorted(labels.items()))
+
+
+def _start_flusher():
+    """Start this process's flush thread; call with _pending_lock held."""
+    global _flusher_pid
+    if _flusher_pid != _pid:
+        # Samples inherited across a fork were the parent's to flush
+        _pending.clear()
+        del _histograms[:]
+        _flusher_pid = _pid
+        threading.Thread(target=_flush_loop, name="metrics", daemon=True).start()
+
+
+def _add(samples):
+    with _pending_lock:
+        _start_flusher()
+        for key, delta in samples:
+            _pending[key] = _pending.get(key, 0) + delta
+
+
+def inc(name, amount=1, **labels):
+    """Add ``amount`` to a counter."""
+    _add([((name, _label_text(labels), ""), amount)])
+
+
+def observe(name, value, **labels):
+    """Record ``value`` in a histogram."""
+    _observe(name, _label_text(labels), value)
+
+
+def _observe(name, text, value):
+    thread = _thread
+    if thread.spans is not None:
+        thread.spans.append((name, text, value))
+    histogram = thread.histograms.get((name, text))
+    if histogram is None:
+        histogram = thread.histograms[(name, text)] = _Histogram(name, text)
+        with _pending_lock:
+            _start_flusher()
+            _histograms.append(histogram)
+    histogram.sum += value
+    histogram.count += 1
+    histogram.buckets[bisect.bisect_left(histogram.bounds, value)] += 1
+
+
+def start_capture():
+    """Also collect this thread's observations as (name, labels, value) in a list.
+
+    Returns the list; stop with stop_capture().
+    """
+    _thread.spans = []
+    return _thread.spans
+
+
+def stop_capture():
+    _thread.spans = None
+
+
+def timed(name, **labels):
+    """Decorator recording a function's latency in histogram ``name``.
+
+    A generator function is timed over the whole iteration, counting only
+    the time spent inside it (not in the consumer between items), and
+    recorded once when it finishes or is closed.
+    """
+    text = _label_text(labels)
+    key = (name, text)
+    perf_counter = time.perf_counter
+
+    def decorator(fn):
+        if inspect.isgeneratorfunction(fn):
+            @functools.wraps(fn)
+            def generator(*args, **kwargs):
+                elapsed = 0.0
+                started = time.perf_counter()
+                items = fn(*args, **kwargs)
+                try:
+                    while True:
+                        try:
+                            item = next(items)
+                        except StopIteration:
+                            return
+                        finally:
+                            elapsed += time.perf_counter() - started
+                        yield item
+                        started = time.perf_counter()
+                finally:
+                    items.close()
+                    _observe(name, text, elapsed)
+            return generator
+
+        @functools.wraps(fn)
+        def wrapped(*args, **kwargs):
+            started = perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                elapsed = perf_counter() - started
+                histogram = _thread.histograms.get(key)
+                if histogram is None or _thread.spans is not None:
+                    _observe(name, text, elapsed)
+                else:
+                    # _observe() inlined: this wraps per-label rendering
+                    histogram.sum += elapsed
+                    histogram.count += 1
+                    histogram.buckets[bisect.bisect_left(histogram.bounds, elapsed)] += 1
+        return wrapped
+    return decorator
+
+
+def db_query(query):
+    """Decorator for DB2 query functions: latency, rows returned and errors."""
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapped(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                result = fn(*args, **kwargs)
+            except Exception:
+                inc("labelprinter_db_errors_total", query=query)
+                raise
+            finally:
+                observe("labelprinter_db_query_seconds", time.perf_counter() - started, query=query)
+            if isinstance(result, (list, dict)):
+                inc("labelprinter_db_rows_total", len(result), query=query)
+            return result
+        return wrapped
+    return decorator
+
+
+def flush():
+    """Add this process's pending samples into the shared store."""
+    with _pending_lock:
+        pending = list(_pending.items())
+        _pending.clear()
+        for histogram in _histograms:
+            pending.extend(histogram.take())
+    if not pending:
+        return
+    db = _db()
+    db.execute("BEGIN IMMEDIATE")
+    try:
+        db.executemany(
+            "INSERT INTO samples (name, labels, le, value) VALUES (?, ?, ?, ?) "
+            "ON CONFLICT (name, labels, le) DO UPDATE SET value = value + excluded.value",
+            [key + (delta,) for key, delta in pending],
+        )
+        db.execute("COMMIT")
+    except BaseException:
+        db.execute("ROLLBACK")
+        # Keep the samples for the next flush
+        with _pending_lock:
+            for key, delta in pending:
+                _pending[key] = _pending.get(key, 0) + delta
+        raise
+
+
+def _flush_loop():
+    atexit.register(_flush_quietly)
+    while True:
+        time.sleep(METRICS_FLUSH_INTERVAL)
+        _flush_quietly()
+
+
+def _flush_quietly():
+    try:
+        flush()
+    except Exception:
+        log.exception("metrics flush failed")
+
+
+def _braces(text):
+    return "{" + text + "}" if text else ""
+
+
+def _number(value):
+    return str(int(value)) if value == int(value) else repr(value)
+
+
+def render():
+    """Return every metric in the Prometheus text exposition format."""
+    flush()
+    values = {}
+    for name, labels, le, value in _db().execute("SELECT name, labels, le, value FROM samples"):
+        values[(name, labels, le)] = value
+    lines = []
+    for metric, (kind, help_text) in METRICS.items():
+        lines.append(f"# HELP {metric} {help_text}")
+        lines.append(f"# TYPE {metric} {kind}")
+        if kind == "counter":
+            for (name, labels, _), value in sorted(values.items()):
+                if name == metric:
+                    lines.append(f"{metric}{_braces(labels)} {_number(value)}")
+            continue
+        # Buckets are stored per bucket; Prometheus wants them cumulative
+        bounds = [f"{b:g}" for b in HISTOGRAM_BUCKETS.get(metric, BUCKETS)] + ["+Inf"]
+        series = sorted({labels for name, labels, _ in values if name == metric + "_count"})
+        for labels in series:
+            total = 0
+            for le in bounds:
+                total += values.get((metric + "_bucket", labels, le), 0)
+                bucket_labels = ",".join(filter(None, [labels, f'le="{le}"']))
+                lines.append(f"{metric}_bucket{{{bucket_labels}}} {_number(total)}")
+            for suffix in ("_sum", "_count"):
+                value = values.get((metric + suffix, labels, ""), 0)
+                lines.append(f"{metric}{suffix}{_braces(labels)} {_number(value)}")
+    return "\n".join(lines) + "\n"
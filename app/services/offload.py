@@ -0,0 +1,89 @@
+"""Run blocking DB2 calls on a bounded pool of OS threads.
+
+pyodbc blocks the calling thread for the whole round trip to the
+iSeries. Query functions decorated with @offloaded run on at most
+DB2_THREADS threads per process, so a burst of threaded (gthread) requests
+queues for DB2 instead of opening overflow connections, and under gevent
+workers the calls run on real threads from gevent's hub thread pool
+instead of stalling every greenlet in the worker.
+
+A call made from a pool thread runs inline, so offloaded functions may
+call each other without waiting on themselves.
+"""
+import functools
+import os
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from app.config import DB2_THREADS
+
+_executor = None
+_executor_pid = None
+_executor_lock = threading.Lock()
+_local = threading.local()
+
+
+def _gevent_patched():
+    monkey = sys.modules.get("gevent.monkey")
+    return monkey is not None and monkey.is_module_patched("threading")
+
+
+def _mark_pool_thread():
+    _local.in_pool = True
+
+
+class _BoundedHubPool:
+    """Limit calls into gevent's hub thread pool to ``size`` at a time."""
+
+    def __init__(self, hub_pool, size):
+        from gevent.lock import BoundedSemaphore
+        self._hub_pool = hub_pool
+        self._slots = BoundedSemaphore(size)
+
+    def call(self, fn, *args, **kwargs):
+        with self._slots:
+            return self._hub_pool.apply(_pooled_call, (fn, args, kwargs))
+
+
+def _get_executor():
+    """Return this process's executor, creating it after a fork."""
+    global _executor, _executor_pid
+    pid = os.getpid()
+    if _executor is None or _executor_pid != pid:
+        with _executor_lock:
+            if _executor is None or _executor_pid != pid:
+                if _gevent_patched():
+                    import gevent
+                    hub_pool = gevent.get_hub().threadpool
+                    hub_pool.maxsize = max(hub_pool.maxsize, DB2_THREADS)
+                    _executor = _BoundedHubPool(hub_pool, DB2_THREADS)
+                else:
+                    _executor = ThreadPoolExecutor(
+                        max_workers=DB2_THREADS, thread_name_prefix="db2", initializer=_mark_pool_thread
+                    )
+                _executor_pid = pid
+    return _executor
+
+
+def _pooled_call(fn, args, kwargs):
+    _mark_pool_thread()
+    return fn(*args, **kwargs)
+
+
+def run(fn, *args, **kwargs):
+    """Call ``fn`` on the DB2 thread pool and return its result (or raise)."""
+    if getattr(_local, "in_pool", False):
+        return fn(*args, **kwargs)
+    executor = _get_executor()
+    if isinstance(executor, _BoundedHubPool):
+        return executor.call(fn, *args, **kwargs)
+    return executor.submit(fn, *args, **kwargs).result()
+
+
+def offloaded(fn):
+    """Decorator: run ``fn`` on the DB2 thread pool (see run())."""
+    @functools.wraps(fn)
+    def wrapped(*args, **kwargs):
+        return run(fn, *args, **kwargs)
+    return wrapped
@@ -0,0 +1,202 @@
+import threading
+import time
+from collections import deque
+
+
+class PooledConnection:
+    """Connection handed out by the pool.
+
+    Behaves like the underlying DB-API connection, except that close()
+    hands it back to the pool instead of signing off.
+    """
+
+    def __init__(self, pool, conn, pooled=True):
+        self._pool = pool
+        self._conn = conn
+        self._pooled = pooled
+        self._released = False
+
+    def __getattr__(self, name):
+        return getattr(self._conn, name)
+
+    def close(self):
+        if self._released:
+            return
+        self._released = True
+        self._pool._release(self._conn, self._pooled)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+
+def _close_quietly(conn):
+    try:
+        conn.close()
+    except Exception:
+        pass
+
+
+class ConnectionPool:
+    """Thread-safe pool of DB-API connections.
+
+    Args:
+        connect: callable returning a new connection.
+        min_size: connections kept open even when idle.
+        max_size: pooled connections allowed open at once.
+        idle_timeout: seconds an idle connection is kept above min_size.
+        wait_timeout: seconds to wait for a free connection when the pool
+            is exhausted before opening a one-off overflow connection.
+        ping_sql: cheap query used to check a connection on checkout.
+    """
+
+    def __init__(self, connect, min_size=1, max_size=4, idle_timeout=300,
+                 wait_timeout=2.0, ping_sql=None):
+        self._connect = connect
+        self.min_size = max(0, min_size)
+        self.max_size = max(1, max_size, self.min_size)
+        self.idle_timeout = idle_timeout
+        self.wait_timeout = wait_timeout
+        self.ping_sql = ping_sql
+
+        self._cond = threading.Condition()
+        self._idle = deque()  # (conn, released_at), most recently used on the right
+        self._size = 0  # pooled connections open, idle or checked out
+        self._stats = {
+            "hits": 0,
+            "misses": 0,
+            "waits": 0,
+            "wait_seconds": 0.0,
+            "overflow": 0,
+            "discarded": 0,
+            "evicted": 0,
+        }
+
+    def acquire(self):
+        """Check out a live connection, reconnecting as needed."""
+        started = time.monotonic()
+        waited = False
+        while True:
+            stale = []
+            with self._cond:
+                stale = self._evict_idle()
+                if self._idle:
+                    conn, _ = self._idle.pop()
+                    source = "hit"
+                elif self._size < self.max_size:
+                    self._size += 1
+                    conn = None
+                    source = "miss"
+                else:
+                    remaining = self.wait_timeout - (time.monotonic() - started)
+                    if remaining > 0:
+                        if not waited:
+                            waited = True
+                            self._stats["waits"] += 1
+                        self._cond.wait(remaining)
+                        continue
+                    conn = None
+                    source = "overflow"
+                if waited:
+                    self._stats["wait_seconds"] += time.monotonic() - started
+                    waited = False
+            for old in stale:
+                _close_quietly(old)
+
+            if source == "hit":
+                if self._is_alive(conn):
+                    self._count("hits")
+                    return PooledConnection(self, conn)
+                _close_quietly(conn)
+                with self._cond:
+                    self._size -= 1
+                    self._stats["discarded"] += 1
+                    self._cond.notify()
+                continue
+
+            if source == "miss":
+                try:
+                    conn = self._connect()
+                except Exception:
+                    with self._cond:
+                        self._size -= 1
+                        self._cond.notify()
+                    raise
+                self._count("misses")
+                return PooledConnection(self, conn)
+
+            conn = self._connect()
+            self._count("overflow")
+            return PooledConnection(self, conn, pooled=False)
+
+    def stats(self):
+        """Return a snapshot of pool counters and current size."""
+        with self._cond:
+            stats = dict(self._stats)
+            stats["size"] = self._size
+            stats["idle"] = len(self._idle)
+            stats["in_use"] = self._size - len(self._idle)
+            stats["min_size"] = self.min_size
+            stats["max_size"] = self.max_size
+        stats["wait_seconds"] = round(stats["wait_seconds"], 3)
+        return stats
+
+    def close_all(self):
+        """Close every idle connection; checked-out ones close on release."""
+        with self._cond:
+            idle = [conn for conn, _ in self._idle]
+            self._idle.clear()
+            self._size -= len(idle)
+            self._cond.notify_all()
+        for conn in idle:
+            _close_quietly(conn)
+
+    def _release(self, conn, pooled):
+        if not pooled:
+            _close_quietly(conn)
+            return
+        try:
+            conn.rollback()  # end the read transaction; fails if the link is gone
+            healthy = True
+        except Exception:
+            healthy = False
+        with self._cond:
+            if healthy:
+                self._idle.append((conn, time.monotonic()))
+            else:
+                self._size -= 1
+                self._stats["discarded"] += 1
+            self._cond.notify()
+        if not healthy:
+            _close_quietly(conn)
+
+    def _evict_idle(self):
+        """Pop connections idle past the timeout. Caller holds the lock."""
+        stale = []
+        cutoff = time.monotonic() - self.idle_timeout
+        while self._idle and self._size > self.min_size and self._idle[0][1] < cutoff:
+            conn, _ = self._idle.popleft()
+            self._size -= 1
+            self._stats["evicted"] += 1
+            stale.append(conn)
+        return stale
+
+    def _is_alive(self, conn):
+        if not self.ping_sql:
+            return True
+        try:
+            cursor = conn.cursor()
+            try:
+                cursor.execute(self.ping_sql)
+                cursor.fetchall()
+            finally:
+                cursor.close()
+            return True
+        except Exception:
+            return False
+
+    def _count(self, key):
+        with self._cond:
+            self._stats[key] += 1
@@ -1,65 +1,123 @@
-import json
-import os
-import socket
+import time
 
-from app.config import PRINTERS_FILE, PRINTER_PORT, PRINTER_TIMEOUT
+from app.config import PRINTER_SEND_BUFFER
+from app.services import metrics, registry
+from app.services.connections import get_connection
 
 
-# --- JSON config CRUD ---
-
-def _load_printers():
-    if not os.path.exists(PRINTERS_FILE):
-        return []
-    with open(PRINTERS_FILE, "r") as f:
-        return json.load(f)
-
-
-def _save_printers(printers):
-    with open(PRINTERS_FILE, "w") as f:
-        json.dump(printers, f, indent=4)
-
+# --- JSON config CRUD (cached in memory by registry.py) ---
 
 def get_printers():
-    return _load_printers()
+    return registry.all_printers()
 
 
 def get_printer(name):
-    for p in _load_printers():
-        if p["name"] == name:
-            return p
-    return None
+    return registry.get(name)
 
 
 def add_printer(name, ip):
-    printers = _load_printers()
-    printers.append({"name": name, "ip": ip})
-    _save_printers(printers)
-
-
-def update_printer(old_name, name, ip):
-    printers = _load_printers()
-    for p in printers:
-        if p["name"] == old_name:
-            p["name"] = name
-            p["ip"] = ip
-            break
-    _save_printers(printers)
+    registry.update(lambda printers: printers.append({"name": name, "ip": ip}))
+
+
+def update_printer(old_name, name, ip, backup=None):
+    def change(printers):
+        for p in printers:
+            if p["name"] == old_name:
+                p["name"] = name
+                p["ip"] = ip
+                if backup:
+                    p["backup"] = backup
+                else:
+                    p.pop("backup", None)
+            elif p.get("backup") == old_name:
+                p["backup"] = name
+    registry.update(change)
+
+
+def set_printer_formats(name, formats):
+    """Record which stored format versions a printer holds."""
+    def change(printers):
+        for p in printers:
+            if p["name"] == name:
+                p["formats"] = formats
+                break
+    registry.update(change)
 
 
 def delete_printer(name):
-    printers = _load_printers()
-    printers = [p for p in printers if p["name"] != name]
-    _save_printers(printers)
+    registry.update(lambda printers: [p for p in printers if p["name"] != name])
 
 
 # --- TCP socket printing ---
 
+def _printer_label(ip):
+    """Printer name for metrics (the IP if it is not registered)."""
+    for p in registry.all_printers():
+        if p["ip"] == ip:
+            return p["name"]
+    return ip
+
+
+def _record_send(ip, started, sent, error):
+    printer = _printer_label(ip)
+    metrics.observe("labelprinter_send_seconds", time.perf_counter() - started, printer=printer)
+    if sent:
+        metrics.inc("labelprinter_sent_bytes_total", sent, printer=printer)
+    if error:
+        metrics.inc("labelprinter_send_errors_total", printer=printer)
+
+
 def send_zpl(ip, zpl_data):
-    """Send ZPL data to a Zebra printer via raw TCP socket on port 9100."""
-    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-    sock.settimeout(PRINTER_TIMEOUT)
+    """Send ZPL data to a Zebra printer via raw TCP on port 9100.
+
+    Uses the printer's persistent connection (see connections.py), so
+    back-to-back jobs reuse one socket.
+    """
+    data = zpl_data.encode("utf-8")
+    conn = get_connection(ip)
+    started = time.perf_counter()
+    try:
+        with conn.lock:
+            conn.send(data)
+    except OSError:
+        _record_send(ip, started, 0, True)
+        raise
+    _record_send(ip, started, len(data), False)
+
+
+def send_zpl_stream(ip, chunks, on_write=None):
+    """Stream ZPL byte chunks (e.g. from zpl.iter_label_batch) to a printer.
+
+    Labels are sent as they are rendered rather than after the whole job
+    is built. ``on_write`` is called with the bytes sent so far after each
+    write (see Connection.send_stream). Returns the number of bytes sent.
+    """
+    conn = get_connection(ip)
+    started = time.perf_counter()
+    written = [0]
+
+    def wrote(total):
+        written[0] = total
+        if on_write:
+            on_write(total)
+
     try:
-        sock.connect((ip, PRINTER_PORT))
-        sock.sendall(zpl_data.encode("utf-8"))
-    finally:
-        sock.close()
+        with conn.lock:
+            sent = conn.send_stream(chunks, PRINTER_SEND_BUFFER, wrote)
+    except Exception:
+        _record_send(ip, started, written[0], True)
+        raise
+    _record_send(ip, started, sent, False)
+    return sent
+
+
+def query_printer(ip, command, terminator=b"\x03"):
+    """Send a host query (e.g. ^HW, ~HS) and return the printer's reply.
+
+    Reads until ``terminator`` (ETX by default) arrives or the printer goes
+    quiet for PRINTER_TIMEOUT; connection errors are raised.
+    """
+    conn = get_connection(ip)
+    with conn.lock:
+        reply = conn.query(command.encode("utf-8"), terminator)
+    return reply.decode("ascii", "replace")
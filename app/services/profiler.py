@@ -0,0 +1,191 @@
+"""Opt-in request profiling and slow request log.
+
+Turned on by PROFILE_REQUESTS=1 or the toggle on the admin Profiles page.
+While on, each request (or a PROFILE_SAMPLE fraction of them) runs under
+cProfile and collects the DB2, render and printer send timings recorded
+by metrics.py. Requests slower than PROFILE_THRESHOLD are saved with their
+breakdown and the top functions by cumulative time; only the
+PROFILE_KEEP slowest are kept.
+"""
+import cProfile
+import io
+import json
+import pstats
+import random
+import time
+
+from flask import g, request
+
+from app.config import (
+    PROFILE_FILE,
+    PROFILE_REQUESTS,
+    PROFILE_SAMPLE,
+    PROFILE_THRESHOLD,
+    PROFILE_KEEP,
+)
+from app.services import localdb, metrics
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS profiles (
+    id        INTEGER PRIMARY KEY AUTOINCREMENT,
+    created   REAL NOT NULL,
+    method    TEXT NOT NULL,
+    path      TEXT NOT NULL,
+    endpoint  TEXT,
+    status    INTEGER,
+    duration  REAL NOT NULL,
+    breakdown TEXT NOT NULL,
+    spans     TEXT NOT NULL,
+    stats     TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS profiles_duration ON profiles (duration);
+CREATE TABLE IF NOT EXISTS settings (
+    key   TEXT PRIMARY KEY,
+    value
+);
+"""
+
+# Which breakdown bucket each metrics histogram counts towards
+_CATEGORIES = {
+    "labelprinter_db_query_seconds": "sql",
+    "labelprinter_render_seconds": "render",
+    "labelprinter_send_seconds": "socket",
+}
+
+_enabled_cache = (0.0, False)  # (checked at, enabled)
+
+
+def _db():
+    return localdb.connect(PROFILE_FILE, _SCHEMA)
+
+
+def is_enabled():
+    """True if profiling is on (env var or admin toggle, re-read every 5s)."""
+    global _enabled_cache
+    if PROFILE_REQUESTS:
+        return True
+    checked, enabled = _enabled_cache
+    if time.monotonic() - checked > 5:
+        row = _db().execute("SELECT value FROM settings WHERE key = 'enabled'").fetchone()
+        enabled = bool(row and row[0])
+        _enabled_cache = (time.monotonic(), enabled)
+    return enabled
+
+
+def set_enabled(enabled):
+    global _enabled_cache
+    _db().execute(
+        "INSERT OR REPLACE INTO settings (key, value) VALUES ('enabled', ?)", (int(enabled),)
+    )
+    _enabled_cache = (time.monotonic(), enabled)
+
+
+def init_app(app):
+    """Register the profiling hooks on ``app``."""
+    app.before_request(_start)
+    app.after_request(_finish)
+    app.teardown_request(_teardown)
+
+
+def _start():
+    if not is_enabled() or random.random() >= PROFILE_SAMPLE:
+        return
+    profile = cProfile.Profile()
+    try:
+        profile.enable()
+    except ValueError:
+        return  # another request in this process is already being profiled
+    g.profile = profile
+    g.profile_started = time.perf_counter()
+    g.profile_spans = metrics.start_capture()
+
+
+def _finish(response):
+    profile = g.pop("profile", None)
+    if profile is None:
+        return response
+    profile.disable()
+    metrics.stop_capture()
+    duration = time.perf_counter() - g.profile_started
+    if duration >= PROFILE_THRESHOLD:
+        _save(profile, duration, response.status_code, g.profile_spans)
+    return response
+
+
+def _teardown(exc):
+    # A request that raised past after_request still has its profiler on
+    profile = g.pop("profile", None)
+    if profile is not None:
+        profile.disable()
+        metrics.stop_capture()
+
+
+def _save(profile, duration, status, spans):
+    breakdown = {"sql": 0.0, "render": 0.0, "socket": 0.0}
+    for name, labels, seconds in spans:
+        category = _CATEGORIES.get(name)
+        if category:
+            breakdown[category] += seconds
+    breakdown["other"] = max(0.0, duration - sum(breakdown.values()))
+
+    out = io.StringIO()
+    pstats.Stats(profile, stream=out).sort_stats("cumulative").print_stats(40)
+
+    db = _db()
+    db.execute(
+        "INSERT INTO profiles (created, method, path, endpoint, status, duration, "
+        "breakdown, spans, stats) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+        (
+            time.time(),
+            request.method,
+            request.full_path.rstrip("?"),
+            request.endpoint,
+            status,
+            duration,
+            json.dumps(breakdown),
+            json.dumps([
+                [name, labels, seconds] for name, labels, seconds in spans
+                if name in _CATEGORIES
+            ]),
+            out.getvalue(),
+        ),
+    )
+    # Keep only the slowest PROFILE_KEEP
+    db.execute(
+        "DELETE FROM profiles WHERE id NOT IN "
+        "(SELECT id FROM profiles ORDER BY duration DESC LIMIT ?)",
+        (PROFILE_KEEP,),
+    )
+
+
+def _profile_dict(row, full=False):
+    keys = ["id", "created", "method", "path", "endpoint", "status", "duration", "breakdown"]
+    if full:
+        keys += ["spans", "stats"]
+    profile = dict(zip(keys, row))
+    profile["breakdown"] = json.loads(profile["breakdown"])
+    if full:
+        profile["spans"] = json.loads(profile["spans"])
+    return profile
+
+
+def list_profiles():
+    """Saved profiles, slowest first (without the full stats)."""
+    rows = _db().execute(
+        "SELECT id, created, method, path, endpoint, status, duration, breakdown "
+        "FROM profiles ORDER BY duration DESC"
+    ).fetchall()
+    return [_profile_dict(row) for row in rows]
+
+
+def get_profile(profile_id):
+    row = _db().execute(
+        "SELECT id, created, method, path, endpoint, status, duration, breakdown, spans, stats "
+        "FROM profiles WHERE id = ?",
+        (profile_id,),
+    ).fetchone()
+    return _profile_dict(row, full=True) if row else None
+
+
+def clear():
+    return _db().execute("DELETE FROM profiles").rowcount
@@ -0,0 +1,85 @@
+"""In-memory view of printers.json.
+
+The printer list is read on nearly every request (the printer dropdown is
+in the base template), so it is kept in memory with a name index and only
+re-read when the file's inode, mtime or size changes, e.g. after the other
+gunicorn worker saved it. Changes go through update(), which holds a
+cross-process file lock for the read-modify-write and replaces the file
+atomically.
+"""
+import json
+import os
+import threading
+
+from app.config import PRINTERS_FILE
+from app.services import locks
+
+_lock = threading.Lock()
+_stamp = None
+_printers = []
+_by_name = {}
+
+
+def _file_stamp():
+    try:
+        st = os.stat(PRINTERS_FILE)
+    except FileNotFoundError:
+        return None
+    return (st.st_ino, st.st_mtime_ns, st.st_size)
+
+
+def _read():
+    if not os.path.exists(PRINTERS_FILE):
+        return []
+    with open(PRINTERS_FILE, "r") as f:
+        return json.load(f)
+
+
+def _write(printers):
+    # Write a temp file and rename it so readers never see a partial file
+    tmp = f"{PRINTERS_FILE}.{os.getpid()}.tmp"
+    with open(tmp, "w") as f:
+        json.dump(printers, f, indent=4)
+    os.replace(tmp, PRINTERS_FILE)
+
+
+def _set(printers, stamp):
+    global _stamp, _printers, _by_name
+    _printers = printers
+    _by_name = {p["name"]: p for p in printers}
+    _stamp = stamp
+
+
+def _current():
+    stamp = _file_stamp()
+    if stamp != _stamp:
+        with _lock:
+            if stamp != _stamp:
+                _set(_read(), stamp)
+    return _printers, _by_name
+
+
+def all_printers():
+    """Return the printer dicts in file order (shared; do not modify)."""
+    return list(_current()[0])
+
+
+def get(name):
+    """Return the printer named ``name`` (shared; do not modify), or None."""
+    return _current()[1].get(name)
+
+
+def update(change):
+    """Apply ``change(printers)`` to the saved list and write it back.
+
+    ``change`` receives a fresh copy of the list read from disk and edits
+    it in place (or returns a replacement list). Runs under a lock shared
+    by all processes so concurrent edits are not lost.
+    """
+    with _lock, locks.file_lock(PRINTERS_FILE + ".lock"):
+        printers = _read()
+        result = change(printers)
+        if result is not None:
+            printers = result
+        _write(printers)
+        _set(printers, _file_stamp())
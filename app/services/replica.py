@@ -0,0 +1,425 @@
+"""Local replica of vbatch_labels and of picks for selected customers.
+
+Between syncs only a handful of invoices change, but the batch screens
+re-read whole routes from the iSeries. sync() fetches vbatch_labels (and
+the picks of REPLICA_PICK_CUSTOMERS) in one pass, hashes the rows of each
+route/invoice (picks: customer/invoice) and applies only the groups that
+were added, changed or removed to REPLICA_FILE. Every sync is recorded in
+the sync log with its row counts and duration.
+
+The route list, route customers and picks are read from the replica
+while it is younger than REPLICA_MAX_AGE; the readers return None
+otherwise and db2.py queries DB2 as before. Rows come back in DB2 order:
+each sort column is stored next to a key that orders like the DB2 column
+(EBCDIC collation for CHAR, see db2.ebcdic_key(); numbers as numbers)
+and NULLs sort last, as on the iSeries. bench/replica_parity.py checks
+the order against the DB2 queries.
+"""
+import hashlib
+import logging
+import os
+import pickle
+import threading
+import time
+from decimal import Decimal
+
+from app.config import (
+    REPLICA_FILE,
+    REPLICA_SYNC_INTERVAL,
+    REPLICA_MAX_AGE,
+    REPLICA_PICK_CUSTOMERS,
+)
+from app.services import localdb, locks
+
+log = logging.getLogger(__name__)
+
+# Tables whose layout has changed between versions, recreated by _rebuild()
+_RECORD_TABLES = {
+    "labels": (
+        """
+CREATE TABLE IF NOT EXISTS labels (
+    route      TEXT NOT NULL,
+    invoice    TEXT NOT NULL,
+    seq        INTEGER NOT NULL,
+    pick_area  TEXT,
+    route_sort BLOB NOT NULL,
+    pick_sort  BLOB,
+    stop_sort,
+    row        BLOB NOT NULL,
+    PRIMARY KEY (route, invoice, seq)
+)""",
+        "CREATE INDEX IF NOT EXISTS labels_route ON labels (route, pick_area)",
+    ),
+    "picks": (
+        """
+CREATE TABLE IF NOT EXISTS picks (
+    customer_no   TEXT NOT NULL,
+    invoice       TEXT NOT NULL,
+    seq           INTEGER NOT NULL,
+    location_sort BLOB,
+    row           BLOB NOT NULL,
+    PRIMARY KEY (customer_no, invoice, seq)
+)""",
+    ),
+}
+
+# Bumped when the stored records change; sync() rebuilds an older replica
+# and it is not read until then
+_VERSION = 3
+
+_SCHEMA = "".join(
+    statement + ";\n" for statements in _RECORD_TABLES.values() for statement in statements
+) + """
+CREATE TABLE IF NOT EXISTS groups (
+    kind  TEXT NOT NULL,
+    key1  TEXT NOT NULL,
+    key2  TEXT NOT NULL,
+    hash  BLOB NOT NULL,
+    PRIMARY KEY (kind, key1, key2)
+);
+CREATE TABLE IF NOT EXISTS sync_log (
+    id       INTEGER PRIMARY KEY AUTOINCREMENT,
+    started  REAL NOT NULL,
+    duration REAL NOT NULL,
+    fetched  INTEGER NOT NULL DEFAULT 0,
+    inserted INTEGER NOT NULL DEFAULT 0,
+    updated  INTEGER NOT NULL DEFAULT 0,
+    deleted  INTEGER NOT NULL DEFAULT 0,
+    error    TEXT
+);
+CREATE TABLE IF NOT EXISTS meta (
+    key   TEXT PRIMARY KEY,
+    value
+);
+"""
+
+SYNC_LOG_KEEP = 500
+
+_started_pid = None
+
+
+def _db():
+    return localdb.connect(REPLICA_FILE, _SCHEMA)
+
+
+def _get_meta(db, key):
+    row = db.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+    return row[0] if row else None
+
+
+def synced_at():
+    """Time of the last successful sync, or None if never synced (by this version)."""
+    db = _db()
+    if _get_meta(db, "version") != _VERSION:
+        return None
+    return _get_meta(db, "synced")
+
+
+def changed_at():
+    """Time of the last sync that changed anything, or None if the replica is stale.
+
+    Pages built from the replica are unchanged since then (see the batch
+    page validators).
+    """
+    db = _db()
+    return _get_meta(db, "changed") if is_fresh(db) else None
+
+
+def is_fresh(db=None):
+    meta = dict((db or _db()).execute("SELECT key, value FROM meta WHERE key IN ('synced', 'version')"))
+    synced = meta.get("synced")
+    return (
+        meta.get("version") == _VERSION
+        and synced is not None
+        and time.time() - synced <= REPLICA_MAX_AGE
+    )
+
+
+def _dumps(row):
+    return pickle.dumps(row, protocol=pickle.HIGHEST_PROTOCOL)
+
+
+# --- Reads ---
+
+def route_departments():
+    """Like db2.get_route_departments(), or None if the replica is stale."""
+    db = _db()
+    if not is_fresh(db):
+        return None
+    rows = db.execute(
+        "SELECT DISTINCT route, pick_area, route_sort, pick_sort FROM labels "
+        "ORDER BY route_sort, pick_sort IS NULL, pick_sort"
+    ).fetchall()
+    return [{"ROUTE": route, "PICK_AREA": pick_area} for route, pick_area, _, _ in rows]
+
+
+def customers_by_route_dept(route, dept=None):
+    """Like db2.get_customers_by_route_dept(), or None if the replica is stale."""
+    db = _db()
+    if not is_fresh(db):
+        return None
+    if dept:
+        rows = db.execute(
+            "SELECT row FROM labels WHERE route = ? AND pick_area = ? "
+            "ORDER BY stop_sort IS NULL, stop_sort, invoice, seq",
+            (str(route), str(dept)),
+        ).fetchall()
+    else:
+        rows = db.execute(
+            "SELECT row FROM labels WHERE route = ? "
+            "ORDER BY pick_sort IS NULL, pick_sort, stop_sort IS NULL, stop_sort, invoice, seq",
+            (str(route),),
+        ).fetchall()
+    return [pickle.loads(row[0]) for row in rows]
+
+
+def picks(customer_no):
+    """Like db2.get_picks(), or None if the customer is not replicated or it is stale."""
+    if customer_no not in REPLICA_PICK_CUSTOMERS:
+        return None
+    db = _db()
+    if not is_fresh(db):
+        return None
+    rows = db.execute(
+        "SELECT row FROM picks WHERE customer_no = ? "
+        "ORDER BY location_sort IS NULL, location_sort, invoice, seq",
+        (str(customer_no),),
+    ).fetchall()
+    return [pickle.loads(row[0]) for row in rows]
+
+
+# --- Sync ---
+
+def _group(rows, key):
+    """Group rows by ``key(row)``; returns {key: (hash, rows)}."""
+    groups = {}
+    for row in rows:
+        groups.setdefault(key(row), []).append(row)
+    result = {}
+    for k, members in groups.items():
+        # DB2 returns rows that tie on the ORDER BY in any order
+        members.sort(key=lambda row: [str(value) for value in row.values()])
+        result[k] = (hashlib.sha1(pickle.dumps(members, protocol=4)).digest(), members)
+    return result
+
+
+def _diff(db, kind, groups):
+    """Compare fetched groups with the stored hashes.
+
+    Returns:
+        (inserted keys, updated keys, deleted keys)
+    """
+    stored = {
+        (key1, key2): digest
+        for key1, key2, digest in db.execute(
+            "SELECT key1, key2, hash FROM groups WHERE kind = ?", (kind,)
+        )
+    }
+    inserted = [k for k in groups if k not in stored]
+    updated = [k for k in groups if k in stored and stored[k] != groups[k][0]]
+    deleted = [k for k in stored if k not in groups]
+    return inserted, updated, deleted
+
+
+def _sort_key(value):
+    """A key that orders like DB2 orders the column ``value`` came from.
+
+    CHAR values compare in EBCDIC and numbers (DECIMAL included) as
+    numbers. None stays NULL; the readers sort NULLs last.
+    """
+    from app.services.db2 import ebcdic_key
+
+    if value is None or isinstance(value, (int, float)):
+        return value
+    if isinstance(value, Decimal):
+        return float(value)
+    return ebcdic_key(str(value))
+
+
+def _label_records(route, invoice, rows):
+    from app.services.db2 import ebcdic_key
+
+    for seq, row in enumerate(rows):
+        pick_area = row.get("PICK_AREA")
+        yield (
+            route, invoice, seq, pick_area, ebcdic_key(route), _sort_key(pick_area),
+            _sort_key(row.get("STOP")), _dumps(row),
+        )
+
+
+def _pick_records(customer_no, invoice, rows):
+    for seq, row in enumerate(rows):
+        yield customer_no, invoice, seq, _sort_key(row.get("LOCATION")), _dumps(row)
+
+
+_TABLES = {
+    # kind: (table, key columns, record builder, placeholders)
+    "labels": ("labels", ("route", "invoice"), _label_records, 8),
+    "picks": ("picks", ("customer_no", "invoice"), _pick_records, 5),
+}
+
+
+def _rebuild(db):
+    """Empty a replica written by an older version, for the sync to refill."""
+    for table, statements in _RECORD_TABLES.items():
+        db.execute(f"DROP TABLE IF EXISTS {table}")
+        for statement in statements:
+            db.execute(statement)
+    db.execute("DELETE FROM groups")
+    db.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('version', ?)", (_VERSION,))
+
+
+def _apply(db, kind, groups, changes):
+    table, (col1, col2), records, width = _TABLES[kind]
+    inserted, updated, deleted = changes
+    for key in updated + deleted:
+        db.execute(f"DELETE FROM {table} WHERE {col1} = ? AND {col2} = ?", key)
+    db.executemany(
+        "DELETE FROM groups WHERE kind = ? AND key1 = ? AND key2 = ?",
+        [(kind,) + key for key in deleted],
+    )
+    for key in inserted + updated:
+        digest, rows = groups[key]
+        db.executemany(
+            f"INSERT INTO {table} VALUES ({','.join('?' * width)})", records(*key, rows)
+        )
+        db.execute(
+            "INSERT OR REPLACE INTO groups (kind, key1, key2, hash) VALUES (?, ?, ?, ?)",
+            (kind,) + key + (digest,),
+        )
+
+
+def sync():
+    """Bring the replica up to date with DB2.
+
+    Everything is fetched before anything is written, and the changes
+    are applied in one transaction, so readers see either the previous
+    or the new state. Only one process syncs at a time.
+
+    Returns:
+        Dict with the row counts (fetched, inserted, updated, deleted;
+        groups of rows for the last three) and duration in seconds.
+    """
+    from app.services import cache, db2
+
+    with locks.file_lock(REPLICA_FILE + ".lock"):
+        started, start = time.time(), time.monotonic()
+        result = {"fetched": 0, "inserted": 0, "updated": 0, "deleted": 0}
+        db = _db()
+        try:
+            labels = db2.get_all_batch_labels()
+            fetched = {
+                "labels": _group(
+                    labels,
+                    lambda row: (str(row.get("ROUTE", "")), str(row.get("INVOICE_NO", "")).strip()),
+                ),
+            }
+            pick_rows = []
+            for customer_no in REPLICA_PICK_CUSTOMERS:
+                pick_rows.extend(db2.fetch_picks(customer_no))
+            fetched["picks"] = _group(
+                pick_rows,
+                lambda row: (str(row.get("CUSTNO", "")).strip(), str(row.get("INVOICE", "")).strip()),
+            )
+            result["fetched"] = len(labels) + len(pick_rows)
+
+            db.execute("BEGIN IMMEDIATE")
+            try:
+                if _get_meta(db, "version") != _VERSION:
+                    _rebuild(db)
+                changed = []
+                for kind, groups in fetched.items():
+                    changes = _diff(db, kind, groups)
+                    _apply(db, kind, groups, changes)
+                    for name, keys in zip(("inserted", "updated", "deleted"), changes):
+                        result[name] += len(keys)
+                    if any(changes):
+                        changed.append(kind)
+                db.execute(
+                    "INSERT OR REPLACE INTO meta (key, value) VALUES ('synced', ?)", (time.time(),)
+                )
+                if changed:
+                    db.execute(
+                        "INSERT OR REPLACE INTO meta (key, value) VALUES ('changed', ?)", (time.time(),)
+                    )
+                db.execute("COMMIT")
+            except BaseException:
+                db.execute("ROLLBACK")
+                raise
+        except Exception as e:
+            _log_sync(db, started, time.monotonic() - start, result, str(e))
+            raise
+
+        result["duration"] = round(time.monotonic() - start, 3)
+        _log_sync(db, started, result["duration"], result)
+
+    # Cached results read before the sync may be out of date now
+    if "labels" in changed:
+        cache.flush("route_departments")
+        cache.flush("customers_by_route_dept")
+    if "picks" in changed:
+        cache.flush("picks")
+    return result
+
+
+def _log_sync(db, started, duration, result, error=None):
+    db.execute(
+        "INSERT INTO sync_log (started, duration, fetched, inserted, updated, deleted, error) "
+        "VALUES (?, ?, ?, ?, ?, ?, ?)",
+        (started, round(duration, 3), result["fetched"], result["inserted"],
+         result["updated"], result["deleted"], error),
+    )
+    db.execute(
+        "DELETE FROM sync_log WHERE id <= (SELECT MAX(id) FROM sync_log) - ?", (SYNC_LOG_KEEP,)
+    )
+
+
+def sync_log(limit=20):
+    """Most recent syncs, newest first."""
+    rows = _db().execute(
+        "SELECT started, duration, fetched, inserted, updated, deleted, error "
+        "FROM sync_log ORDER BY id DESC LIMIT ?",
+        (limit,),
+    ).fetchall()
+    keys = ("started", "duration", "fetched", "inserted", "updated", "deleted", "error")
+    return [dict(zip(keys, row)) for row in rows]
+
+
+def stats():
+    """Row counts, the last sync time and whether reads use the replica."""
+    db = _db()
+    return {
+        "labels": db.execute("SELECT COUNT(*) FROM labels").fetchone()[0],
+        "picks": db.execute("SELECT COUNT(*) FROM picks").fetchone()[0],
+        "pick_customers": REPLICA_PICK_CUSTOMERS,
+        "synced": _get_meta(db, "synced"),
+        "fresh": is_fresh(db),
+    }
+
+
+def start():
+    """Start the scheduled sync thread for this process (idempotent).
+
+    Every worker runs the thread; whichever holds the leader lock syncs.
+    """
+    global _started_pid
+    if REPLICA_SYNC_INTERVAL <= 0 or _started_pid == os.getpid():
+        return
+    _started_pid = os.getpid()
+    threading.Thread(target=_schedule, name="replica-sync", daemon=True).start()
+
+
+def _schedule():
+    lock_fd = None
+    while True:
+        try:
+            if lock_fd is None:
+                lock_fd = locks.try_acquire(REPLICA_FILE + ".leader")
+            if lock_fd is not None:
+                synced = synced_at()
+                if synced is None or time.time() - synced >= REPLICA_SYNC_INTERVAL:
+                    result = sync()
+                    log.info("replica synced: %s", result)
+        except Exception:
+            log.exception("replica sync failed")
+        time.sleep(min(REPLICA_SYNC_INTERVAL, 60))
@@ -0,0 +1,113 @@
+"""Compact result rows for the DB2 helpers.
+
+A Row keeps its values in a tuple and shares one column index with every
+other row of its query, so a 12-column vbatch_labels row costs a small
+object and a tuple instead of a dict. CHAR columns come back
+blank-padded and are stripped as each batch is fetched: keeping the
+padded strings and stripping on read made the rows larger in memory and
+in the cache than the dicts they replace (see bench/rows.py).
+
+Rows behave like the dicts the helpers used to return: ``row["ROUTE"]``,
+``row.get("STOP")``, ``in``, iteration over column names, ``dict(row)``
+and equality with dicts. Templates and pyodbc-style code can also use
+``row.ROUTE``. Assigning a key (``row["LABELS"] = 3``, a derived
+``REGION``) stores it alongside the fetched values. Rows pickle with the
+column names, so cached, replicated and spooled rows load back as Rows.
+"""
+from collections.abc import Mapping
+
+from app.config import DB2_FETCH_SIZE
+
+_indexes = {}
+
+
+class _Index(dict):
+    """{column: position}, shared by all rows with the same columns."""
+
+    __slots__ = ("columns",)
+
+
+def _index(columns):
+    columns = tuple(columns)
+    index = _indexes.get(columns)
+    if index is None:
+        index = _Index((col, i) for i, col in enumerate(columns))
+        index.columns = columns
+        index = _indexes.setdefault(columns, index)
+    return index
+
+
+def _row(columns, values, extra):
+    """Unpickle a Row (see Row.__reduce__)."""
+    return Row(_index(columns), values, extra)
+
+
+class Row(Mapping):
+    """One result row: a tuple of values plus a shared column index."""
+
+    __slots__ = ("_index", "_values", "_extra")
+
+    def __init__(self, index, values, extra=None):
+        self._index = index
+        self._values = values
+        self._extra = extra
+
+    def __getitem__(self, key):
+        if self._extra is not None and key in self._extra:
+            return self._extra[key]
+        return self._values[self._index[key]]
+
+    def get(self, key, default=None):
+        if self._extra is not None and key in self._extra:
+            return self._extra[key]
+        i = self._index.get(key)
+        return default if i is None else self._values[i]
+
+    def __setitem__(self, key, value):
+        if self._extra is None:
+            self._extra = {}
+        self._extra[key] = value
+
+    def __getattr__(self, name):
+        try:
+            return self[name]
+        except KeyError:
+            raise AttributeError(name) from None
+
+    def __contains__(self, key):
+        return key in self._index or (self._extra is not None and key in self._extra)
+
+    def __iter__(self):
+        yield from self._index
+        if self._extra:
+            yield from (key for key in self._extra if key not in self._index)
+
+    def __len__(self):
+        if not self._extra:
+            return len(self._index)
+        return len(self._index) + sum(1 for key in self._extra if key not in self._index)
+
+    def __reduce__(self):
+        # One shared columns tuple, so pickle stores it once per dump
+        return _row, (self._index.columns, self._values, self._extra)
+
+    def __repr__(self):
+        return f"Row({dict(self)!r})"
+
+
+def fetch(cursor, size=DB2_FETCH_SIZE):
+    """All rows of an executed cursor as stripped Rows, read ``size`` at a time.
+
+    Only one batch of driver rows is alive at once, so a full-day query
+    does not hold the whole result twice (driver rows and Rows).
+    """
+    index = _index(desc[0] for desc in cursor.description)
+    rows = []
+    while True:
+        batch = cursor.fetchmany(size)
+        if not batch:
+            return rows
+        rows.extend(
+            Row(index, tuple([v.strip() if isinstance(v, str) else v for v in values]))
+            for values in batch
+        )
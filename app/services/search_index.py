@@ -0,0 +1,194 @@
+"""Local customer search index for the ad hoc screen.
+
+The ad hoc search is a ``LIKE '%term%'`` scan of vbatch_labels and
+VONEOFF_LASTSTOP on the iSeries. Both views are copied into a SQLite file
+(SEARCH_INDEX_FILE) on a schedule and on demand, with customer names in an
+FTS5 trigram index so substring matches do not scan. Searches return None
+when the index is older than SEARCH_INDEX_MAX_AGE so callers fall back to
+the live query.
+"""
+import logging
+import os
+import pickle
+import sqlite3
+import threading
+import time
+
+from app.config import SEARCH_INDEX_FILE, SEARCH_INDEX_REFRESH, SEARCH_INDEX_MAX_AGE
+from app.services import localdb, locks
+
+log = logging.getLogger(__name__)
+
+SOURCES = ("vbatch_labels", "oneoff")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS entries (
+    id          INTEGER PRIMARY KEY,
+    source      TEXT NOT NULL,
+    customer_no TEXT NOT NULL,
+    row         BLOB NOT NULL
+);
+CREATE INDEX IF NOT EXISTS entries_customer_no ON entries (source, customer_no);
+CREATE TABLE IF NOT EXISTS meta (
+    key   TEXT PRIMARY KEY,
+    value
+);
+"""
+
+
+def _names_schema():
+    """Customer names, rowid = entries.id.
+
+    The trigram tokenizer lets ``customer LIKE '%term%'`` use the index
+    (SQLite 3.34+); older SQLite gets a plain table that is scanned.
+    """
+    try:
+        sqlite3.connect(":memory:").execute(
+            "CREATE VIRTUAL TABLE probe USING fts5(customer, tokenize='trigram')"
+        )
+    except sqlite3.OperationalError:
+        return "CREATE TABLE IF NOT EXISTS names (rowid INTEGER PRIMARY KEY, customer TEXT NOT NULL);"
+    return "CREATE VIRTUAL TABLE IF NOT EXISTS names USING fts5(customer, tokenize='trigram');"
+
+
+_SCHEMA += _names_schema()
+
+_started_pid = None
+
+
+def _db():
+    return localdb.connect(SEARCH_INDEX_FILE, _SCHEMA)
+
+
+def _get_meta(db, key):
+    row = db.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+    return row[0] if row else None
+
+
+def refreshed_at():
+    """Time of the last successful refresh, or None if never built."""
+    return _get_meta(_db(), "refreshed")
+
+
+def is_fresh():
+    refreshed = refreshed_at()
+    return refreshed is not None and time.time() - refreshed <= SEARCH_INDEX_MAX_AGE
+
+
+def search(term, source):
+    """Search the index like db2.search_customers()/search_oneoff_customers().
+
+    Matches the customer name as a case-insensitive substring, or the
+    customer number when ``term`` is all digits, in the live query's order.
+
+    Args:
+        term: search text.
+        source: "vbatch_labels" or "oneoff".
+
+    Returns:
+        List of row dicts, or None if the index is stale or missing.
+    """
+    db = _db()
+    refreshed = _get_meta(db, "refreshed")
+    if refreshed is None or time.time() - refreshed > SEARCH_INDEX_MAX_AGE:
+        return None
+    customer_no = str(int(term)) if term.isdigit() else None
+    rows = db.execute(
+        "SELECT row FROM entries WHERE source = ? AND ("
+        "id IN (SELECT rowid FROM names WHERE customer LIKE ?) OR customer_no = ?"
+        ") ORDER BY id",
+        (source, f"%{term}%", customer_no),
+    ).fetchall()
+    return [pickle.loads(row[0]) for row in rows]
+
+
+def stats():
+    """Row counts per source and the last refresh time and duration."""
+    db = _db()
+    counts = dict(db.execute("SELECT source, COUNT(*) FROM entries GROUP BY source").fetchall())
+    return {
+        "counts": {source: counts.get(source, 0) for source in SOURCES},
+        "refreshed": _get_meta(db, "refreshed"),
+        "duration": _get_meta(db, "duration"),
+        "fresh": is_fresh(),
+    }
+
+
+def refresh():
+    """Rebuild the index from DB2.
+
+    Both views are fetched before anything is written, and the swap is a
+    single transaction, so searches keep seeing the previous snapshot
+    until it commits. Only one process refreshes at a time.
+
+    Returns:
+        Number of rows indexed.
+    """
+    from app.services import db2
+
+    with locks.file_lock(SEARCH_INDEX_FILE + ".lock"):
+        start = time.monotonic()
+        fetched = {
+            "vbatch_labels": db2.get_all_batch_labels(),
+            "oneoff": db2.get_all_oneoff_customers(),
+        }
+        db = _db()
+        db.execute("BEGIN IMMEDIATE")
+        try:
+            db.execute("DELETE FROM entries")
+            db.execute("DELETE FROM names")
+            next_id = 1
+            for source in SOURCES:
+                rows = fetched[source]
+                ids = range(next_id, next_id + len(rows))
+                db.executemany(
+                    "INSERT INTO entries (id, source, customer_no, row) VALUES (?, ?, ?, ?)",
+                    (
+                        (i, source, str(row.get("CUSTOMER_NO", "")).strip(),
+                         pickle.dumps(row, protocol=pickle.HIGHEST_PROTOCOL))
+                        for i, row in zip(ids, rows)
+                    ),
+                )
+                db.executemany(
+                    "INSERT INTO names (rowid, customer) VALUES (?, ?)",
+                    ((i, str(row.get("CUSTOMER", ""))) for i, row in zip(ids, rows)),
+                )
+                next_id += len(rows)
+            db.execute(
+                "INSERT OR REPLACE INTO meta (key, value) VALUES ('refreshed', ?), ('duration', ?)",
+                (time.time(), round(time.monotonic() - start, 3)),
+            )
+            db.execute("COMMIT")
+        except BaseException:
+            db.execute("ROLLBACK")
+            raise
+    return next_id - 1
+
+
+def start():
+    """Start the scheduled refresh thread for this process (idempotent).
+
+    Every worker runs the thread; whichever holds the leader lock does
+    the refreshing.
+    """
+    global _started_pid
+    if SEARCH_INDEX_REFRESH <= 0 or _started_pid == os.getpid():
+        return
+    _started_pid = os.getpid()
+    threading.Thread(target=_schedule, name="search-index", daemon=True).start()
+
+
+def _schedule():
+    lock_fd = None
+    while True:
+        try:
+            if lock_fd is None:
+                lock_fd = locks.try_acquire(SEARCH_INDEX_FILE + ".leader")
+            if lock_fd is not None:
+                refreshed = refreshed_at()
+                if refreshed is None or time.time() - refreshed >= SEARCH_INDEX_REFRESH:
+                    count = refresh()
+                    log.info("search index refreshed: %s rows", count)
+        except Exception:
+            log.exception("search index refresh failed")
+        time.sleep(min(SEARCH_INDEX_REFRESH, 60))
@@ -0,0 +1,94 @@
+"""Snapshots of the rows shown on a review or search page.
+
+The page stores the exact rows it rendered and puts the returned token in
+its print form. The print POST then renders from the snapshot instead of
+re-running the DB2 query and matching selections against fresh results.
+Snapshots are kept in SELECTION_FILE for SELECTION_TTL seconds; after that
+the print is refused and the operator reloads the page.
+"""
+import pickle
+import secrets
+import time
+
+from app.config import SELECTION_FILE, SELECTION_TTL
+from app.services import localdb
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS selections (
+    token   TEXT PRIMARY KEY,
+    data    BLOB NOT NULL,
+    expires REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS selections_expires ON selections (expires);
+"""
+
+
+def _db():
+    return localdb.connect(SELECTION_FILE, _SCHEMA)
+
+
+def row_keys(rows, fields):
+    """Build a stable key per row from ``fields``.
+
+    Rows that share the same values get "#2", "#3", ... so every key in
+    the snapshot is unique.
+    """
+    keys = []
+    seen = {}
+    for row in rows:
+        key = "|".join(str(row.get(field, "") or "").strip() for field in fields)
+        seen[key] = seen.get(key, 0) + 1
+        keys.append(key if seen[key] == 1 else f"{key}#{seen[key]}")
+    return keys
+
+
+def save(rows, fields, **context):
+    """Snapshot ``rows`` for a later print.
+
+    Args:
+        rows: the row dicts rendered on the page.
+        fields: row fields that make up each row's key (see row_keys()).
+        **context: extra values stored with the snapshot (route, term, ...).
+
+    Returns:
+        (token, keys) where keys[i] is the form value for rows[i].
+    """
+    rows = list(rows)
+    keys = row_keys(rows, fields)
+    data = dict(context, rows=dict(zip(keys, rows)), keys=keys)
+    token = secrets.token_urlsafe(16)
+    now = time.time()
+    db = _db()
+    db.execute("DELETE FROM selections WHERE expires <= ?", (now,))
+    db.execute(
+        "INSERT INTO selections (token, data, expires) VALUES (?, ?, ?)",
+        (token, pickle.dumps(data, protocol=pickle.HIGHEST_PROTOCOL), now + SELECTION_TTL),
+    )
+    return token, keys
+
+
+def load(token):
+    """Return a snapshot dict (rows, keys and its context), or None if unknown or expired."""
+    if not token:
+        return None
+    row = _db().execute(
+        "SELECT data, expires FROM selections WHERE token = ?", (token,)
+    ).fetchone()
+    if row is None or row[1] <= time.time():
+        return None
+    return pickle.loads(row[0])
+
+
+def expires_at(token):
+    """When a snapshot expires, or None if it is unknown or already expired."""
+    row = _db().execute("SELECT expires FROM selections WHERE token = ?", (token,)).fetchone()
+    if row is None or row[0] <= time.time():
+        return None
+    return row[0]
+
+
+def selected_rows(snapshot, selected):
+    """Return (key, row) for each selected key, in the order the page showed them."""
+    wanted = set(selected)
+    rows = snapshot["rows"]
+    return [(key, rows[key]) for key in snapshot["keys"] if key in wanted]
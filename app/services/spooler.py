@@ -0,0 +1,350 @@
+"""Background print spooler.
+
+Print routes enqueue jobs into a SQLite queue (SPOOL_FILE) and return
+immediately. Label jobs store the rows to print; their ZPL is rendered by
+the dispatcher and streamed to the printer label by label. One process at a time (whichever gunicorn worker holds the
+spool lock) dispatches them, with one sender thread per printer so a slow
+or offline printer only delays its own jobs. Jobs for a printer are sent
+strictly in order. A job that fails before any of it reaches the printer
+is retried with exponential backoff and marked failed after
+SPOOL_MAX_ATTEMPTS, letting the next job through. A job that fails after
+labels went out, or whose ZPL cannot be rendered, is marked failed at
+once with the number of labels sent, so nothing is printed twice.
+"""
+import logging
+import os
+import pickle
+import threading
+import time
+from collections import deque
+
+from app.config import (
+    SPOOL_FILE,
+    SPOOL_POLL_INTERVAL,
+    SPOOL_MAX_ATTEMPTS,
+    SPOOL_RETRY_BASE,
+    SPOOL_RETRY_MAX,
+    SPOOL_RETENTION,
+)
+from app.services import health, localdb, locks, metrics
+from app.services.connections import get_connection
+from app.services.formats import ensure_formats
+from app.services.printer import get_printer, send_zpl_stream
+from app.services.zpl import iter_label_batch, iter_pick_list_labels
+
+log = logging.getLogger(__name__)
+
+QUEUED = "queued"
+SENDING = "sending"
+DONE = "done"
+FAILED = "failed"
+
+# Job kinds and their payloads
+ZPL = "zpl"  # ready-made ZPL text
+LABELS = "labels"  # pickled [(row, label count), ...]
+PICK_LISTS = "pick_lists"  # pickled [(region, items), ...]
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id           INTEGER PRIMARY KEY AUTOINCREMENT,
+    printer      TEXT NOT NULL,
+    ip           TEXT NOT NULL,
+    description  TEXT NOT NULL DEFAULT '',
+    labels       INTEGER NOT NULL DEFAULT 0,
+    kind         TEXT NOT NULL,
+    payload      BLOB NOT NULL,
+    status       TEXT NOT NULL,
+    attempts     INTEGER NOT NULL DEFAULT 0,
+    error        TEXT,
+    created      REAL NOT NULL,
+    next_attempt REAL NOT NULL,
+    started      REAL,
+    finished     REAL,
+    sent         INTEGER,
+    route        TEXT NOT NULL DEFAULT ''
+);
+CREATE INDEX IF NOT EXISTS jobs_printer_status ON jobs (printer, status, id);
+"""
+
+_JOB_COLUMNS = (
+    "id, printer, ip, description, labels, kind, status, attempts, error, "
+    "created, next_attempt, started, finished, sent, route"
+)
+
+# Added after the first release; see localdb.connect()
+_COLUMNS = (("jobs", "sent", "INTEGER"), ("jobs", "route", "TEXT NOT NULL DEFAULT ''"))
+
+_wake = threading.Event()
+_started_pid = None
+
+
+def _db():
+    return localdb.connect(SPOOL_FILE, _SCHEMA, _COLUMNS)
+
+
+def _job_dict(row):
+    return dict(zip([c.strip() for c in _JOB_COLUMNS.split(",")], row))
+
+
+# --- Queue API ---
+
+def enqueue(printer, kind, payload, labels=0, description="", route=""):
+    """Queue a job for a printer and return the job id.
+
+    Args:
+        printer: printer dict from printers.json.
+        kind: ZPL, LABELS or PICK_LISTS.
+        payload: ZPL text for ZPL jobs, otherwise the pickled job data.
+        labels: number of labels the job prints (for status display).
+        description: short text shown on the jobs page.
+        route: route(s) the job prints, comma separated; labels the job in
+            labelprinter_jobs_total.
+    """
+    now = time.time()
+    cur = _db().execute(
+        "INSERT INTO jobs (printer, ip, description, labels, kind, payload, "
+        "status, created, next_attempt, route) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+        (printer["name"], printer["ip"], description, labels, kind, payload,
+         QUEUED, now, now, route),
+    )
+    _wake.set()
+    return cur.lastrowid
+
+
+def enqueue_zpl(printer, zpl, labels=0, description=""):
+    """Queue ready-made ZPL."""
+    return enqueue(printer, ZPL, zpl, labels, description)
+
+
+def enqueue_labels(printer, rows, labels, description="", route=""):
+    """Queue shipping labels for [(row, label count), ...].
+
+    The ZPL is rendered when the job is sent, recalling the printer's
+    stored formats when they are enabled.
+    """
+    return enqueue(printer, LABELS, pickle.dumps(list(rows)), labels, description, route)
+
+
+def enqueue_pick_lists(printer, regions, labels, description="", route=""):
+    """Queue pick list labels for [(region, items), ...]."""
+    return enqueue(printer, PICK_LISTS, pickle.dumps(list(regions)), labels, description, route)
+
+
+def get_job(job_id):
+    """Return a job's status dict (without payload), or None."""
+    row = _db().execute(
+        f"SELECT {_JOB_COLUMNS} FROM jobs WHERE id = ?", (job_id,)
+    ).fetchone()
+    return _job_dict(row) if row else None
+
+
+def recent_jobs(limit=50):
+    """Return the most recent jobs, newest first."""
+    rows = _db().execute(
+        f"SELECT {_JOB_COLUMNS} FROM jobs ORDER BY id DESC LIMIT ?", (limit,)
+    ).fetchall()
+    return [_job_dict(row) for row in rows]
+
+
+def wait_for(job_ids, timeout):
+    """Wait up to ``timeout`` seconds for jobs to finish.
+
+    Returns {job id: job dict} with each job's latest status.
+    """
+    deadline = time.monotonic() + timeout
+    while True:
+        jobs = {job_id: get_job(job_id) for job_id in job_ids}
+        pending = [j for j in jobs.values() if j and j["status"] in (QUEUED, SENDING)]
+        if not pending or time.monotonic() >= deadline:
+            return jobs
+        time.sleep(0.2)
+
+
+# --- Dispatcher ---
+
+def start():
+    """Start the dispatcher supervisor thread for this process (idempotent)."""
+    global _started_pid
+    if _started_pid == os.getpid():
+        return
+    _started_pid = os.getpid()
+    threading.Thread(target=_supervise, name="spooler", daemon=True).start()
+
+
+def _supervise():
+    lock_fd = None
+    workers = {}
+    last_prune = 0
+    while True:
+        try:
+            if lock_fd is None:
+                lock_fd = locks.try_acquire(SPOOL_FILE + ".lock")
+                if lock_fd is not None:
+                    _recover()
+                    health.start()
+            if lock_fd is not None:
+                for name in _pending_printers():
+                    worker = workers.get(name)
+                    if worker is None or not worker.is_alive():
+                        worker = threading.Thread(
+                            target=_work, args=(name,), name=f"spooler-{name}", daemon=True
+                        )
+                        workers[name] = worker
+                        worker.start()
+                if time.time() - last_prune > 3600:
+                    _prune()
+                    last_prune = time.time()
+        except Exception:
+            log.exception("spooler supervisor error")
+        _wake.wait(SPOOL_POLL_INTERVAL)
+        _wake.clear()
+
+
+def _recover():
+    """Fail jobs left mid-send by a process that died holding the lock.
+
+    Part of such a job may already have printed, so it is not resent; its
+    ``sent`` count is the labels known to have gone out.
+    """
+    db = _db()
+    rows = db.execute(
+        "SELECT id, printer, route, labels, sent FROM jobs WHERE status = ?", (SENDING,)
+    ).fetchall()
+    for job_id, printer_name, route, labels, sent in rows:
+        log.warning("job %s to %s was interrupted mid-send", job_id, printer_name)
+        _fail(db, printer_name, route, job_id,
+              f"Interrupted after {sent or 0} of {labels} labels were sent; "
+              "check the printer before reprinting")
+
+
+def _prune():
+    _db().execute(
+        "DELETE FROM jobs WHERE status IN (?, ?) AND created < ?",
+        (DONE, FAILED, time.time() - SPOOL_RETENTION),
+    )
+
+
+def _pending_printers():
+    rows = _db().execute(
+        "SELECT DISTINCT printer FROM jobs WHERE status = ?", (QUEUED,)
+    ).fetchall()
+    return [row[0] for row in rows]
+
+
+def _work(printer_name):
+    """Send a printer's queued jobs in order until its queue is empty."""
+    db = _db()
+    while True:
+        row = db.execute(
+            "SELECT id, ip, route, kind, payload, labels, attempts, next_attempt FROM jobs "
+            "WHERE printer = ? AND status = ? ORDER BY id LIMIT 1",
+            (printer_name, QUEUED),
+        ).fetchone()
+        if row is None:
+            return
+        job_id, ip, route, kind, payload, labels, attempts, next_attempt = row
+        delay = next_attempt - time.time()
+        if delay > 0:
+            # Head of the queue is backing off; later jobs wait behind it
+            time.sleep(min(delay, SPOOL_POLL_INTERVAL))
+            continue
+        _send(db, printer_name, route, job_id, ip, kind, payload, labels, attempts + 1)
+
+
+def _render(printer, kind, payload, labels):
+    """Yield a job's ZPL as (byte chunk, labels in it), rendering labels lazily."""
+    if kind == ZPL:
+        yield payload.encode("utf-8"), labels
+    elif kind == LABELS:
+        stored = ensure_formats(printer)
+        rows = pickle.loads(payload)
+        yield from zip(iter_label_batch(rows, stored=stored), (count for _, count in rows))
+    elif kind == PICK_LISTS:
+        regions = pickle.loads(payload)
+        for region, items in regions:
+            yield from ((page, 1) for page in iter_pick_list_labels(items, region))
+    else:
+        raise ValueError(f"unknown job kind {kind!r}")
+
+
+class _Progress:
+    """How much of a job has been written to the printer's socket.
+
+    chunks() hands the rendered chunks to the sender and wrote() is called
+    with the running byte total after each write. Writes only ever carry
+    whole chunks, so the labels sent are those of the chunks that ended at
+    or before the total; the count is saved on the job as it grows.
+    """
+
+    def __init__(self, db, job_id):
+        self.db = db
+        self.job_id = job_id
+        self.bytes = 0
+        self.labels = 0
+        self._ends = deque()  # (byte offset, labels) at the end of each unsent chunk
+
+    def chunks(self, rendered):
+        offset = labels = 0
+        for chunk, count in rendered:
+            offset += len(chunk)
+            labels += count
+            self._ends.append((offset, labels))
+            yield chunk
+
+    def wrote(self, total):
+        self.bytes = total
+        labels = self.labels
+        while self._ends and self._ends[0][0] <= total:
+            labels = self._ends.popleft()[1]
+        if labels != self.labels:
+            self.labels = labels
+            self.db.execute("UPDATE jobs SET sent = ? WHERE id = ?", (labels, self.job_id))
+
+
+def _fail(db, printer_name, route, job_id, error):
+    metrics.inc("labelprinter_jobs_total", printer=printer_name, route=route, status=FAILED)
+    db.execute(
+        "UPDATE jobs SET status = ?, error = ?, finished = ? WHERE id = ?",
+        (FAILED, error, time.time(), job_id),
+    )
+
+
+def _send(db, printer_name, route, job_id, ip, kind, payload, labels, attempt):
+    db.execute(
+        "UPDATE jobs SET status = ?, attempts = ?, started = ?, sent = 0 WHERE id = ?",
+        (SENDING, attempt, time.time(), job_id),
+    )
+    progress = _Progress(db, job_id)
+    try:
+        printer = get_printer(printer_name) or {"name": printer_name, "ip": ip}
+        # Hold the printer's connection so format checks and the job go out together
+        with get_connection(printer["ip"]).lock:
+            send_zpl_stream(
+                printer["ip"],
+                progress.chunks(_render(printer, kind, payload, labels)),
+                progress.wrote,
+            )
+    except Exception as e:
+        log.warning("job %s to %s failed (attempt %s): %s", job_id, printer_name, attempt, e)
+        if progress.bytes:
+            # Resending would reprint the labels that already went out
+            _fail(db, printer_name, route, job_id,
+                  f"{e} after {progress.labels} of {labels} labels were sent; "
+                  "check the printer before reprinting")
+        elif not isinstance(e, OSError) or attempt >= SPOOL_MAX_ATTEMPTS:
+            # Only connection errors are worth retrying: a job that cannot
+            # be rendered fails the same way every attempt
+            _fail(db, printer_name, route, job_id, str(e))
+        else:
+            backoff = min(SPOOL_RETRY_BASE * 2 ** (attempt - 1), SPOOL_RETRY_MAX)
+            db.execute(
+                "UPDATE jobs SET status = ?, error = ?, next_attempt = ? WHERE id = ?",
+                (QUEUED, str(e), time.time() + backoff, job_id),
+            )
+        return
+    db.execute(
+        "UPDATE jobs SET status = ?, error = NULL, finished = ?, sent = ? WHERE id = ?",
+        (DONE, time.time(), labels, job_id),
+    )
+    metrics.inc("labelprinter_jobs_total", printer=printer_name, route=route, status=DONE)
+    metrics.observe("labelprinter_job_labels", labels, printer=printer_name)
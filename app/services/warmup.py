@@ -0,0 +1,131 @@
+"""Pre-warm the query cache before operators start printing.
+
+Run by the ``flask warm-cache`` command (see deploy/labelprinter-warmup.timer)
+once picking has been released. Every query the batch screens make is run
+ahead of time and cached for CACHE_WARM_TTL: the route list, each route's
+customer rows (all departments and per department), and customer 20815's
+picks, which feed its label counts and pick lists. The local replica is
+synced first and the ad hoc search index is rebuilt as well.
+
+With the replica off (REPLICA_SYNC_INTERVAL=0) the cached DB2 results are
+all the screens see, so they are kept no longer than the normal cache TTL
+of each query rather than for CACHE_WARM_TTL.
+
+Each route/department is also rendered to ZPL once. Rendering is cheap
+enough that the output is not stored; this catches rows that fail to
+render before anyone is waiting on them, and sizes the day's print volume
+for the report.
+"""
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from app.config import (
+    CACHE_CUSTOMERS_TTL,
+    CACHE_ROUTES_TTL,
+    CACHE_WARM_TTL,
+    DB2_POOL_MAX,
+    REPLICA_SYNC_INTERVAL,
+)
+from app.services import db2, replica, search_index, zpl
+
+log = logging.getLogger(__name__)
+
+
+def _label_counts(rows, counts_20815):
+    for row in rows:
+        if str(row.get("CUSTOMER_NO", "")).strip() == "20815":
+            invoice_no = str(row.get("INVOICE_NO", "")).strip()
+            yield row, counts_20815.get(invoice_no, 1)
+        else:
+            yield row, int(row.get("LABELS", 1) or 1)
+
+
+def _capped(ttl, normal_ttl):
+    return ttl if REPLICA_SYNC_INTERVAL else min(ttl, normal_ttl)
+
+
+def warm(ttl=CACHE_WARM_TTL, prod_date=None):
+    """Prefetch and cache everything the batch screens need.
+
+    Args:
+        ttl: seconds to keep the prefetched results (capped at the normal
+            cache TTLs when the replica is off).
+        prod_date: production date text for the test render (defaults to
+            tomorrow, as printed labels use).
+
+    Returns:
+        Report dict with counts and per-step timings in seconds.
+    """
+    report = {"timings": {}}
+    timings = report["timings"]
+    routes_ttl = _capped(ttl, CACHE_ROUTES_TTL)
+    ttl = _capped(ttl, CACHE_CUSTOMERS_TTL)
+
+    # Sync the replica first so the reads below come from it
+    started = time.monotonic()
+    try:
+        report["replica"] = replica.sync()
+    except Exception as e:
+        log.exception("replica sync failed during warm-up")
+        report["replica"] = f"failed: {e}"
+    timings["replica"] = time.monotonic() - started
+
+    started = time.monotonic()
+    combos = db2.get_route_departments.refresh(ttl=routes_ttl)
+    keys = []
+    for route in dict.fromkeys(str(c["ROUTE"]).strip() for c in combos):
+        keys.append((route, None))
+    keys.extend((str(c["ROUTE"]).strip(), str(c["PICK_AREA"]).strip()) for c in combos)
+    timings["routes"] = time.monotonic() - started
+
+    started = time.monotonic()
+    with ThreadPoolExecutor(max_workers=max(1, DB2_POOL_MAX)) as pool:
+        results = list(pool.map(
+            lambda key: db2.get_customers_by_route_dept.refresh(*key, ttl=ttl), keys
+        ))
+    timings["customers"] = time.monotonic() - started
+
+    started = time.monotonic()
+    picks = db2.get_picks.refresh(20815, ttl=ttl)
+    counts_20815 = db2.label_counts_by_invoice(picks)
+    regions = db2.partition_picks(picks)
+    timings["picks"] = time.monotonic() - started
+
+    started = time.monotonic()
+    labels = zpl_bytes = 0
+    for (route, dept), rows in zip(keys, results):
+        if dept is None:
+            continue  # each row is rendered once, under its department
+        to_print = list(_label_counts(rows, counts_20815))
+        labels += sum(count for _, count in to_print)
+        zpl_bytes += sum(len(chunk) for chunk in zpl.iter_label_batch(to_print, prod_date=prod_date))
+    pick_list_labels = 0
+    for region, items in regions.items():
+        pick_list_labels += (len(items) + zpl.ROWS_PER_LABEL - 1) // zpl.ROWS_PER_LABEL
+        zpl_bytes += sum(len(chunk) for chunk in zpl.iter_pick_list_labels(items, region, prod_date))
+    timings["render"] = time.monotonic() - started
+
+    started = time.monotonic()
+    try:
+        report["search_index_rows"] = search_index.refresh()
+    except Exception as e:
+        log.exception("search index refresh failed during warm-up")
+        report["search_index_rows"] = f"failed: {e}"
+    timings["search_index"] = time.monotonic() - started
+
+    report.update(
+        routes=sum(1 for _, dept in keys if dept is None),
+        departments=len(combos),
+        customer_rows=sum(len(rows) for (_, dept), rows in zip(keys, results) if dept is None),
+        picks_20815=len(picks),
+        pick_list_regions=len(regions),
+        labels=labels,
+        pick_list_labels=pick_list_labels,
+        zpl_bytes=zpl_bytes,
+        ttl=ttl,
+        routes_ttl=routes_ttl,
+    )
+    report["timings"] = {step: round(seconds, 3) for step, seconds in timings.items()}
+    report["seconds"] = round(sum(timings.values()), 3)
+    return report
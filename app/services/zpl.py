@@ -1,194 +1,310 @@
+import hashlib
 from datetime import date, timedelta
 
+from app.config import LABEL_FORMAT_DEVICE
+from app.services import metrics
+from app.services.zpl_template import Command, Field, Font, Rule, Template, Text
+
 
 def _get_prod_date():
     """Return production date (tomorrow) as MM/DD/YY."""
     return (date.today() + timedelta(days=1)).strftime("%m/%d/%y")
 
 
-def generate_label(data, label_number=1, total_labels=1):
-    """Generate ZPL for a single 4x6 shipping label at 203 DPI.
+# --- Layouts (4x6 at 203 DPI) ---
 
-    Args:
-        data: dict with keys: ROUTE, STOP, CUSTOMER, CITY, STATE (or STATE_CD),
-              and optionally INVOICE_NO, PO_NUM, PICK_AREA, CUSTOMER_NO.
-        label_number: current label number (1-based).
-        total_labels: total labels for this customer/invoice.
+STANDARD_LAYOUT = Template([
+    Command("^FWN\n"),  # Reset field orientation to normal
+    Command("^PON\n"),  # Print orientation normal
+    Font(130),
+    Field("route", 50, 50, "RT: "),
+    Field("stop", 450, 50, "ST: "),
+    Rule(50, 200, 700, 4, 4),
+    Font(55),
+    Field("customer", 50, 230),
+    Font(45),
+    Field("city_state", 50, 310),
+    Rule(50, 380, 700, 4, 4),
+    Font(35),
+    Field("invoice", 50, 410, "Invoice: ", optional=True),
+    Field("po", 450, 410, "PO: ", optional=True),
+    Field("pick_area", 50, 460, "Pick: ", optional=True),
+    Field("prod_date", 500, 460, "Prod: "),
+    Rule(50, 520, 700, 4, 4),
+])
 
-    Returns:
-        ZPL string for one label.
+# Customer 20815 gets PO-prominent layout
+PO_LAYOUT = Template([
+    Command("^FWN\n"),  # Reset field orientation to normal
+    Command("^PON\n"),  # Print orientation normal
+    Font(80),
+    Field("po", 50, 30, "PO: "),
+    Rule(50, 120, 700, 4, 4),
+    Font(100),
+    Field("route", 50, 140, "RT: "),
+    Field("stop", 400, 140, "ST: "),
+    Rule(50, 260, 700, 4, 4),
+    Font(50),
+    Field("customer", 50, 290),
+    Font(40),
+    Field("city_state", 50, 360),
+    Rule(50, 420, 700, 4, 4),
+    Font(35),
+    Field("invoice", 50, 450, "Invoice: "),
+    Field("pick_area", 50, 500, "Pick: "),
+    Field("prod_date", 500, 500, "Prod: "),
+])
+
+# Portrait 4x6 label at 203 DPI
+# 4" = 812 dots wide, 6" = 1218 dots tall
+PICK_LIST_HEADER = Template([
+    Command("^FWN\n"),  # Reset field orientation to normal (no rotation)
+    Command("^PON\n"),  # Print orientation normal
+    # Header at top
+    Font(35),
+    Field("title", 20, 20),
+    Field("prod_date", 500, 20, "Prod: "),
+    Field("page", 680, 20),
+    Rule(20, 60, 770, 3, 3),
+    # Column headers - tighter layout for 4" (812 dots)
+    Font(18),
+    Text(20, 70, "SLOT"),
+    Text(85, 70, "INV"),
+    Text(150, 70, "ORD"),
+    Text(185, 70, "SHP"),
+    Text(220, 70, "PO"),
+    Text(330, 70, "LN"),
+    Text(360, 70, "DESCRIPTION"),
+    Text(590, 70, "PK"),
+    Text(630, 70, "SIZE"),
+    Rule(20, 90, 770, 2, 2),
+    # Data rows
+    Font(18),
+])
+
+PICK_LIST_ROW = [
+    Field("slot", 20, 0, width=7),
+    Field("invoice", 85, 0, width=6),
+    Field("ordered", 150, 0),
+    Field("shipped", 185, 0),
+    Field("custpo", 220, 0, width=10),
+    Field("lineno", 330, 0),
+    Field("desc", 360, 0, width=18),
+    Field("pk", 590, 0, width=4),
+    Field("size", 630, 0, width=10),
+]
+
+ROWS_PER_LABEL = 12
+
+# One compiled row template per line on the page (first row at y=100, 24 dots apart)
+_PICK_LIST_ROWS = [Template(PICK_LIST_ROW, dy=100 + i * 24) for i in range(ROWS_PER_LABEL)]
+
+
+# --- Stored formats ---
+# The shipping label layouts are downloaded to the printer once (^DF) and
+# recalled per label (^XF) with only the ^FN field data, so the static
+# rules, fonts and positions are not resent.
+
+# layout -> (object name prefix, template)
+_STORED_FORMATS = {
+    "standard": ("LPSTD", STANDARD_LAYOUT),
+    "po": ("LPPO", PO_LAYOUT),
+}
+
+
+def _format_path(layout):
+    """Printer path of a layout's stored format, versioned by content hash."""
+    prefix, template = _STORED_FORMATS[layout]
+    version = hashlib.sha1(template.stored_body.encode("ascii")).hexdigest()[:6].upper()
+    return f"{LABEL_FORMAT_DEVICE}:{prefix}{version}.ZPL"
+
+
+_FORMAT_PATHS = {layout: _format_path(layout) for layout in _STORED_FORMATS}
+
+
+def stored_format_downloads():
+    """Return {layout: (path, zpl)} to download each stored format.
+
+    Each download first deletes older versions of the same layout so
+    stale formats do not pile up on the printer.
     """
-    route = str(data.get("ROUTE", "")).strip()
-    stop = str(data.get("STOP", "")).strip()
-    customer = str(data.get("CUSTOMER", "")).strip()
-    customer_no = str(data.get("CUSTOMER_NO", "")).strip()
+    downloads = {}
+    for layout, (prefix, template) in _STORED_FORMATS.items():
+        path = _FORMAT_PATHS[layout]
+        downloads[layout] = (
+            path,
+            f"^XA\n^ID{LABEL_FORMAT_DEVICE}:{prefix}*.ZPL^FS\n^XZ\n"
+            + template.stored_format(path),
+        )
+    return downloads
+
+
+def _label_values(data, prod_date):
+    """Return (layout, field values) for a shipping label row."""
     city = str(data.get("CITY", "")).strip()
     state = str(data.get("STATE") or data.get("STATE_CD") or "").strip()
+    values = {
+        "route": str(data.get("ROUTE", "")).strip(),
+        "stop": str(data.get("STOP", "")).strip(),
+        "customer": str(data.get("CUSTOMER", "")).strip(),
+        "city_state": f"{city}, {state}" if city and state else city or state,
+        "invoice": str(data.get("INVOICE_NO", "")).strip(),
+        "po": str(data.get("PO_NUM", "")).strip(),
+        "pick_area": str(data.get("PICK_AREA", "")).strip(),
+        "prod_date": prod_date,
+    }
+    if str(data.get("CUSTOMER_NO", "")).strip() == "20815":
+        return "po", values
+    return "standard", values
 
-    invoice = str(data.get("INVOICE_NO", "")).strip()
-    po = str(data.get("PO_NUM", "")).strip()
-    pick_area = str(data.get("PICK_AREA", "")).strip()
-    prod_date = _get_prod_date()
-
-    city_state = f"{city}, {state}" if city and state else city or state
-
-    # Customer 20815 gets PO-prominent layout
-    if customer_no == "20815":
-        zpl = (
-            "^XA\n"
-            "^FWN\n"  # Reset field orientation to normal
-            "^PON\n"  # Print orientation normal
-            "^CF0,80\n"
-            f"^FO50,30^FDPO: {po}^FS\n"
-            "^FO50,120^GB700,4,4^FS\n"
-            "^CF0,100\n"
-            f"^FO50,140^FDRT: {route}^FS\n"
-            f"^FO400,140^FDST: {stop}^FS\n"
-            "^FO50,260^GB700,4,4^FS\n"
-            "^CF0,50\n"
-            f"^FO50,290^FD{customer}^FS\n"
-            "^CF0,40\n"
-            f"^FO50,360^FD{city_state}^FS\n"
-            "^FO50,420^GB700,4,4^FS\n"
-            "^CF0,35\n"
-            f"^FO50,450^FDInvoice: {invoice}^FS\n"
-            f"^FO50,500^FDPick: {pick_area}^FS\n"
-            f"^FO500,500^FDProd: {prod_date}^FS\n"
-            "^XZ\n"
-        )
-    else:
-        # Standard layout
-        zpl = (
-            "^XA\n"
-            "^FWN\n"  # Reset field orientation to normal
-            "^PON\n"  # Print orientation normal
-            "^CF0,130\n"
-            f"^FO50,50^FDRT: {route}^FS\n"
-            f"^FO450,50^FDST: {stop}^FS\n"
-            "^FO50,200^GB700,4,4^FS\n"
-            "^CF0,55\n"
-            f"^FO50,230^FD{customer}^FS\n"
-            "^CF0,45\n"
-            f"^FO50,310^FD{city_state}^FS\n"
-            "^FO50,380^GB700,4,4^FS\n"
-            "^CF0,35\n"
-        )
 
-        if invoice:
-            zpl += f"^FO50,410^FDInvoice: {invoice}^FS\n"
-        if po:
-            zpl += f"^FO450,410^FDPO: {po}^FS\n"
-        if pick_area:
-            zpl += f"^FO50,460^FDPick: {pick_area}^FS\n"
+def generate_label_recall(data, quantity=1, prod_date=None):
+    """Generate ZPL that prints a label from its stored format (^XF).
 
-        zpl += f"^FO500,460^FDProd: {prod_date}^FS\n"
+    The printer must already hold the formats from stored_format_downloads().
+    """
+    layout, values = _label_values(data, prod_date or _get_prod_date())
+    return _STORED_FORMATS[layout][1].recall(_FORMAT_PATHS[layout], values, quantity)
 
-        zpl += (
-            "^FO50,520^GB700,4,4^FS\n"
-            "^XZ\n"
-        )
 
-    return zpl
+def generate_label(data, label_number=1, total_labels=1, quantity=1, prod_date=None):
+    """Generate ZPL for a single 4x6 shipping label at 203 DPI.
 
+    Args:
+        data: dict with keys: ROUTE, STOP, CUSTOMER, CITY, STATE (or STATE_CD),
+              and optionally INVOICE_NO, PO_NUM, PICK_AREA, CUSTOMER_NO.
+        label_number: current label number (1-based).
+        total_labels: total labels for this customer/invoice.
+        quantity: copies the printer should print of this format (^PQ).
+        prod_date: production date text (defaults to tomorrow).
 
-def generate_labels(data, total_labels=None):
+    Returns:
+        ZPL string for one label format.
+    """
+    layout, values = _label_values(data, prod_date or _get_prod_date())
+    return _STORED_FORMATS[layout][1].render(values, quantity)
+
+
+@metrics.timed("labelprinter_render_seconds", function="generate_labels")
+def generate_labels(data, total_labels=None, duplicate=False, stored=False, prod_date=None):
     """Generate ZPL for all labels for a given row.
 
+    Every copy of a label is identical, so by default a single format is
+    sent with ^PQ set to the label count and the printer makes the copies.
+
     Args:
         data: dict from DB query.
         total_labels: override label count (defaults to data['LABELS'] or 1).
+        duplicate: send one full format per copy instead of using ^PQ
+            (only needed once copies differ, e.g. printing "n of N").
+        stored: recall the printer's stored format (^XF) and send only the
+            field data; see formats.ensure_formats().
+        prod_date: production date text (defaults to tomorrow).
 
     Returns:
-        ZPL string containing all labels concatenated.
+        ZPL string for all labels of the row.
     """
     if total_labels is None:
         total_labels = int(data.get("LABELS", 1) or 1)
+    prod_date = prod_date or _get_prod_date()
 
-    parts = []
-    for i in range(1, total_labels + 1):
-        parts.append(generate_label(data, label_number=i, total_labels=total_labels))
-    return "".join(parts)
+    if stored:
+        return generate_label_recall(data, quantity=total_labels, prod_date=prod_date)
+    if not duplicate:
+        return generate_label(data, quantity=total_labels, prod_date=prod_date)
 
+    label = generate_label(data, prod_date=prod_date)
+    return label * total_labels
 
-def generate_pick_list_labels(items, region):
-    """Generate ZPL for pick list labels on 4x6 format.
+
+def iter_label_batch(rows, stored=False, prod_date=None):
+    """Yield a print job's ZPL one label format at a time, as UTF-8 bytes.
+
+    Lets the sender stream labels to the printer while later ones are
+    still being rendered. Render time is recorded per row by
+    generate_labels() (see bench/zpl_render.py for what that costs).
 
     Args:
-        items: List of dicts from longmod.picks query (should be pre-sorted)
-        region: Department/region code (e.g., 'W', 'C', 'MW' for Main Warehouse)
+        rows: iterable of (row dict, label count).
+        stored: recall stored formats (see generate_labels()).
+        prod_date: production date text (defaults to tomorrow), computed
+            once for the whole job.
+    """
+    prod_date = prod_date or _get_prod_date()
+    for data, count in rows:
+        yield generate_labels(
+            data, total_labels=count, stored=stored, prod_date=prod_date
+        ).encode("utf-8")
+
+
+def generate_label_batch(rows, stored=False):
+    """Generate ZPL for a print job.
+
+    Args:
+        rows: iterable of (row dict, label count).
+        stored: recall stored formats (see generate_labels()).
 
     Returns:
-        ZPL string for all pick list labels (multiple labels if > 12 items)
+        ZPL string for every row, with the production date computed once
+        for the whole job.
     """
-    if not items:
-        return ""
+    return b"".join(iter_label_batch(rows, stored=stored)).decode("utf-8")
+
+
+def _pick_row_values(item):
+    return {
+        "slot": str(item.get("LOCATION", "")).strip(),
+        "invoice": str(item.get("INVOICE", "")).strip(),
+        "ordered": str(int(item.get("ORDERED", 0) or 0)),
+        "shipped": str(int(item.get("SHIPPED", 0) or 0)),
+        "custpo": str(item.get("CUSTPO", "")).strip(),
+        "lineno": str(int(item.get("LINENO", 0) or 0)),
+        "desc": str(item.get("DESCRIPTION", "")).strip(),
+        "pk": str(item.get("QTY2", "")).strip(),
+        "size": str(item.get("SIZE", "")).strip(),
+    }
+
 
-    # Portrait 4x6 label at 203 DPI
-    # 4" = 812 dots wide, 6" = 1218 dots tall
-    ROWS_PER_LABEL = 12
-    labels = []
+@metrics.timed("labelprinter_render_seconds", function="iter_pick_list_labels")
+def iter_pick_list_labels(items, region, prod_date=None):
+    """Yield pick list labels one page at a time, as UTF-8 bytes.
+
+    Args:
+        items: List of dicts from longmod.picks query (should be pre-sorted)
+        region: Department/region code (e.g., 'W', 'C', 'MW' for Main Warehouse)
+        prod_date: production date text (defaults to tomorrow).
+    """
+    if not items:
+        return
 
     # Display name for region
     region_name = "Main Warehouse" if region == "MW" else f"DEPT {region}"
+    header = {
+        "title": f"{region_name} PICK LIST",
+        "prod_date": prod_date or _get_prod_date(),
+    }
+    total_pages = (len(items) + ROWS_PER_LABEL - 1) // ROWS_PER_LABEL
 
     for page_start in range(0, len(items), ROWS_PER_LABEL):
         page_items = items[page_start:page_start + ROWS_PER_LABEL]
-        page_num = (page_start // ROWS_PER_LABEL) + 1
-        total_pages = (len(items) + ROWS_PER_LABEL - 1) // ROWS_PER_LABEL
-
-        zpl = (
-            "^XA\n"
-            "^FWN\n"  # Reset field orientation to normal (no rotation)
-            "^PON\n"  # Print orientation normal
-            # Header at top
-            "^CF0,35\n"
-            f"^FO20,20^FD{region_name} PICK LIST^FS\n"
-            f"^FO500,20^FDProd: {_get_prod_date()}^FS\n"
-            f"^FO680,20^FD{page_num}/{total_pages}^FS\n"
-            "^FO20,60^GB770,3,3^FS\n"
-            # Column headers - tighter layout for 4" (812 dots)
-            "^CF0,18\n"
-            "^FO20,70^FDSLOT^FS\n"
-            "^FO85,70^FDINV^FS\n"
-            "^FO150,70^FDORD^FS\n"
-            "^FO185,70^FDSHP^FS\n"
-            "^FO220,70^FDPO^FS\n"
-            "^FO330,70^FDLN^FS\n"
-            "^FO360,70^FDDESCRIPTION^FS\n"
-            "^FO590,70^FDPK^FS\n"
-            "^FO630,70^FDSIZE^FS\n"
-            "^FO20,90^GB770,2,2^FS\n"
-            # Data rows
-            "^CF0,18\n"
-        )
+        header["page"] = f"{page_start // ROWS_PER_LABEL + 1}/{total_pages}"
+
+        out = ["^XA\n", PICK_LIST_HEADER.body(header)]
+        for row_template, item in zip(_PICK_LIST_ROWS, page_items):
+            out.append(row_template.body(_pick_row_values(item)))
+        out.append("^XZ\n")
+        yield "".join(out).encode("utf-8")
+
 
-        y = 100  # Starting vertical position for first data row
-        row_height = 24
-        for item in page_items:
-            slot = str(item.get("LOCATION", "")).strip()[:7]
-            invoice = str(item.get("INVOICE", "")).strip()[:6]
-            ordered = str(int(item.get("ORDERED", 0) or 0))
-            shipped = str(int(item.get("SHIPPED", 0) or 0))
-            custpo = str(item.get("CUSTPO", "")).strip()[:10]
-            lineno = str(int(item.get("LINENO", 0) or 0))
-            desc = str(item.get("DESCRIPTION", "")).strip()[:18]
-            pk = str(item.get("QTY2", "")).strip()[:4]
-            size = str(item.get("SIZE", "")).strip()[:10]
-
-            zpl += (
-                f"^FO20,{y}^FD{slot}^FS\n"
-                f"^FO85,{y}^FD{invoice}^FS\n"
-                f"^FO150,{y}^FD{ordered}^FS\n"
-                f"^FO185,{y}^FD{shipped}^FS\n"
-                f"^FO220,{y}^FD{custpo}^FS\n"
-                f"^FO330,{y}^FD{lineno}^FS\n"
-                f"^FO360,{y}^FD{desc}^FS\n"
-                f"^FO590,{y}^FD{pk}^FS\n"
-                f"^FO630,{y}^FD{size}^FS\n"
-            )
-            y += row_height
-
-        zpl += "^XZ\n"
-        labels.append(zpl)
-
-    return "".join(labels)
+def generate_pick_list_labels(items, region, prod_date=None):
+    """Generate ZPL for pick list labels on 4x6 format.
+
+    Args:
+        items: List of dicts from longmod.picks query (should be pre-sorted)
+        region: Department/region code (e.g., 'W', 'C', 'MW' for Main Warehouse)
+        prod_date: production date text (defaults to tomorrow).
+
+    Returns:
+        ZPL string for all pick list labels (multiple labels if > 12 items)
+    """
+    return b"".join(iter_pick_list_labels(items, region, prod_date)).decode("utf-8")
@@ -0,0 +1,132 @@
+"""Declarative ZPL layouts compiled into fast renderers.
+
+A layout is a list of elements (commands, fonts, captions, rules and
+fields). It is compiled once into a %-format string with one slot per
+field, so rendering a label is a single string formatting call instead of
+many concatenations.
+The same declaration also produces the stored (^DF) and recall (^XF) forms.
+"""
+from collections import namedtuple
+from operator import itemgetter
+
+# Static ZPL emitted as-is, e.g. "^FWN\n"
+Command = namedtuple("Command", "zpl")
+
+# Default font (^CF0) height for the fields that follow
+Font = namedtuple("Font", "height")
+
+# Fixed caption printed at a position
+Text = namedtuple("Text", "x y text")
+
+# Horizontal/vertical line drawn with ^GB
+Rule = namedtuple("Rule", "x y width height thickness")
+
+# Variable text. ``caption`` is printed before the value, ``width`` truncates
+# the value, and ``optional`` fields are left out entirely when empty.
+Field = namedtuple("Field", "name x y caption width optional", defaults=("", None, False))
+
+
+def _escape(text):
+    return text.replace("%", "%%")
+
+
+class Template:
+    """A compiled label layout.
+
+    Args:
+        elements: layout elements in print order.
+        dy: vertical offset added to every position (used for table rows).
+    """
+
+    def __init__(self, elements, dy=0):
+        self.elements = list(elements)
+        self.fields = [e for e in self.elements if isinstance(e, Field)]
+
+        full = []  # %-format of the printed body
+        stored = []  # body of the stored format with ^FN placeholders
+        names = []  # field name per %-slot
+        self._optional = []  # (slot index, width, prefix, suffix) for optional fields
+        number = 0
+        for element in self.elements:
+            if isinstance(element, Command):
+                full.append(_escape(element.zpl))
+                stored.append(element.zpl)
+            elif isinstance(element, Font):
+                text = f"^CF0,{element.height}\n"
+                full.append(text)
+                stored.append(text)
+            elif isinstance(element, Text):
+                text = f"^FO{element.x},{element.y + dy}^FD{element.text}^FS\n"
+                full.append(_escape(text))
+                stored.append(text)
+            elif isinstance(element, Rule):
+                text = (
+                    f"^FO{element.x},{element.y + dy}"
+                    f"^GB{element.width},{element.height},{element.thickness}^FS\n"
+                )
+                full.append(text)
+                stored.append(text)
+            else:
+                number += 1
+                origin = f"^FO{element.x},{element.y + dy}"
+                stored.append(f"{origin}^FN{number}^FS\n")
+                if element.optional:
+                    self._optional.append(
+                        (len(names), element.width, f"{origin}^FD{element.caption}", "^FS\n")
+                    )
+                    full.append("%s")
+                else:
+                    # %.Ns truncates to the field width in C
+                    slot = "%s" if element.width is None else f"%.{element.width}s"
+                    full.append(f"{_escape(origin)}^FD{_escape(element.caption)}{slot}^FS\n")
+                names.append(element.name)
+
+        self._format = "".join(full)
+        self.stored_body = "".join(stored)
+        if not names:
+            self._gather = lambda values: ()
+        elif len(names) == 1:
+            name = names[0]
+            self._gather = lambda values: (values[name],)
+        else:
+            self._gather = itemgetter(*names)
+
+    def _values(self, values):
+        args = self._gather(values)
+        if not self._optional:
+            return args
+        args = list(args)
+        for index, width, prefix, suffix in self._optional:
+            value = args[index]
+            if width is not None:
+                value = value[:width]
+            args[index] = f"{prefix}{value}{suffix}" if value else ""
+        return tuple(args)
+
+    def body(self, values):
+        """Render the layout without the ^XA/^XZ wrapper."""
+        return self._format % self._values(values)
+
+    def render(self, values, quantity=1):
+        """Render a complete label format, printed ``quantity`` times."""
+        pq = f"^PQ{quantity}\n" if quantity > 1 else ""
+        return f"^XA\n{self.body(values)}{pq}^XZ\n"
+
+    def stored_format(self, path):
+        """ZPL that downloads this layout to the printer as ``path`` (^DF)."""
+        return f"^XA\n^DF{path}^FS\n{self.stored_body}^XZ\n"
+
+    def recall(self, path, values, quantity=1):
+        """ZPL that prints the stored format ``path`` with only the field data."""
+        parts = [f"^XA\n^XF{path}^FS\n"]
+        for number, field in enumerate(self.fields, start=1):
+            value = values[field.name]
+            if field.width is not None:
+                value = value[:field.width]
+            if field.optional and not value:
+                continue
+            parts.append(f"^FN{number}^FD{field.caption}{value}^FS\n")
+        if quantity > 1:
+            parts.append(f"^PQ{quantity}\n")
+        parts.append("^XZ\n")
+        return "".join(parts)
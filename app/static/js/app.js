@@ -31,6 +31,303 @@ document.addEventListener("DOMContentLoaded", function () {
     }
 });
 
+function escapeHtml(value) {
+    return String(value).replace(/[&<>"']/g, function (ch) {
+        return {"&": "&amp;", "<": "&lt;", ">": "&gt;", '"': "&quot;", "'": "&#39;"}[ch];
+    });
+}
+
+// Route review: a virtualized table fed a page at a time by the rows API.
+// Only the rows in view are in the DOM, so selection is kept by row key:
+// every row is ticked unless its key is toggled (or the reverse after
+// Deselect All). The form posts select_all plus the unticked keys, or the
+// ticked keys, so rows that were never scrolled to print too.
+document.addEventListener("DOMContentLoaded", function () {
+    var container = document.getElementById("reviewTable");
+    if (!container) return;
+
+    var form = document.getElementById("reviewForm");
+    var tbody = container.querySelector("tbody");
+    var status = document.getElementById("reviewStatus");
+    var countLabel = document.getElementById("reviewCount");
+    var checkAll = document.getElementById("reviewCheckAll");
+    var first = JSON.parse(document.getElementById("reviewFirstPage").textContent);
+
+    var BUFFER = 15;  // rows rendered above and below the view
+    var rowHeight = 42;  // re-measured from the first rendered row
+    var items = [];  // {dept: ...} headers and {row: ...} entries in display order
+    var total = first.total;
+    var selection = first.selection;
+    var loaded = 0;
+    var nextCursor = null;
+    var loading = false;
+    var lastDept = null;
+    var allSelected = true;
+    var toggled = Object.create(null);
+    var toggledCount = 0;
+    var frame = null;
+
+    function isChecked(key) {
+        return allSelected !== Boolean(toggled[key]);
+    }
+
+    function selectedCount() {
+        return allSelected ? total - toggledCount : toggledCount;
+    }
+
+    function updateCount() {
+        var count = selectedCount();
+        countLabel.textContent = count + " of " + total + " selected";
+        checkAll.checked = count === total;
+        checkAll.indeterminate = count > 0 && count < total;
+    }
+
+    function addPage(page) {
+        page.rows.forEach(function (row) {
+            if (row.PICK_AREA !== lastDept) {
+                lastDept = row.PICK_AREA;
+                items.push({dept: row.PICK_AREA});
+            }
+            items.push({row: row});
+        });
+        loaded += page.rows.length;
+        nextCursor = page.next_cursor;
+    }
+
+    function loadMore() {
+        if (loading || !nextCursor) return;
+        loading = true;
+        status.textContent = "Loading rows…";
+        var url = container.dataset.rowsUrl
+            + (container.dataset.rowsUrl.indexOf("?") === -1 ? "?" : "&")
+            + "selection=" + encodeURIComponent(selection)
+            + "&cursor=" + encodeURIComponent(nextCursor);
+        fetch(url, {headers: {"Accept": "application/json"}})
+            .then(function (response) {
+                return response.json().then(function (body) {
+                    if (!response.ok) throw new Error(body.error || response.statusText);
+                    return body;
+                });
+            })
+            .then(function (page) {
+                loading = false;
+                status.textContent = "";
+                addPage(page);
+                render();
+            })
+            .catch(function (err) {
+                loading = false;
+                status.textContent = "Could not load more rows: " + err.message;
+            });
+    }
+
+    function spacer(height) {
+        return '<tr class="virtual-spacer"><td colspan="7" style="height: ' + height + 'px"></td></tr>';
+    }
+
+    function render() {
+        var top = container.scrollTop;
+        var start = Math.max(0, Math.floor(top / rowHeight) - BUFFER);
+        var end = Math.min(items.length, Math.ceil((top + container.clientHeight) / rowHeight) + BUFFER);
+        var html = [spacer(start * rowHeight)];
+        for (var i = start; i < end; i++) {
+            var item = items[i];
+            if (item.row === undefined) {
+                html.push('<tr class="dept-header"><td colspan="7">Department ' + escapeHtml(item.dept) + "</td></tr>");
+                continue;
+            }
+            var row = item.row;
+            html.push(
+                "<tr>"
+                + '<td><input type="checkbox" class="review-check" data-key="' + escapeHtml(row.key) + '"'
+                + (isChecked(row.key) ? " checked" : "") + "></td>"
+                + '<td><span class="dept-badge">' + escapeHtml(row.PICK_AREA) + "</span></td>"
+                + '<td class="fw-600">' + escapeHtml(row.STOP) + "</td>"
+                + "<td>" + escapeHtml(row.CUSTOMER) + "</td>"
+                + "<td>" + escapeHtml(row.INVOICE_NO) + "</td>"
+                + "<td>" + escapeHtml(row.PO_NUM) + "</td>"
+                + "<td>" + escapeHtml(row.LABELS) + "</td>"
+                + "</tr>"
+            );
+        }
+        // Rows not fetched yet still take up space so the scrollbar is right
+        html.push(spacer((items.length - end + total - loaded) * rowHeight));
+        tbody.innerHTML = html.join("");
+
+        var sample = tbody.querySelector("tr:not(.virtual-spacer)");
+        if (sample && sample.offsetHeight && sample.offsetHeight !== rowHeight) {
+            rowHeight = sample.offsetHeight;
+            render();
+            return;
+        }
+        if (end + BUFFER >= items.length) loadMore();
+    }
+
+    function setAll(checked) {
+        allSelected = checked;
+        toggled = Object.create(null);
+        toggledCount = 0;
+        updateCount();
+        render();
+    }
+
+    container.addEventListener("scroll", function () {
+        if (frame === null) {
+            frame = requestAnimationFrame(function () {
+                frame = null;
+                render();
+            });
+        }
+    });
+    window.addEventListener("resize", render);
+
+    tbody.addEventListener("change", function (event) {
+        var key = event.target.dataset.key;
+        if (key === undefined) return;
+        if (toggled[key]) {
+            delete toggled[key];
+            toggledCount--;
+        } else {
+            toggled[key] = true;
+            toggledCount++;
+        }
+        updateCount();
+    });
+
+    checkAll.addEventListener("change", function () { setAll(checkAll.checked); });
+    document.getElementById("reviewSelectAll").addEventListener("click", function () { setAll(true); });
+    document.getElementById("reviewDeselectAll").addEventListener("click", function () { setAll(false); });
+
+    form.addEventListener("submit", function () {
+        form.querySelectorAll("input.review-field").forEach(function (input) { input.remove(); });
+        function addField(name, value) {
+            var input = document.createElement("input");
+            input.type = "hidden";
+            input.className = "review-field";
+            input.name = name;
+            input.value = value;
+            form.appendChild(input);
+        }
+        if (allSelected) addField("select_all", "1");
+        Object.keys(toggled).forEach(function (key) {
+            addField(allSelected ? "deselected" : "selected", key);
+        });
+    });
+
+    addPage(first);
+    updateCount();
+    render();
+});
+
+// Ad hoc typeahead: suggest customers as the operator types. Lookups wait
+// for a pause in typing, a newer lookup cancels the one in flight, and
+// answers are kept per term so backspacing does not ask again.
+document.addEventListener("DOMContentLoaded", function () {
+    var input = document.getElementById("adhocSearch");
+    var list = document.getElementById("adhocSuggest");
+    if (!input || !list) return;
+
+    var DELAY = 250;  // ms of no typing before a lookup
+    var minChars = parseInt(input.dataset.minChars, 10) || 3;
+    var searchUrl = input.form.getAttribute("action");
+    var answers = {};  // upper-cased term -> results
+    var timer = null;
+    var controller = null;
+    var active = -1;
+
+    function items() {
+        return list.querySelectorAll(".suggest-item");
+    }
+
+    function hide() {
+        list.classList.add("d-none");
+        active = -1;
+    }
+
+    function highlight(index) {
+        var links = items();
+        if (!links.length) return;
+        active = (index + links.length) % links.length;
+        links.forEach(function (link, i) { link.classList.toggle("active", i === active); });
+        links[active].scrollIntoView({block: "nearest"});
+    }
+
+    function show(results) {
+        if (!results.length) {
+            list.innerHTML = '<div class="suggest-empty">No customers found.</div>';
+        } else {
+            list.innerHTML = results.map(function (c) {
+                var where = [c.city, c.state].filter(Boolean).join(", ");
+                var detail = "#" + c.customer_no + (where ? " · " + where : "")
+                    + (c.route ? " · Route " + c.route + " / Stop " + c.stop : "")
+                    + (c.rows > 1 ? " · " + c.rows + " orders" : "");
+                return '<a class="suggest-item" role="option" href="' + searchUrl + "?q="
+                    + encodeURIComponent(c.customer_no) + '">' + escapeHtml(c.customer)
+                    + "<small>" + escapeHtml(detail) + "</small></a>";
+            }).join("");
+        }
+        active = -1;
+        list.classList.remove("d-none");
+    }
+
+    function lookup(term) {
+        var key = term.toUpperCase();
+        if (answers[key]) {
+            show(answers[key]);
+            return;
+        }
+        if (controller) controller.abort();
+        var mine = controller = new AbortController();
+        function done() {
+            if (controller === mine) controller = null;
+        }
+        fetch(input.dataset.suggestUrl + "?q=" + encodeURIComponent(term), {
+            signal: mine.signal,
+            headers: {"Accept": "application/json"},
+        })
+            .then(function (response) { return response.json(); })
+            .then(function (body) {
+                done();
+                if (body.error) return;
+                answers[key] = body.results;
+                // Only show it if it still matches what is typed
+                if (input.value.trim().toUpperCase() === key) show(body.results);
+            })
+            .catch(done);
+    }
+
+    input.addEventListener("input", function () {
+        clearTimeout(timer);
+        var term = input.value.trim();
+        if (term.length < minChars) {
+            if (controller) controller.abort();
+            hide();
+            return;
+        }
+        timer = setTimeout(function () { lookup(term); }, DELAY);
+    });
+
+    input.addEventListener("keydown", function (event) {
+        if (list.classList.contains("d-none")) return;
+        if (event.key === "ArrowDown" || event.key === "ArrowUp") {
+            event.preventDefault();
+            highlight(active + (event.key === "ArrowDown" ? 1 : -1));
+        } else if (event.key === "Enter" && active >= 0) {
+            event.preventDefault();
+            window.location.href = items()[active].href;
+        } else if (event.key === "Escape") {
+            hide();
+        }
+    });
+
+    // A click on a suggestion lands before the input loses focus
+    input.addEventListener("blur", function () { setTimeout(hide, 150); });
+    input.form.addEventListener("submit", function () {
+        clearTimeout(timer);
+        if (controller) controller.abort();
+    });
+});
+
 // Toggle edit mode for admin printer rows
 function toggleEdit(index) {
     document.querySelectorAll(".printer-display-" + index).forEach(function (el) {
@@ -0,0 +1,19 @@
+"""WSGI entry point: the app on the benchmark's SQLite longmod database.
+
+Used by bench.loadtest to serve the app from gunicorn:
+
+    BENCH_LONGMOD=/tmp/longmod.db gunicorn bench.fake_app:app
+
+BENCH_DB_LATENCY adds seconds to each DB2 statement (see
+fake_db2.connect()). The rest of the settings (state files, PRINTER_PORT)
+come from the environment as usual.
+"""
+import os
+
+from bench import fake_db2
+
+fake_db2.install(os.environ["BENCH_LONGMOD"], float(os.environ.get("BENCH_DB_LATENCY", "0")))
+
+from app import create_app  # noqa: E402  (after the DB2 stand-in is installed)
+
+app = create_app()
@@ -0,0 +1,192 @@
+"""SQLite stand-in for the iSeries, for benchmarks.
+
+generate() writes a synthetic longmod database (vbatch_labels, picks and
+VONEOFF_LASTSTOP) at a chosen scale; install() points app.services.db2 at
+it, so the real queries, pool, cache and routes run unchanged against
+local data. Values are padded like DB2 CHAR columns so the stripping code
+does real work, and ORDER BY puts NULLs last as DB2 does. With
+``ebcdic=True`` the CHAR columns also sort in EBCDIC like the iSeries
+(slower, so only the parity check uses it).
+"""
+import math
+import random
+import re
+import sqlite3
+import time
+
+# Departments rows are picked from (PICK_AREA), and customer 20815's share
+DEPARTMENTS = ("D", "F", "C", "MW")
+PICK_20815 = 0.05
+
+_CITIES = [("DALLAS", "TX", "75201"), ("FORT WORTH", "TX", "76102"), ("TYLER", "TX", "75701"),
+           ("SHREVEPORT", "LA", "71101"), ("DURANT", "OK", "74701")]
+_WORDS = ["CHICKEN", "BEEF", "PORK", "BREAST", "THIGH", "GROUND", "PATTY", "WING",
+          "FILLET", "SAUSAGE", "BACON", "TENDER", "STRIP", "ROAST", "DICED"]
+_LOCATION_FIRST = "ABCDEFMNPRSTW0123456789"
+
+
+def _char(value, width):
+    return str(value).ljust(width)
+
+
+def _ebcdic(a, b):
+    """SQLite collation comparing like DB2 CHAR: blank-padded, in EBCDIC."""
+    a = a.rstrip(" ").encode("cp037", "replace")
+    b = b.rstrip(" ").encode("cp037", "replace")
+    return (a > b) - (a < b)
+
+
+def generate(path, routes=20, stops=40, oneoff=500, picks_per_invoice=25, seed=1,
+             ebcdic=False, char_stops=False, null_locations=False):
+    """Write a synthetic longmod database to ``path`` (replacing it).
+
+    Every route gets ``stops`` stops, each with one invoice in two or three
+    departments and 1-8 labels per invoice. About PICK_20815 of the stops
+    are customer 20815, whose invoices get ``picks_per_invoice`` pick rows.
+    ``ebcdic`` gives the text columns an EBCDIC collation (see connect());
+    ``char_stops`` makes vbatch_labels.STOP a CHAR(4) column, as on some
+    installs, with a few blank and NULL stops; ``null_locations`` leaves a
+    few pick lines without a LOCATION.
+
+    Returns:
+        Dict of row counts per table.
+    """
+    rnd = random.Random(seed)
+    conn = sqlite3.connect(path)
+    conn.create_collation("EBCDIC", _ebcdic)
+    text = "TEXT COLLATE EBCDIC" if ebcdic else "TEXT"
+    try:
+        for table in ("vbatch_labels", "picks", "VONEOFF_LASTSTOP"):
+            conn.execute(f"DROP TABLE IF EXISTS {table}")
+        conn.execute(
+            f"CREATE TABLE vbatch_labels (INVOICE_NO INTEGER, CUSTOMER_NO INTEGER, CUSTOMER {text}, "
+            f"ADDRESS {text}, CITY {text}, STATE {text}, ZIP {text}, PO_NUM {text}, ROUTE {text}, "
+            f"STOP {text if char_stops else 'INTEGER'}, PICK_AREA {text}, LABELS INTEGER)"
+        )
+        conn.execute(
+            f"CREATE TABLE picks (CUSTNO INTEGER, INVOICE INTEGER, LINENO INTEGER, CUSTPO {text}, "
+            f"SKU {text}, QTY2 {text}, SIZE {text}, DESCRIPTION {text}, LOCATION {text}, "
+            "ORDERED INTEGER, SHIPPED INTEGER)"
+        )
+        conn.execute(
+            f"CREATE TABLE VONEOFF_LASTSTOP (CUSTOMER_NO INTEGER, CUSTOMER {text}, ADDRESS {text}, "
+            f"CITY {text}, STATE_CD {text}, ZIP {text}, ROUTE {text}, STOP INTEGER)"
+        )
+
+        labels, picks = [], []
+        invoice = 500000
+        for route in range(1, routes + 1):
+            for stop in range(1, stops + 1):
+                customer_no = 20815 if rnd.random() < PICK_20815 else 10000 + rnd.randrange(90000)
+                city, state, zip_code = rnd.choice(_CITIES)
+                stop_value = stop
+                if char_stops:
+                    missing = rnd.random()
+                    stop_value = None if missing < 0.03 else _char("" if missing < 0.06 else stop, 4)
+                for dept in rnd.sample(DEPARTMENTS, rnd.randint(2, 3)):
+                    invoice += 1
+                    po = f"PO{rnd.randrange(10 ** 7)}" if rnd.random() < 0.7 else ""
+                    labels.append((
+                        invoice, customer_no, _char(f"CUSTOMER {customer_no}", 30),
+                        _char(f"{rnd.randint(100, 9999)} MAIN ST", 30), _char(city, 20),
+                        state, _char(zip_code, 10), _char(po, 15), _char(route, 4), stop_value,
+                        _char(dept, 3), rnd.randint(1, 8),
+                    ))
+                    if customer_no != 20815:
+                        continue
+                    for line in range(1, picks_per_invoice + 1):
+                        location = _char(rnd.choice(_LOCATION_FIRST) + f"{rnd.randrange(10 ** 5):05d}", 8)
+                        if null_locations and rnd.random() < 0.03:
+                            location = None
+                        ordered = rnd.randint(1, 24)
+                        picks.append((
+                            customer_no, invoice, line, _char(po, 15), f"{rnd.randrange(10 ** 6):06d}",
+                            _char(rnd.choice(["6", "12", "1"]), 4),
+                            _char(rnd.choice(["10 LB", "4/5 LB", "40 LB"]), 10),
+                            _char(" ".join(rnd.sample(_WORDS, 3)), 30), location,
+                            ordered, rnd.randint(0, ordered),
+                        ))
+        oneoffs = []
+        for i in range(oneoff):
+            city, state, zip_code = rnd.choice(_CITIES)
+            oneoffs.append((
+                30000 + i, _char(f"ONE OFF {rnd.choice(_WORDS)} {i}", 30), _char("2 ELM ST", 30),
+                _char(city, 20), state, _char(zip_code, 10), _char(rnd.randint(1, routes), 4),
+                rnd.randint(1, stops),
+            ))
+
+        conn.executemany(f"INSERT INTO vbatch_labels VALUES ({','.join('?' * 12)})", labels)
+        conn.executemany(f"INSERT INTO picks VALUES ({','.join('?' * 11)})", picks)
+        conn.executemany(f"INSERT INTO VONEOFF_LASTSTOP VALUES ({','.join('?' * 8)})", oneoffs)
+        conn.commit()
+    finally:
+        conn.close()
+    return {"vbatch_labels": len(labels), "picks": len(picks), "VONEOFF_LASTSTOP": len(oneoffs)}
+
+
+class _Row(tuple):
+    """Result row with pyodbc-style attribute access (row.ROUTE)."""
+
+    def __getattr__(self, name):
+        try:
+            return self[self.columns.index(name)]
+        except ValueError:
+            raise AttributeError(name) from None
+
+
+def _row_factory(cursor, values):
+    row = _Row(values)
+    row.columns = [desc[0] for desc in cursor.description]
+    return row
+
+
+_ORDER_BY = re.compile(r"\bORDER BY\s+(.+)$", re.DOTALL)
+
+
+def _nulls_last(sql):
+    """DB2 sorts NULLs after every value, SQLite before."""
+    match = _ORDER_BY.search(sql)
+    if not match:
+        return sql
+    terms = ", ".join(f"{term.strip()} NULLS LAST" for term in match.group(1).split(","))
+    return sql[:match.start(1)] + terms
+
+
+class _Cursor(sqlite3.Cursor):
+    def execute(self, sql, params=()):
+        if self.connection.latency:
+            time.sleep(self.connection.latency)
+        return super().execute(_nulls_last(sql), params)
+
+
+class _Connection(sqlite3.Connection):
+    latency = 0.0
+
+    def cursor(self, factory=_Cursor):
+        return super().cursor(factory)
+
+
+def connect(path, latency=0.0):
+    """Open a DB2-like connection: ``path`` attached as longmod.
+
+    ``latency`` seconds are added to every statement to stand in for the
+    network round trip to the iSeries.
+    """
+    conn = sqlite3.connect(":memory:", check_same_thread=False, factory=_Connection)
+    conn.latency = latency
+    conn.row_factory = _row_factory
+    conn.create_collation("EBCDIC", _ebcdic)
+    conn.execute("ATTACH DATABASE ? AS longmod", (path,))
+    conn.execute("ATTACH DATABASE ':memory:' AS SYSIBM")
+    conn.execute("CREATE TABLE SYSIBM.SYSDUMMY1 (IBMREQD TEXT)")
+    conn.execute("INSERT INTO SYSIBM.SYSDUMMY1 VALUES ('Y')")
+    conn.create_function("CEILING", 1, lambda x: None if x is None else math.ceil(x))
+    return conn
+
+
+def install(path, latency=0.0):
+    """Make app.services.db2 open its pooled connections on ``path``."""
+    from app.services import db2
+
+    db2._connect = lambda: connect(path, latency)
+    db2._pool = None
@@ -0,0 +1,154 @@
+"""A local TCP listener that behaves enough like a Zebra for benchmarks.
+
+It accepts the app's persistent connections, splits the stream into
+^XA...^XZ formats and counts the labels they print (^PQ copies
+included). Stored format downloads (^DF) and deletes (^ID) are tracked
+and listed for ^HW, and ~HS is answered as a ready printer, so
+formats.py and health.py work as they do against real printers.
+
+``label_delay`` seconds per printed label makes the listener read no
+faster than a printer can print, so senders see the backpressure of a
+slow drain.
+"""
+import fnmatch
+import re
+import socketserver
+import threading
+import time
+
+_FORMAT_END = re.compile(rb"\^XZ", re.IGNORECASE)
+_QUANTITY = re.compile(rb"\^PQ(\d+)")
+_DOWNLOAD = re.compile(rb"\^DF(\w:[\w.]+)")
+_DELETE = re.compile(rb"\^ID(\w:[\w.*]+)")
+_HOST_STATUS = (
+    b"\x02030,0,0,1245,000,0,0,0,000,0,0,0\x03\r\n"
+    b"\x02001,0,0,0,1,2,4,0,00000000,1,000\x03\r\n"
+    b"\x021234,0\x03\r\n"
+)
+
+
+class FakeZebra:
+    """Counting Zebra stand-in; use as a context manager or start()/stop()."""
+
+    def __init__(self, host="127.0.0.1", port=0, label_delay=0.0):
+        self.label_delay = label_delay
+        self.files = set()
+        self._lock = threading.Lock()
+        self.reset()
+        zebra = self
+
+        class Handler(socketserver.BaseRequestHandler):
+            def handle(self):
+                zebra._serve(self.request)
+
+        self._server = socketserver.ThreadingTCPServer((host, port), Handler, bind_and_activate=False)
+        self._server.allow_reuse_address = True
+        self._server.daemon_threads = True
+        self._server.server_bind()
+        self._server.server_activate()
+
+    @property
+    def port(self):
+        return self._server.server_address[1]
+
+    def reset(self):
+        """Zero the counters (stored formats are kept, as on a printer)."""
+        with self._lock:
+            self.labels = 0
+            self.formats = 0
+            self.label_bytes = 0
+            self.bytes = 0
+            self.connections = 0
+            self.last_activity = time.monotonic()
+
+    def counters(self):
+        with self._lock:
+            return {
+                "labels": self.labels,
+                "formats": self.formats,
+                "label_bytes": self.label_bytes,
+                "bytes": self.bytes,
+                "connections": self.connections,
+            }
+
+    def wait(self, labels, timeout=60, quiet=2.0):
+        """Wait until ``labels`` labels are in, or nothing happened for ``quiet`` seconds.
+
+        A slow drain leaves labels in the socket buffers after the sender
+        is done. Returns the label count.
+        """
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            with self._lock:
+                if self.labels >= labels or time.monotonic() - self.last_activity > quiet:
+                    return self.labels
+            time.sleep(0.05)
+        return self.labels
+
+    def start(self):
+        threading.Thread(target=self._server.serve_forever, name="fake-zebra", daemon=True).start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def _serve(self, sock):
+        with self._lock:
+            self.connections += 1
+        buffer = b""
+        while True:
+            try:
+                data = sock.recv(65536)
+            except OSError:
+                return
+            if not data:
+                return
+            with self._lock:
+                self.bytes += len(data)
+                self.last_activity = time.monotonic()
+            buffer += data
+            if b"~HS" in buffer:
+                buffer = buffer.replace(b"~HS", b"")
+                sock.sendall(_HOST_STATUS)
+            start = 0
+            for match in _FORMAT_END.finditer(buffer):
+                reply, printed = self._format(buffer[start:match.end()])
+                start = match.end()
+                if reply:
+                    sock.sendall(reply)
+                if printed and self.label_delay:
+                    time.sleep(printed * self.label_delay)
+            buffer = buffer[start:]
+
+    def _format(self, zpl):
+        """Handle one ^XA...^XZ format; returns (reply, labels printed)."""
+        download = _DOWNLOAD.search(zpl)
+        if download:
+            with self._lock:
+                self.files.add(download.group(1).decode().upper())
+            return None, 0
+        delete = _DELETE.search(zpl)
+        if delete:
+            pattern = delete.group(1).decode().upper()
+            with self._lock:
+                self.files = {path for path in self.files if not fnmatch.fnmatch(path, pattern)}
+            return None, 0
+        if b"^HW" in zpl:
+            with self._lock:
+                listing = "".join(f"* {path}  1024\r\n" for path in sorted(self.files))
+            return f"\x02\r\n- DIR R:*.ZPL\r\n{listing}-  1000000 bytes free\r\n\x03".encode(), 0
+        quantity = _QUANTITY.search(zpl)
+        printed = int(quantity.group(1)) if quantity else 1
+        with self._lock:
+            self.formats += 1
+            self.labels += printed
+            self.label_bytes += len(zpl.strip())
+            self.last_activity = time.monotonic()
+        return None, printed
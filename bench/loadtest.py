@@ -0,0 +1,268 @@
+"""Load test: concurrent operator sessions against gunicorn worker models.
+
+Serves the app from gunicorn (bench.fake_app, on the fake DB2 and a fake
+Zebra from bench.fake_db2 / bench.fake_zebra) once per worker model and
+runs scripted operator sessions against it at increasing concurrency.
+Each session does what an operator does at shift start: set the
+printer, open the route list, review a route/department, print it,
+search ad hoc and print a few of the results.
+
+For every model and concurrency level it reports sessions/sec,
+requests/sec, latency percentiles, errors and labels/sec at the printer,
+which is the curve to size worker counts on the Pi with.
+
+    python -m bench.loadtest [--models sync:2,gthread:2:4] [--concurrency 1,2,4,8,10]
+                             [--duration 20] [--db-latency 0.02] [--label-delay 0.005]
+                             [--csv results.csv]
+
+A model is ``worker_class:workers[:threads]``; gevent models are skipped
+when gevent is not installed.
+"""
+import argparse
+import csv
+import http.cookiejar
+import importlib.util
+import json
+import os
+import random
+import re
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+
+from bench import fake_db2
+from bench.fake_zebra import FakeZebra
+from bench.throughput import PRINTER, environment, _percentile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+_SELECTION = re.compile(r'name="selection" value="([^"]*)"')
+_SELECTED = re.compile(r'name="selected" value="([^"]*)"')
+_REVIEW_PAGE = re.compile(r'id="reviewFirstPage">(.*?)</script>', re.DOTALL)
+
+
+class Operator:
+    """One browser session: a cookie jar and the latencies it saw."""
+
+    def __init__(self, base_url, routes, seed, timeout=60):
+        self.base_url = base_url
+        self.routes = routes
+        self.rnd = random.Random(seed)
+        self.timeout = timeout
+        self.opener = urllib.request.build_opener(
+            urllib.request.HTTPCookieProcessor(http.cookiejar.CookieJar())
+        )
+        self.latencies = []
+        self.errors = 0
+        self.sessions = 0
+
+    def _request(self, path, data=None):
+        url = self.base_url + path
+        body = urllib.parse.urlencode(data, doseq=True).encode() if data is not None else None
+        started = time.perf_counter()
+        try:
+            with self.opener.open(url, body, timeout=self.timeout) as response:
+                page = response.read().decode("utf-8", "replace")
+        except (urllib.error.URLError, OSError):
+            self.errors += 1
+            return None
+        self.latencies.append(time.perf_counter() - started)
+        if "Database error" in page:
+            self.errors += 1
+        return page
+
+    def _print_page(self, page, path, fields, limit=None):
+        selection = _SELECTION.search(page or "")
+        if selection is None:
+            return
+        selected = _SELECTED.findall(page)
+        self._request(path, dict(fields, selection=selection.group(1), selected=selected[:limit]))
+
+    def _review_and_print(self, page, route, dept):
+        """Scroll the review table through its pages, then print every row."""
+        selection = _SELECTION.search(page or "")
+        first = _REVIEW_PAGE.search(page or "")
+        if selection is None or first is None:
+            return
+        query = {"dept": dept, "selection": selection.group(1)}
+        cursor = json.loads(first.group(1))["next_cursor"]
+        while cursor:
+            body = self._request(f"/batch/api/{route}/rows?" + urllib.parse.urlencode(dict(query, cursor=cursor)))
+            cursor = json.loads(body)["next_cursor"] if body else None
+        self._request("/batch/print", dict(query, route=route, select_all="1"))
+
+    def session(self):
+        """Run one operator session (redirects after a print are followed)."""
+        route = self.rnd.choice(self.routes)
+        dept = self.rnd.choice(fake_db2.DEPARTMENTS)
+        self._request("/set-printer", {"printer": PRINTER})
+        self._request("/batch/")
+        page = self._request(f"/batch/{route}?dept={dept}")
+        self._review_and_print(page, route, dept)
+        term = f"CUSTOMER {self.rnd.randint(10, 99)}"
+        page = self._request("/adhoc/?" + urllib.parse.urlencode({"q": term}))
+        self._print_page(page, "/adhoc/print", {"term": term}, limit=3)
+        self.sessions += 1
+
+
+def run_level(base_url, zebra, concurrency, duration, routes, think=0.0):
+    """Run ``concurrency`` operators for ``duration`` seconds."""
+    operators = [Operator(base_url, routes, seed=i) for i in range(concurrency)]
+    deadline = time.monotonic() + duration
+
+    def loop(operator):
+        while time.monotonic() < deadline:
+            operator.session()
+            if think:
+                time.sleep(operator.rnd.uniform(0, 2 * think))
+
+    zebra.reset()
+    started = time.perf_counter()
+    threads = [threading.Thread(target=loop, args=(op,), daemon=True) for op in operators]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+    labels = zebra.counters()["labels"]
+
+    latencies = sorted(t for op in operators for t in op.latencies)
+    return {
+        "concurrency": concurrency,
+        "sessions_per_sec": sum(op.sessions for op in operators) / elapsed,
+        "requests_per_sec": len(latencies) / elapsed,
+        "p50_ms": _percentile(latencies, 50) * 1000,
+        "p95_ms": _percentile(latencies, 95) * 1000,
+        "p99_ms": _percentile(latencies, 99) * 1000,
+        "errors": sum(op.errors for op in operators),
+        "labels_per_sec": labels / elapsed,
+    }
+
+
+def _free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def _wait_ready(base_url, server, timeout=30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if server.poll() is not None:
+            raise RuntimeError(f"gunicorn exited with {server.returncode}")
+        try:
+            with urllib.request.urlopen(base_url + "/", timeout=2):
+                return
+        except (urllib.error.URLError, OSError):
+            time.sleep(0.2)
+    raise RuntimeError("gunicorn did not start")
+
+
+def parse_model(spec):
+    """'gthread:2:4' -> ('gthread', 2, 4)."""
+    parts = spec.split(":")
+    worker_class = parts[0]
+    workers = int(parts[1]) if len(parts) > 1 else 2
+    threads = int(parts[2]) if len(parts) > 2 else 1
+    return worker_class, workers, threads
+
+
+def run_model(model, longmod, zebra, args, routes):
+    """Start gunicorn with ``model``, run every concurrency level, stop it."""
+    worker_class, workers, threads = model
+    workdir = tempfile.mkdtemp(prefix="labelprinter-load-")
+    port = _free_port()
+    base_url = f"http://127.0.0.1:{port}"
+    env = dict(os.environ, **environment(workdir, zebra.port, cold=args.cold))
+    # Let the leader worker build the search index and replica as in production
+    env.pop("SEARCH_INDEX_REFRESH")
+    env.pop("REPLICA_SYNC_INTERVAL")
+    env.update(BENCH_LONGMOD=longmod, BENCH_DB_LATENCY=str(args.db_latency))
+    command = [
+        sys.executable, "-m", "gunicorn", "bench.fake_app:app",
+        "-b", f"127.0.0.1:{port}", "-w", str(workers), "-k", worker_class,
+        "--timeout", "120",
+    ]
+    if worker_class == "gthread":
+        command += ["--threads", str(threads)]
+    with open(os.path.join(workdir, "gunicorn.log"), "w") as log:
+        server = subprocess.Popen(command, cwd=ROOT, env=env, stdout=log, stderr=subprocess.STDOUT)
+    try:
+        _wait_ready(base_url, server)
+        Operator(base_url, routes, seed=-1).session()  # warm-up
+        return [
+            run_level(base_url, zebra, level, args.duration, routes, args.think)
+            for level in args.concurrency
+        ]
+    finally:
+        server.terminate()
+        server.wait(30)
+        if not args.keep:
+            shutil.rmtree(workdir, ignore_errors=True)
+        else:
+            print(f"{worker_class}: state and gunicorn.log kept in {workdir}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--models", default="sync:2,gthread:2:4,gevent:2",
+                        help="comma-separated worker_class:workers[:threads]")
+    parser.add_argument("--concurrency", default="1,2,4,8,10",
+                        help="comma-separated operator counts")
+    parser.add_argument("--duration", type=float, default=20, help="seconds per level")
+    parser.add_argument("--think", type=float, default=0.0, help="mean seconds between sessions")
+    parser.add_argument("--routes", type=int, default=20)
+    parser.add_argument("--stops", type=int, default=40)
+    parser.add_argument("--db-latency", type=float, default=0.02, help="seconds added to each DB2 statement")
+    parser.add_argument("--label-delay", type=float, default=0.005, help="seconds the printer takes per label")
+    parser.add_argument("--cold", action="store_true", help="disable the query cache")
+    parser.add_argument("--csv", help="also write the results to this CSV file")
+    parser.add_argument("--keep", action="store_true", help="keep each model's state directory")
+    args = parser.parse_args()
+    args.concurrency = [int(level) for level in args.concurrency.split(",")]
+
+    models = []
+    for spec in args.models.split(","):
+        model = parse_model(spec)
+        if model[0] == "gevent" and importlib.util.find_spec("gevent") is None:
+            print(f"skipping {spec}: gevent is not installed")
+            continue
+        models.append((spec, model))
+
+    datadir = tempfile.mkdtemp(prefix="labelprinter-load-")
+    longmod = os.path.join(datadir, "longmod.db")
+    counts = fake_db2.generate(longmod, routes=args.routes, stops=args.stops)
+    routes = [str(route) for route in range(1, args.routes + 1)]
+    print(f"data: {counts}")
+
+    rows = []
+    try:
+        with FakeZebra(label_delay=args.label_delay) as zebra:
+            for spec, model in models:
+                print(f"\n{spec}")
+                print(f"{'ops':>4}{'sess/s':>9}{'req/s':>8}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}"
+                      f"{'errors':>8}{'labels/s':>10}")
+                for r in run_model(model, longmod, zebra, args, routes):
+                    print(f"{r['concurrency']:>4}{r['sessions_per_sec']:>9.2f}{r['requests_per_sec']:>8.1f}"
+                          f"{r['p50_ms']:>9.1f}{r['p95_ms']:>9.1f}{r['p99_ms']:>9.1f}{r['errors']:>8}"
+                          f"{r['labels_per_sec']:>10.0f}")
+                    rows.append(dict(model=spec, **r))
+    finally:
+        shutil.rmtree(datadir, ignore_errors=True)
+
+    if args.csv and rows:
+        with open(args.csv, "w", newline="") as f:
+            writer = csv.DictWriter(f, fieldnames=list(rows[0]))
+            writer.writeheader()
+            writer.writerows(rows)
+
+
+if __name__ == "__main__":
+    main()
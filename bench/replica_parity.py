@@ -0,0 +1,78 @@
+"""Parity check: rows read from the local replica vs. the DB2 queries.
+
+Generates a synthetic longmod database (bench.fake_db2) whose CHAR
+columns sort in EBCDIC and whose ORDER BY puts NULLs last, as on the
+iSeries, syncs the replica from it and compares, for every route and
+route/department, replica.customers_by_route_dept() with
+db2._query_customers_by_route_dept() row for row and in order; also
+the route list and the pick LOCATION order, with some LOCATIONs NULL. It
+runs once with STOP as an INTEGER column and once as CHAR(4) with blank
+and NULL stops, and exits non-zero on any difference.
+
+    python -m bench.replica_parity [--routes 20] [--stops 40]
+"""
+import argparse
+import atexit
+import os
+import shutil
+import tempfile
+
+from bench import fake_db2
+from bench.throughput import environment
+
+
+def compare(routes):
+    """Compare the replica with DB2; returns a list of mismatch descriptions."""
+    from app.services import db2, replica
+
+    mismatches = []
+    combos = db2._query_route_departments()
+    if replica.route_departments() != combos:
+        mismatches.append("route_departments")
+    for route in routes:
+        for dept in [None] + [c["PICK_AREA"] for c in combos if c["ROUTE"] == route]:
+            expected = db2._query_customers_by_route_dept(route, dept)
+            if replica.customers_by_route_dept(route, dept) != expected:
+                mismatches.append(f"customers_by_route_dept({route!r}, {dept!r})")
+    for customer_no in replica.REPLICA_PICK_CUSTOMERS:
+        locations = [row["LOCATION"] for row in replica.picks(customer_no)]
+        if locations != [row["LOCATION"] for row in db2.fetch_picks(customer_no)]:
+            mismatches.append(f"picks({customer_no!r})")
+    return mismatches
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--routes", type=int, default=20)
+    parser.add_argument("--stops", type=int, default=40)
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="labelprinter-parity-")
+    # Registered first so it runs after the app's own exit handlers
+    atexit.register(shutil.rmtree, workdir, True)
+    # Settings are read at import time, so the environment comes first
+    os.environ.update(environment(workdir, 0))
+    from app.services import replica
+
+    failed = False
+    routes = [str(route) for route in range(1, args.routes + 1)]
+    for label, char_stops in (("INTEGER", False), ("CHAR", True)):
+        longmod = os.path.join(workdir, f"longmod-{label.lower()}.db")
+        counts = fake_db2.generate(
+            longmod, routes=args.routes, stops=args.stops, oneoff=0,
+            ebcdic=True, char_stops=char_stops, null_locations=True,
+        )
+        fake_db2.install(longmod)
+        replica.sync()
+        mismatches = compare(routes)
+        failed = failed or bool(mismatches)
+        print(f"STOP {label:<8}{counts['vbatch_labels']:>7} rows  "
+              f"{'ok' if not mismatches else f'{len(mismatches)} mismatches'}")
+        for mismatch in mismatches[:10]:
+            print(f"  {mismatch}")
+    if failed:
+        raise SystemExit("replica order differs from DB2")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,149 @@
+"""Micro-benchmark: compact Rows vs. the old stripped-dict rows.
+
+Fetches every vbatch_labels row of a synthetic longmod database
+(bench.fake_db2) the way get_all_batch_labels() does, once with the old
+fetchall() + strip-into-a-dict conversion (kept here verbatim as the
+reference) and once with app.services.rows.fetch(). Each variant runs in
+its own process so peak RSS is not shared; the output also reports
+traced Python memory, fetch and read time per 10k rows and the pickled size the cache
+stores. The two results are checked to be equal.
+
+    python -m bench.rows [--routes 100] [--stops 100] [--repeat 5]
+"""
+import argparse
+import hashlib
+import json
+import os
+import pickle
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+from bench import fake_db2
+
+_QUERY = (
+    "SELECT INVOICE_NO, CUSTOMER_NO, CUSTOMER, ADDRESS, CITY, STATE, "
+    "ZIP, PO_NUM, ROUTE, STOP, PICK_AREA, LABELS "
+    "FROM longmod.vbatch_labels "
+    "ORDER BY ROUTE, STOP"
+)
+
+
+# --- Reference implementation (pre-Row db2.py) ---
+
+def _strip_row(columns, row):
+    """Strip trailing whitespace from string values in a row."""
+    return {
+        col: val.strip() if isinstance(val, str) else val
+        for col, val in zip(columns, row)
+    }
+
+
+def legacy_fetch(cursor):
+    columns = [desc[0] for desc in cursor.description]
+    return [_strip_row(columns, row) for row in cursor.fetchall()]
+
+
+def compact_fetch(cursor):
+    from app.services import rows
+    return rows.fetch(cursor)
+
+
+VARIANTS = {"dict": legacy_fetch, "row": compact_fetch}
+
+
+def _fetch(conn, fn):
+    cursor = conn.cursor()
+    cursor.execute(_QUERY)
+    return fn(cursor)
+
+
+def _maxrss_kb():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def measure(longmod, variant, repeat):
+    """Run one variant in this process; returns its measurements."""
+    fn = VARIANTS[variant]
+    conn = fake_db2.connect(longmod)
+    # Warm the SQLite page cache and imports without building the result
+    conn.execute("SELECT COUNT(*) FROM longmod.vbatch_labels WHERE CUSTOMER <> ''").fetchall()
+    fn(conn.execute(_QUERY + " LIMIT 10"))
+
+    baseline = _maxrss_kb()
+    result = _fetch(conn, fn)
+    peak_rss_kb = _maxrss_kb() - baseline
+    count = len(result)
+    payload = pickle.dumps(result, protocol=pickle.HIGHEST_PROTOCOL)
+
+    started = time.perf_counter()
+    for _ in range(repeat):
+        _fetch(conn, fn)
+    fetch_seconds = (time.perf_counter() - started) / repeat
+
+    # Reading every field is what the templates and ZPL renderer do
+    started = time.perf_counter()
+    for _ in range(repeat):
+        for row in result:
+            for key in row:
+                row[key]
+    read_seconds = (time.perf_counter() - started) / repeat
+    del result
+
+    tracemalloc.start()
+    result = _fetch(conn, fn)
+    retained, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return {
+        "rows": count,
+        "fetch_ms_per_10k": fetch_seconds / count * 10000 * 1000,
+        "read_ms_per_10k": read_seconds / count * 10000 * 1000,
+        "peak_rss_kb": peak_rss_kb,
+        "traced_peak_kb": peak / 1024,
+        "retained_kb": retained / 1024,
+        "pickled_kb": len(payload) / 1024,
+        "checksum": hashlib.sha1(pickle.dumps([sorted(dict(row).items()) for row in result])).hexdigest(),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--routes", type=int, default=100)
+    parser.add_argument("--stops", type=int, default=100)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--variant", choices=VARIANTS, help=argparse.SUPPRESS)
+    parser.add_argument("--longmod", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.variant:
+        print(json.dumps(measure(args.longmod, args.variant, args.repeat)))
+        return
+
+    with tempfile.TemporaryDirectory(prefix="labelprinter-rows-") as workdir:
+        longmod = os.path.join(workdir, "longmod.db")
+        fake_db2.generate(longmod, routes=args.routes, stops=args.stops, oneoff=0, picks_per_invoice=0)
+        results = {}
+        for variant in VARIANTS:
+            output = subprocess.run(
+                [sys.executable, "-m", "bench.rows", "--variant", variant,
+                 "--longmod", longmod, "--repeat", str(args.repeat)],
+                check=True, capture_output=True, text=True,
+            ).stdout
+            results[variant] = json.loads(output)
+
+    print(f"rows: {results['dict']['rows']}")
+    print(f"{'variant':<9}{'fetch ms/10k':>14}{'read ms/10k':>13}{'peak RSS KB':>13}{'traced peak KB':>16}"
+          f"{'retained KB':>13}{'pickled KB':>12}")
+    for variant, r in results.items():
+        print(f"{variant:<9}{r['fetch_ms_per_10k']:>14.1f}{r['read_ms_per_10k']:>13.1f}{r['peak_rss_kb']:>13}{r['traced_peak_kb']:>16.0f}"
+              f"{r['retained_kb']:>13.0f}{r['pickled_kb']:>12.0f}")
+    if results["dict"]["checksum"] != results["row"]["checksum"]:
+        print("WARNING: the two variants returned different rows")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,235 @@
+"""End-to-end benchmark: batch, ad hoc and pick list printing.
+
+Runs the real app (routes, DB2 queries, cache, spooler and sender) in
+this process against a synthetic longmod database (bench.fake_db2) and a
+counting Zebra listener on a local port (bench.fake_zebra). For each
+path it reports request latency percentiles, labels/sec from the first
+request until the printer has received every label, and bytes of ZPL
+per label. Label counts at the printer are checked against the jobs.
+
+    python -m bench.throughput [--routes 20] [--stops 40] [--iterations 20]
+                               [--db-latency 0.005] [--label-delay 0] [--cold] [--no-replica]
+
+All state (printers.json, spool, cache, ...) goes to a temporary
+directory, so it is safe to run next to a live install.
+"""
+import argparse
+import atexit
+import json
+import os
+import random
+import re
+import shutil
+import tempfile
+import time
+
+from bench import fake_db2
+from bench.fake_zebra import FakeZebra
+
+PRINTER = "Bench"
+
+# Files the app would otherwise create in the repo root
+_STATE_FILES = {
+    "PRINTERS_FILE": "printers.json",
+    "CACHE_FILE": "cache.db",
+    "SPOOL_FILE": "spool.db",
+    "PRINTER_STATUS_FILE": "printer_status.db",
+    "SELECTION_FILE": "selections.db",
+    "SEARCH_INDEX_FILE": "search.db",
+    "REPLICA_FILE": "replica.db",
+    "METRICS_FILE": "metrics.db",
+    "PROFILE_FILE": "profiles.db",
+}
+
+_SELECTION = re.compile(r'name="selection" value="([^"]*)"')
+_SELECTED = re.compile(r'name="selected" value="([^"]*)"')
+_REVIEW_PAGE = re.compile(r'id="reviewFirstPage">(.*?)</script>', re.DOTALL)
+
+
+def environment(workdir, printer_port, cold=False):
+    """Settings that keep the app's state in ``workdir`` and print to the fake Zebra.
+
+    Also writes a printers.json with the one benchmark printer. Returns a
+    dict to merge into os.environ before the app is imported.
+    """
+    env = {name: os.path.join(workdir, filename) for name, filename in _STATE_FILES.items()}
+    env["PRINTER_PORT"] = str(printer_port)
+    # Built once up front (see main()) rather than by background threads
+    env["SEARCH_INDEX_REFRESH"] = env["REPLICA_SYNC_INTERVAL"] = "0"
+    if cold:
+        env["CACHE_ROUTES_TTL"] = env["CACHE_CUSTOMERS_TTL"] = "0"
+    with open(env["PRINTERS_FILE"], "w") as f:
+        json.dump([{"name": PRINTER, "ip": "127.0.0.1"}], f)
+    return env
+
+
+def _percentile(values, pct):
+    """Nearest-rank percentile of a sorted list."""
+    if not values:
+        return 0.0
+    return values[min(len(values) - 1, max(0, round(pct / 100 * len(values)) - 1))]
+
+
+def _timed(latencies, call, *args, **kwargs):
+    started = time.perf_counter()
+    response = call(*args, **kwargs)
+    latencies.append(time.perf_counter() - started)
+    if response.status_code >= 400:
+        raise RuntimeError(f"{args[0]} returned {response.status_code}")
+    if b"Database error" in response.data:
+        raise RuntimeError(f"{args[0]} showed a database error")
+    return response
+
+
+def _batch(client, latencies, rnd, routes):
+    route = rnd.choice(routes)
+    page = _timed(latencies, client.get, f"/batch/{route}").get_data(as_text=True)
+    selection = _SELECTION.search(page).group(1)
+    # Scroll the review table to the end, then print everything
+    cursor = json.loads(_REVIEW_PAGE.search(page).group(1))["next_cursor"]
+    while cursor:
+        cursor = _timed(latencies, client.get, f"/batch/api/{route}/rows", query_string={
+            "dept": "", "selection": selection, "cursor": cursor,
+        }).get_json()["next_cursor"]
+    _timed(latencies, client.post, "/batch/print", data={
+        "route": route,
+        "dept": "",
+        "selection": selection,
+        "select_all": "1",
+    })
+
+
+def _adhoc(client, latencies, rnd, routes):
+    term = f"CUSTOMER {rnd.randint(10, 99)}"
+    page = _timed(latencies, client.get, "/adhoc/", query_string={"q": term}).get_data(as_text=True)
+    selection = _SELECTION.search(page)
+    if selection is None:
+        return  # nothing matched
+    _timed(latencies, client.post, "/adhoc/print", data={
+        "term": term,
+        "selection": selection.group(1),
+        "selected": _SELECTED.findall(page)[:10],
+    })
+
+
+def _pick_list(client, latencies, rnd, routes):
+    _timed(latencies, client.post, "/batch/print-pick-list", data={"route": rnd.choice(routes), "dept": ""})
+
+
+PATHS = [("batch", _batch), ("adhoc", _adhoc), ("pick list", _pick_list)]
+
+
+def _last_job_id(spooler):
+    jobs = spooler.recent_jobs(1)
+    return jobs[0]["id"] if jobs else 0
+
+
+def run_path(client, zebra, fn, iterations, routes, seed=1, timeout=300):
+    """Run ``iterations`` operator round trips and wait for their jobs.
+
+    Returns:
+        Dict with requests, latency percentiles (ms), labels, labels/sec,
+        bytes per label and any label count mismatch.
+    """
+    from app.services import spooler
+
+    rnd = random.Random(seed)
+    first_job = _last_job_id(spooler)
+    zebra.reset()
+    latencies = []
+    started = time.perf_counter()
+    for _ in range(iterations):
+        fn(client, latencies, rnd, routes)
+    job_ids = list(range(first_job + 1, _last_job_id(spooler) + 1))
+    jobs = spooler.wait_for(job_ids, timeout)
+    expected = sum(job["labels"] for job in jobs.values() if job)
+    zebra.wait(expected, timeout)
+    elapsed = time.perf_counter() - started
+
+    counters = zebra.counters()
+    failed = [job_id for job_id, job in jobs.items() if not job or job["status"] != spooler.DONE]
+    latencies.sort()
+    return {
+        "requests": len(latencies),
+        "jobs": len(job_ids),
+        "failed_jobs": failed,
+        "p50_ms": _percentile(latencies, 50) * 1000,
+        "p90_ms": _percentile(latencies, 90) * 1000,
+        "p99_ms": _percentile(latencies, 99) * 1000,
+        "max_ms": (latencies[-1] if latencies else 0) * 1000,
+        "labels": counters["labels"],
+        "expected_labels": expected,
+        "labels_per_sec": counters["labels"] / elapsed if elapsed else 0.0,
+        "bytes_per_label": counters["label_bytes"] / counters["labels"] if counters["labels"] else 0.0,
+        "seconds": elapsed,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--routes", type=int, default=20)
+    parser.add_argument("--stops", type=int, default=40)
+    parser.add_argument("--oneoff", type=int, default=500)
+    parser.add_argument("--picks-per-invoice", type=int, default=25)
+    parser.add_argument("--iterations", type=int, default=20, help="operator round trips per path")
+    parser.add_argument("--db-latency", type=float, default=0.005, help="seconds added to each DB2 statement")
+    parser.add_argument("--label-delay", type=float, default=0.0, help="seconds the printer takes per label")
+    parser.add_argument("--cold", action="store_true", help="disable the query cache")
+    parser.add_argument("--no-replica", action="store_true", help="read DB2 instead of the local replica")
+    parser.add_argument("--json", action="store_true", help="print the results as JSON")
+    parser.add_argument("--keep", action="store_true", help="keep the temporary state directory")
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="labelprinter-bench-")
+    if not args.keep:
+        # Registered first so it runs after the app's own exit handlers
+        atexit.register(shutil.rmtree, workdir, True)
+    zebra = FakeZebra(label_delay=args.label_delay).start()
+    try:
+        # Settings are read at import time, so the environment comes first
+        os.environ.update(environment(workdir, zebra.port, cold=args.cold))
+
+        longmod = os.path.join(workdir, "longmod.db")
+        counts = fake_db2.generate(
+            longmod, routes=args.routes, stops=args.stops, oneoff=args.oneoff,
+            picks_per_invoice=args.picks_per_invoice,
+        )
+        fake_db2.install(longmod, latency=args.db_latency)
+
+        from app import create_app
+        from app.services import replica, search_index
+
+        app = create_app()
+        client = app.test_client()
+        with client.session_transaction() as session:
+            session["printer"] = PRINTER
+        search_index.refresh()
+        if not args.no_replica:
+            replica.sync()
+
+        routes = [str(route) for route in range(1, args.routes + 1)]
+        results = {name: run_path(client, zebra, fn, args.iterations, routes) for name, fn in PATHS}
+    finally:
+        zebra.stop()
+
+    if args.keep:
+        print(f"state kept in {workdir}")
+    if args.json:
+        print(json.dumps({"data": counts, "paths": results}, indent=2))
+        return
+
+    print(f"data: {counts}")
+    print(f"{'path':<11}{'reqs':>6}{'p50 ms':>9}{'p90 ms':>9}{'p99 ms':>9}{'max ms':>9}"
+          f"{'labels':>8}{'labels/s':>10}{'B/label':>9}")
+    for name, r in results.items():
+        print(f"{name:<11}{r['requests']:>6}{r['p50_ms']:>9.1f}{r['p90_ms']:>9.1f}{r['p99_ms']:>9.1f}"
+              f"{r['max_ms']:>9.1f}{r['labels']:>8}{r['labels_per_sec']:>10.0f}{r['bytes_per_label']:>9.0f}")
+    for name, r in results.items():
+        if r["failed_jobs"]:
+            print(f"WARNING: {name}: jobs {r['failed_jobs']} did not finish")
+        if r["labels"] != r["expected_labels"]:
+            print(f"WARNING: {name}: printer counted {r['labels']} labels, jobs had {r['expected_labels']}")
+
+
+if __name__ == "__main__":
+    main()
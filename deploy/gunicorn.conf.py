@@ -0,0 +1,23 @@
+"""gunicorn settings for the Pi (used by labelprinter.service).
+
+Threaded workers: a request waiting on DB2 or on print jobs (bulk print
+with ``wait``) holds one thread instead of a whole process. DB2 calls are
+further limited to DB2_THREADS per worker (see app/services/offload.py),
+and printer I/O happens on the spooler's own threads.
+
+Every setting can be overridden from .env, e.g. GUNICORN_WORKER_CLASS=gevent
+(pip install gevent) or GUNICORN_WORKER_CLASS=sync to go back to the old
+process-per-request model.
+"""
+import os
+
+bind = os.environ.get("GUNICORN_BIND", "0.0.0.0:8080")
+workers = int(os.environ.get("GUNICORN_WORKERS", "2"))
+worker_class = os.environ.get("GUNICORN_WORKER_CLASS", "gthread")
+threads = int(os.environ.get("GUNICORN_THREADS", "8"))  # gthread only
+worker_connections = int(os.environ.get("GUNICORN_WORKER_CONNECTIONS", "100"))  # gevent only
+
+# Bulk print may wait up to 120s for its jobs
+timeout = int(os.environ.get("GUNICORN_TIMEOUT", "150"))
+graceful_timeout = 30
+keepalive = 5
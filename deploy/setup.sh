@@ -48,11 +48,14 @@ if [ ! -f "$APP_DIR/printers.json" ]; then
     echo "Created empty printers.json - add printers via admin panel."
 fi
 
-# Install systemd service
+# Install systemd service and the cache warm-up timer
 sudo cp "$APP_DIR/deploy/labelprinter.service" /etc/systemd/system/
+sudo cp "$APP_DIR/deploy/labelprinter-warmup.service" /etc/systemd/system/
+sudo cp "$APP_DIR/deploy/labelprinter-warmup.timer" /etc/systemd/system/
 sudo systemctl daemon-reload
 sudo systemctl enable labelprinter
 sudo systemctl restart labelprinter
+sudo systemctl enable --now labelprinter-warmup.timer
 
 echo ""
 echo "=== Done! ==="